@@ -2,8 +2,18 @@
 视图模块
 路由映射：定义URL与处理函数的关联
 """
-from flask import Blueprint, jsonify, send_from_directory, request , redirect
-from app.api.controllers import LogController, WebhookController, StreamController, SystemInfoController
+from flask import Blueprint, jsonify, send_from_directory, request , redirect, Response, current_app
+from app.api.controllers import LogController, WebhookController, SystemInfoController
+from app.streaming.registry import StreamRegistry
+from dataclasses import replace
+from app.streaming.profiles import resolve_profile
+from app.streaming.roi import resolve_crop
+from app.streaming.masks import get_mask_engine
+from app.streaming.snapshot import SnapshotService
+from app.streaming.dvr import iter_replay, export_avi
+from app.streaming.window_finder import get_window_finder
+from app.streaming.backends import Win32CaptureBackend, create_capture_backend
+from app.streaming.mosaic import create_mosaic_backend, mosaic_name, parse_mosaic
 import os
 
 # 创建蓝图
@@ -12,7 +22,75 @@ api_bp = Blueprint('api', __name__)
 # 全局控制器实例（将在应用启动时初始化）
 log_controller = None
 webhook_controller = None
-stream_controller = None
+# 推流控制器注册表，按目标应用管理控制器，控制器在首次请求时动态创建，回放缓冲区保留时间在注册蓝图时设置
+stream_registry = StreamRegistry()
+# 单帧快照服务，优先复用进行中推流的最新帧，注册蓝图时按配置重新创建
+snapshot_service = SnapshotService(lambda target_app: stream_registry.get(target_app))
+
+
+@api_bp.record_once
+def _init_stream_services(state):
+    """
+    注册蓝图时按应用配置创建单帧快照服务并设置回放缓冲区保留时间，配置只在此时读取一次
+    """
+    global snapshot_service
+    stream_registry.dvr_grace = state.app.config.get('STREAM_DVR_GRACE_SECONDS', 60)
+    snapshot_service = SnapshotService(
+        lambda target_app: stream_registry.get(target_app),
+        ttl=state.app.config.get('STREAM_SNAPSHOT_TTL', 1.0)
+    )
+
+
+def _create_capture_backend():
+    """
+    根据配置创建推流控制器使用的捕获后端，win32 时返回None使用默认后端
+    """
+    return create_capture_backend(
+        current_app.config.get('STREAM_CAPTURE_BACKEND', 'win32'),
+        current_app.config.get('STREAM_REPLAY_SOURCE', ''),
+        current_app.config.get('STREAM_REPLAY_SIZE', '1920x1080'),
+        current_app.config.get('STREAM_REPLAY_MOTION', 4)
+    )
+
+
+def _normalize_target_app(target_app: str) -> str:
+    """
+    逗号分隔的多个应用程序为拼接推流，返回其规范名称（可选查询参数layout指定布局），单个应用程序原样返回
+
+    Raises:
+        ValueError: 拼接推流的参数无效时抛出
+    """
+    if ',' not in target_app:
+        return target_app
+    return mosaic_name(*parse_mosaic(target_app, request.args.get('layout')))
+
+
+def _create_stream_backend(target_app: str):
+    """
+    拼接推流时为每个来源创建独立的捕获后端并组合为拼接捕获后端，否则按配置创建捕获后端
+    """
+    if ',' not in target_app:
+        return _create_capture_backend()
+    return create_mosaic_backend(
+        target_app,
+        lambda: _create_capture_backend() or Win32CaptureBackend(),
+        current_app.config.get('STREAM_MOSAIC_TILE_SIZE', '960x540'),
+        get_mask_engine(current_app.config.get('STREAM_PRIVACY_MASKS', ''))
+    )
+
+
+def _resolve_crop():
+    """
+    根据查询参数crop或roi解析裁剪区域，未指定时返回None
+
+    Raises:
+        ValueError: 参数无效时抛出
+    """
+    return resolve_crop(
+        request.args.get('crop'),
+        request.args.get('roi'),
+        current_app.config.get('STREAM_ROI_PRESETS', '')
+    )
 
 
 def init_controllers(log_dir: str):
@@ -22,10 +100,9 @@ def init_controllers(log_dir: str):
     Args:
         log_dir: 日志目录路径
     """
-    global log_controller, webhook_controller, stream_controller
+    global log_controller, webhook_controller
     log_controller = LogController(log_dir)
     webhook_controller = WebhookController(log_dir)
-    # stream_controller将在首次请求时动态创建
 
 
 
@@ -87,10 +164,49 @@ def serve_static(filename):
     return send_from_directory('static', filename)
 
 
+def _not_modified_response(etag: str):
+    """
+    如果请求携带的If-None-Match与当前数据版本一致，返回304响应
+
+    Args:
+        etag: 当前数据版本号
+
+    Returns:
+        Response | None: 304响应，数据已变化时返回None
+    """
+    if not isinstance(etag, str) or not etag:
+        return None
+    if etag not in request.if_none_match:
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _json_with_etag(result: dict, etag: str):
+    """
+    构建带有ETag的JSON响应，浏览器在下次请求时会携带If-None-Match进行校验
+
+    Args:
+        result: 响应数据
+        etag: 当前数据版本号
+
+    Returns:
+        Response: JSON响应
+    """
+    response = jsonify(result)
+    if isinstance(etag, str) and etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @api_bp.route('/api/LogList', methods=['GET'])
 def get_log_list_api():
     """
     提供日志文件列表的API接口。
+    支持ETag条件请求，数据未变化时返回304 Not Modified。
 
     Returns:
         Response: 包含日志文件列表的JSON响应，例如：{'list': ['20250501']}
@@ -98,16 +214,25 @@ def get_log_list_api():
     if not log_controller:
         return jsonify({'error': '控制器未初始化'}), 500
     
+    etag = log_controller.get_data_version()
+    not_modified = _not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+
     result = log_controller.get_log_list()
     if not isinstance(result, dict):
         return jsonify({'error': '控制器返回数据格式错误'}), 500
-    return jsonify(result)
+    return _json_with_etag(result, etag)
 
 
 @api_bp.route('/api/LogData', methods=['GET'])
 def analyse_log():
     """
     提供日志分析的API接口，默认返回所有的数据，分析交给前端进行。
+    支持ETag条件请求，数据未变化时返回304 Not Modified，不会触发日志解析与序列化。
+    支持增量同步：通过查询参数?since=<cursor>只返回游标之后新增的物品和变化的持续时间，
+    响应中附带新的cursor；since为空或游标失效时返回完整数据，并将full置为True。
+    支持紧凑格式：通过查询参数?format=compact返回字典编码的列式物品数据。
 
     Returns:
         Response: 包含日志分析结果的JSON响应，例如：{
@@ -118,10 +243,36 @@ def analyse_log():
     if not log_controller:
         return jsonify({'error': '控制器未初始化'}), 500
     
-    result = log_controller.get_log_data()
+    payload_format = request.args.get('format', 'full').strip().lower()
+    if payload_format not in ('full', 'compact'):
+        return jsonify({
+            'error': '参数格式错误',
+            'message': 'format参数只支持full或compact',
+            'provided': payload_format
+        }), 400
+
+    etag = log_controller.get_data_version()
+    if isinstance(etag, str) and etag and payload_format != 'full':
+        etag = f'{etag}-{payload_format}'
+    not_modified = _not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+
+    if 'since' not in request.args and payload_format == 'full':
+        # 默认格式直接使用控制器缓存拼接好的JSON，避免重复序列化历史数据
+        response = Response(log_controller.get_log_data_json(), mimetype='application/json')
+        if isinstance(etag, str) and etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    if 'since' in request.args:
+        result = log_controller.get_log_data_since(request.args.get('since', ''), payload_format)
+    else:
+        result = log_controller.get_log_data(payload_format)
     if not isinstance(result, dict):
         return jsonify({'error': '控制器返回数据格式错误'}), 500
-    return jsonify(result)
+    return _json_with_etag(result, etag)
 
 
 @api_bp.route('/webhook', methods=['POST'])
@@ -167,13 +318,20 @@ def webhook():
 def video_stream():
     """
     视频流API接口，提供实时屏幕推流
-    支持通过查询参数?app=xxx动态指定目标应用程序
+    支持通过查询参数?app=xxx动态指定目标应用程序，不同目标应用的推流可以同时进行
+    app为逗号分隔的多个应用程序时，按查询参数layout（grid/row/column）拼接为一路推流，只编码一次，
+    应用程序名称后可以用@指定该来源的捕获帧率，如?app=yuanshen.exe,bettergi.exe@5&layout=grid
+    可选查询参数?fps=xx指定目标帧率，不超过服务器配置的最大帧率
+    可选查询参数preset（original/high/medium/low）、max_width、max_height、quality指定画质，
+    显式参数覆盖预设中的对应字段
+    可选查询参数codec=jpeg/webp指定编码格式，未指定quality时使用预设在该编码格式下的质量
+    WebP体积明显小于JPEG但编码耗时更高，适合配合较低分辨率的预设用于远程观看
+    可选查询参数crop=x,y,宽,高（不大于1时为相对窗口的比例）或roi=预设名称只推流窗口的一部分
+    可选查询参数adaptive=0/1关闭或开启自适应画质，默认使用服务器配置
     
     Returns:
         Response: MJPEG视频流响应或JSON错误响应
     """
-    global stream_controller
-    
     # 获取查询参数中的app参数
     target_app = request.args.get('app', '').strip()
     
@@ -186,7 +344,15 @@ def video_stream():
         }), 400
     
     # 验证应用程序名称格式
-    if not target_app.endswith('.exe'):
+    try:
+        target_app = _normalize_target_app(target_app)
+    except ValueError as e:
+        return jsonify({
+            'error': '参数格式错误',
+            'message': str(e),
+            'provided': target_app
+        }), 400
+    if ',' not in target_app and not target_app.endswith('.exe'):
         return jsonify({
             'error': '参数格式错误',
             'message': '应用程序名称必须以.exe结尾',
@@ -194,38 +360,228 @@ def video_stream():
             'example': 'yuanshen.exe'
         }), 400
     
+    max_fps = current_app.config.get('STREAM_MAX_FPS', 60)
+    fps = request.args.get('fps', '').strip()
     try:
-        # 检查是否需要重新初始化stream_controller
-        if not stream_controller or stream_controller.target_app != target_app:
-            # 如果当前有推流在进行，先停止
-            if stream_controller and stream_controller.is_streaming:
-                stream_controller.stop_stream()
-            
-            # 重新初始化推流控制器
-            stream_controller = StreamController(target_app)
-        
-        return stream_controller.start_stream()
-        
+        fps = float(fps) if fps else current_app.config.get('STREAM_DEFAULT_FPS', 30)
+        if not fps > 0:
+            raise ValueError(fps)
+    except ValueError:
+        return jsonify({
+            'error': '参数格式错误',
+            'message': 'fps必须为正数',
+            'provided': request.args.get('fps')
+        }), 400
+    fps = min(fps, max_fps)
+
+    try:
+        profile = resolve_profile(
+            request.args.get('preset'),
+            request.args.get('max_width'),
+            request.args.get('max_height'),
+            request.args.get('quality'),
+            request.args.get('codec')
+        )
+        crop = _resolve_crop()
+        if crop:
+            profile = replace(profile, crop=crop)
+    except ValueError as e:
+        return jsonify({
+            'error': '参数格式错误',
+            'message': str(e)
+        }), 400
+
+    adaptive = request.args.get('adaptive', '').strip().lower()
+    if adaptive:
+        adaptive = adaptive not in ('0', 'false', 'no', 'off')
+    else:
+        adaptive = current_app.config.get('STREAM_ADAPTIVE_QUALITY', True)
+
+    controller = stream_registry.acquire(
+        target_app,
+        change_threshold=current_app.config.get('STREAM_CHANGE_THRESHOLD', 1.0),
+        keepalive_interval=current_app.config.get('STREAM_KEEPALIVE_INTERVAL', 1.0),
+        mask_engine=get_mask_engine(current_app.config.get('STREAM_PRIVACY_MASKS', '')),
+        encode_workers=current_app.config.get('STREAM_ENCODE_WORKERS', 2),
+        dvr_seconds=current_app.config.get('STREAM_DVR_SECONDS', 30),
+        dvr_fps=current_app.config.get('STREAM_DVR_FPS', 5),
+        dvr_max_bytes=current_app.config.get('STREAM_DVR_MAX_MB', 64) * 1024 * 1024,
+        backend_factory=lambda: _create_stream_backend(target_app)
+    )
+    try:
+        response = controller.start_stream(fps, profile, adaptive)
+        # 连接结束时释放控制器引用
+        response.call_on_close(lambda: stream_registry.release(target_app, controller))
+        return response
+
     except Exception as e:
+        stream_registry.release(target_app, controller)
         return jsonify({
             'error': f'启动视频流时发生错误: {str(e)}'
         }), 500
 
 
+@api_bp.route('/api/stream/snapshot', methods=['GET'])
+def stream_snapshot():
+    """
+    单帧快照API接口，返回目标应用当前画面的JPEG或WebP图片
+    目标应用有进行中的推流时直接返回最近编码的一帧，否则一次性捕获，短时间内的重复请求共用同一次捕获
+    可选查询参数preset、max_width、max_height、quality、codec指定画质与编码格式，crop、roi指定裁剪区域，
+    app与layout指定拼接的多个应用程序，与/api/stream相同
+    
+    Returns:
+        Response: 图片响应或JSON错误响应
+    """
+    target_app = request.args.get('app', '').strip()
+
+    if not target_app:
+        return jsonify({
+            'error': '缺少必需的参数',
+            'message': '请通过查询参数?app=应用程序名称指定目标应用程序',
+            'example': '/api/stream/snapshot?app=yuanshen.exe'
+        }), 400
+
+    try:
+        target_app = _normalize_target_app(target_app)
+    except ValueError as e:
+        return jsonify({
+            'error': '参数格式错误',
+            'message': str(e),
+            'provided': target_app
+        }), 400
+    if ',' not in target_app and not target_app.endswith('.exe'):
+        return jsonify({
+            'error': '参数格式错误',
+            'message': '应用程序名称必须以.exe结尾',
+            'provided': target_app,
+            'example': 'yuanshen.exe'
+        }), 400
+
+    profile = None
+    profile_args = [request.args.get(name) for name in ('preset', 'max_width', 'max_height', 'quality', 'codec')]
+    if any(profile_args) or request.args.get('crop') or request.args.get('roi'):
+        try:
+            profile = resolve_profile(*profile_args)
+            crop = _resolve_crop()
+            if crop:
+                profile = replace(profile, crop=crop)
+        except ValueError as e:
+            return jsonify({
+                'error': '参数格式错误',
+                'message': str(e)
+            }), 400
+
+    try:
+        image = snapshot_service.get(
+            target_app,
+            profile,
+            mask_engine=get_mask_engine(current_app.config.get('STREAM_PRIVACY_MASKS', '')),
+            encode_workers=0,
+            backend_factory=lambda: _create_stream_backend(target_app)
+        )
+    except Exception as e:
+        return jsonify({
+            'error': f'获取快照时发生错误: {str(e)}'
+        }), 500
+
+    if not image:
+        return jsonify({'error': f'未找到目标应用 {target_app} 的窗口'}), 404
+    mimetype = profile.mimetype if profile else 'image/jpeg'
+    return Response(image, mimetype=mimetype, headers={'Cache-Control': 'no-cache'})
+
+
+@api_bp.route('/api/stream/replay', methods=['GET'])
+def stream_replay():
+    """
+    推流回放API接口，回放或下载进行中推流最近一段时间的画面
+    最后一个观看者离开后，回放缓冲区在STREAM_DVR_GRACE_SECONDS秒内仍可回放
+    必需查询参数?app=xxx指定目标应用
+    可选查询参数seconds指定回放最近多少秒，默认为缓冲区中的全部画面
+    可选查询参数format=mjpeg（默认，按录制节奏回放）或avi（下载视频文件）
+    
+    Returns:
+        Response: MJPEG视频流、AVI文件或JSON错误响应
+    """
+    target_app = request.args.get('app', '').strip()
+    if not target_app:
+        return jsonify({
+            'error': '缺少必需的参数',
+            'message': '请通过查询参数?app=应用程序名称指定目标应用程序',
+            'example': '/api/stream/replay?app=yuanshen.exe&seconds=10'
+        }), 400
+
+    output_format = request.args.get('format', 'mjpeg').strip().lower()
+    if output_format not in ('mjpeg', 'avi'):
+        return jsonify({
+            'error': '参数格式错误',
+            'message': 'format必须为mjpeg或avi',
+            'provided': output_format
+        }), 400
+
+    seconds = request.args.get('seconds', '').strip()
+    try:
+        seconds = float(seconds) if seconds else None
+        if seconds is not None and not seconds > 0:
+            raise ValueError(seconds)
+    except ValueError:
+        return jsonify({
+            'error': '参数格式错误',
+            'message': 'seconds必须为正数',
+            'provided': request.args.get('seconds')
+        }), 400
+
+    try:
+        target_app = _normalize_target_app(target_app)
+    except ValueError:
+        pass
+    dvr = stream_registry.replay_buffer(target_app)
+    frames = dvr.frames(seconds) if dvr else []
+    if not frames:
+        return jsonify({'error': f'目标应用 {target_app} 没有可回放的画面'}), 404
+
+    try:
+        if output_format == 'mjpeg':
+            return Response(iter_replay(frames), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+        video = export_avi(frames, 1 / dvr.interval)
+        filename = f'{"mosaic" if "," in target_app else os.path.splitext(target_app)[0]}-replay.avi'
+        return Response(video, mimetype='video/x-msvideo',
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    except Exception as e:
+        return jsonify({
+            'error': f'导出回放时发生错误: {str(e)}'
+        }), 500
+
+
 @api_bp.route('/api/stream/info', methods=['GET'])
 def get_stream_info():
     """
     获取推流信息的API接口
+    通过查询参数?app=xxx获取指定目标应用的推流信息，不指定时返回所有推流的信息
+    信息包括实际帧率、捕获与编码耗时百分位、平均JPEG大小、发送速率、丢帧数、观看人数与各客户端的发送延迟
     
     Returns:
         Response: 包含推流状态信息的JSON响应
     """
-    if not stream_controller:
-        return jsonify({'error': '推流控制器未初始化'}), 500
-    
+    target_app = request.args.get('app', '').strip()
+
     try:
-        result = stream_controller.get_stream_info()
-        return jsonify(result)
+        target_app = _normalize_target_app(target_app)
+    except ValueError:
+        pass
+
+    try:
+        if target_app:
+            controller = stream_registry.get(target_app)
+            if not controller:
+                return jsonify({'error': f'目标应用 {target_app} 没有进行中的推流'}), 404
+            return jsonify(controller.get_stream_info())
+
+        streams = [controller.get_stream_info() for controller in stream_registry.controllers()]
+        return jsonify({
+            'streams': streams,
+            'count': len(streams)
+        })
     except Exception as e:
         return jsonify({
             'error': f'获取推流信息时发生错误: {str(e)}'
@@ -236,18 +592,33 @@ def get_stream_info():
 def stop_stream():
     """
     停止推流的API接口
+    通过查询参数或JSON请求体中的app指定目标应用，不指定时停止所有推流
     
     Returns:
         Response: 操作结果的JSON响应
     """
-    if not stream_controller:
-        return jsonify({'error': '推流控制器未初始化'}), 500
-    
+    body = request.get_json(silent=True) or {}
+    target_app = (request.args.get('app') or body.get('app') or '').strip()
+
+    try:
+        target_app = _normalize_target_app(target_app)
+    except ValueError:
+        pass
+
     try:
-        stream_controller.stop_stream()
+        if target_app:
+            if not stream_registry.stop(target_app):
+                return jsonify({
+                    'success': False,
+                    'message': f'目标应用 {target_app} 没有进行中的推流'
+                }), 404
+            stopped = [target_app]
+        else:
+            stopped = stream_registry.stop_all()
         return jsonify({
             'success': True,
-            'message': '推流已停止'
+            'message': '推流已停止',
+            'stopped': stopped
         })
     except Exception as e:
         return jsonify({
@@ -297,9 +668,9 @@ def get_program_list():
         }
     """
     try:
-        # 创建临时的StreamController实例来获取程序列表
-        temp_controller = StreamController()
-        programs = temp_controller.get_available_programs()
+        # 使用共享的窗口查找器，直接读取后台维护的窗口注册表
+        backend = _create_capture_backend()
+        programs = backend.list_programs() if backend else get_window_finder().list_programs()
 
         # 创建允许的程序列表
         allowed_programs = [
@@ -1,21 +1,115 @@
+import json
 import logging
-from typing import Dict, List, Any
+import threading
+from datetime import date
+from typing import Dict, List, Any, Optional
 
-from app.infrastructure.manager import LogDataManager
+from app.infrastructure.manager import LogDataManager, build_item_columns
+from app.infrastructure.utils import parse_timestamp_to_seconds
 
 logger = logging.getLogger(__name__)
 
 
+def _dumps_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _splice_json_array(head: List[Any], tail_fragment: str) -> str:
+    """将head序列化后与已序列化的数组片段（不含方括号）拼接为一个JSON数组。"""
+    head_fragment = _dumps_json(head)[1:-1]
+    if head_fragment and tail_fragment:
+        return f'[{head_fragment},{tail_fragment}]'
+    return f'[{head_fragment or tail_fragment}]'
+
+
+def format_sync_cursor(state: Dict[str, int], today_str: str, today_count: int) -> str:
+    """将同步状态编码为游标字符串：log_seq.item_seq.log_count.today_str.today_count"""
+    return f"{state['log_seq']}.{state['item_seq']}.{state['log_count']}.{today_str}.{today_count}"
+
+
+def encode_compact_item_payload(item_data: Dict[str, List]) -> Dict[str, Any]:
+    """
+    将物品数据编码为字典编码的列式格式，减少重复字符串带来的传输与解析开销：
+    - strings: 物品名称、日期、归属配置组共用的字符串字典，每个字符串只出现一次
+    - 物品名称 / 日期 / 归属配置组: 对应字符串在 strings 中的下标
+    - 时间: 当日零点起的毫秒数，无法解析的时间为 -1
+    """
+    string_index: Dict[str, int] = {}
+
+    def encode_column(values: List[str]) -> List[int]:
+        return [string_index.setdefault(value, len(string_index)) for value in values]
+
+    times = []
+    for timestamp in item_data['时间']:
+        try:
+            times.append(round(parse_timestamp_to_seconds(timestamp) * 1000))
+        except Exception:
+            times.append(-1)
+
+    names = encode_column(item_data['物品名称'])
+    dates = encode_column(item_data['日期'])
+    groups = encode_column(item_data['归属配置组'])
+    return {
+        'strings': list(string_index),
+        '物品名称': names,
+        '时间': times,
+        '日期': dates,
+        '归属配置组': groups
+    }
+
+
+def apply_payload_format(payload: Dict[str, Any], payload_format: str) -> Dict[str, Any]:
+    """根据请求的格式转换物品数据，'full' 为默认格式，'compact' 为字典编码的列式格式。"""
+    if payload_format != 'compact':
+        return payload
+    payload = dict(payload)
+    payload['item'] = encode_compact_item_payload(payload['item'])
+    payload['format'] = 'compact'
+    return payload
+
+
+def parse_sync_cursor(cursor: str) -> Optional[Dict[str, Any]]:
+    """解析游标字符串，格式错误时返回None。"""
+    parts = (cursor or '').split('.')
+    if len(parts) != 5 or not all(part.isdigit() for part in parts):
+        return None
+    log_seq, item_seq, log_count, today_str, today_count = parts
+    return {
+        'log_seq': int(log_seq),
+        'item_seq': int(item_seq),
+        'log_count': int(log_count),
+        'today_str': today_str,
+        'today_count': int(today_count)
+    }
+
+
 class LogController:
     """日志控制器：协调日志管理器并格式化返回数据。"""
 
     def __init__(self, log_dir: str):
         self.log_manager = LogDataManager(log_dir)
+        self._log_list_version = None
+        # 日志管理器持有可变状态，并发请求需要串行访问
+        self._lock = threading.RLock()
+
+    def get_data_version(self) -> str:
+        """返回当前数据版本号，作为ETag使用；获取失败时返回空字符串。"""
+        try:
+            return self.log_manager.get_data_version()
+        except Exception as e:
+            logger.error(f"获取数据版本时发生错误: {e}")
+            return ''
 
     def get_log_list(self) -> Dict[str, List[str]]:
+        with self._lock:
+            return self._get_log_list()
+
+    def _get_log_list(self) -> Dict[str, List[str]]:
         try:
-            if not self.log_manager.log_list:
-                log_list = self.log_manager.get_log_list()
+            data_version = self.get_data_version()
+            if not self.log_manager.log_list or data_version != self._log_list_version:
+                log_list = self.log_manager.get_available_dates()
+                self._log_list_version = data_version
             else:
                 log_list = list(self.log_manager.log_list)
 
@@ -27,18 +121,149 @@ class LogController:
             logger.error(f"获取日志列表时发生错误: {e}")
             return {'list': []}
 
-    def get_log_data(self) -> Dict[str, Any]:
+    def get_log_data(self, payload_format: str = 'full') -> Dict[str, Any]:
+        """
+        获取全部日志数据。payload_format 为 'compact' 时物品数据使用字典编码的列式格式，
+        详见 encode_compact_item_payload。
+        """
+        with self._lock:
+            return self._get_log_data(payload_format)
+
+    def _get_log_data(self, payload_format: str) -> Dict[str, Any]:
         try:
             self.log_manager.get_log_list()
             duration_data = self._build_duration_payload()
             item_data = self.log_manager.item_datadict
-            return {'duration': duration_data, 'item': item_data}
+            return apply_payload_format({'duration': duration_data, 'item': item_data}, payload_format)
         except Exception as e:
             logger.error(f"获取日志数据时发生错误: {e}")
-            return {
+            return apply_payload_format({
                 'duration': {'日期': [], '持续时间': []},
                 'item': {'物品名称': [], '时间': [], '日期': [], '归属配置组': []}
+            }, payload_format)
+
+    def get_log_data_since(self, since: str, payload_format: str = 'full') -> Dict[str, Any]:
+        """
+        增量同步：返回客户端游标之后新增的物品与变化的持续时间，以及新的游标。
+        游标无效、跨天或数据库发生删除时，返回完整数据并将 full 置为 True。
+        """
+        with self._lock:
+            return apply_payload_format(self._get_sync_payload(since), payload_format)
+
+    def get_log_data_json(self) -> bytes:
+        """
+        获取默认格式的全部日志数据，直接返回序列化后的JSON字节。
+        历史数据部分的JSON片段按历史数据版本号缓存，每次请求只序列化今天的数据并拼接，
+        序列化开销与今天的数据量成正比，而不是与全部历史数据成正比。
+        """
+        with self._lock:
+            try:
+                payload = self._build_log_data_json()
+            except Exception as e:
+                logger.error(f"序列化日志数据时发生错误: {e}")
+                payload = _dumps_json(self._get_log_data('full')).encode('utf-8')
+            self._save_snapshot()
+            return payload
+
+    def save_snapshot(self) -> bool:
+        """立即将当前计算结果写入快照文件，供程序退出时调用。"""
+        with self._lock:
+            return self._save_snapshot(force=True)
+
+    def _save_snapshot(self, force: bool = False) -> bool:
+        try:
+            return self.log_manager.save_snapshot(force=force)
+        except Exception as e:
+            logger.error(f"保存快照时发生错误: {e}")
+            return False
+
+    def _build_log_data_json(self) -> bytes:
+        manager = self.log_manager
+        manager.today_str = date.today().strftime('%Y%m%d')
+        historical = manager.get_historical_snapshot()
+        sorted_dates = sorted(historical.duration.keys(), reverse=True)
+        if sorted_dates and sorted_dates[0] >= manager.today_str:
+            # 历史数据中存在不早于今天的日期（系统时间被调整），无法直接拼接，退回完整序列化
+            return _dumps_json(self._get_log_data('full')).encode('utf-8')
+
+        today_duration, today_items = manager.get_today_data()
+        has_today = today_duration > 0 and bool(today_items)
+        manager.today_item_count = len(today_items) if has_today else 0
+        today_item_data = build_item_columns(today_items if has_today else [])
+
+        # 持续时间按天记录，数据量很小，直接序列化
+        duration_json = _dumps_json({
+            '日期': ([manager.today_str] if has_today else []) + sorted_dates,
+            '持续时间': ([today_duration] if has_today else []) + [historical.duration[d] for d in sorted_dates]
+        })
+        item_json = '{%s}' % ','.join(
+            f'{_dumps_json(key)}:{_splice_json_array(today_item_data[key], historical.item_json[key])}'
+            for key in ('物品名称', '时间', '日期', '归属配置组')
+        )
+        return f'{{"duration":{duration_json},"item":{item_json}}}'.encode('utf-8')
+
+    def _get_sync_payload(self, since: str) -> Dict[str, Any]:
+        try:
+            cursor = parse_sync_cursor(since)
+            state = self.log_manager.get_sync_state()
+            if state is None:
+                raise RuntimeError('无法获取同步状态')
+
+            if cursor is None or not self._is_cursor_valid(cursor, state):
+                result = self.get_log_data()
+                result['cursor'] = format_sync_cursor(
+                    self.log_manager.db_manager.get_sync_state() or state,
+                    self.log_manager.today_str,
+                    self.log_manager.today_item_count
+                )
+                result['full'] = True
+                return result
+
+            duration_changes, item_changes = self.log_manager.get_changes_since(
+                cursor['log_seq'], cursor['item_seq']
+            )
+            today_duration, today_items = self.log_manager.get_today_data()
+            today_count = len(today_items) if today_duration > 0 and today_items else 0
+            if today_count < cursor['today_count']:
+                # 今天的日志被截断或替换，无法增量同步
+                return self._get_sync_payload('')
+
+            duration_payload = {'日期': [], '持续时间': []}
+            if today_count:
+                duration_payload['日期'].append(self.log_manager.today_str)
+                duration_payload['持续时间'].append(today_duration)
+            for date_str in sorted(duration_changes.keys(), reverse=True):
+                duration_payload['日期'].append(date_str)
+                duration_payload['持续时间'].append(duration_changes[date_str])
+
+            # 今天新增的物品与完整数据保持一致，按时间倒序排在最前面
+            item_payload = build_item_columns(today_items[cursor['today_count']:today_count])
+            for key in item_payload:
+                item_payload[key].extend(item_changes[key])
+
+            return {
+                'duration': duration_payload,
+                'item': item_payload,
+                'cursor': format_sync_cursor(state, self.log_manager.today_str, today_count),
+                'full': False
             }
+        except Exception as e:
+            logger.error(f"增量同步日志数据时发生错误: {e}")
+            return {
+                'duration': {'日期': [], '持续时间': []},
+                'item': {'物品名称': [], '时间': [], '日期': [], '归属配置组': []},
+                'cursor': since,
+                'full': False
+            }
+
+    def _is_cursor_valid(self, cursor: Dict[str, Any], state: Dict[str, int]) -> bool:
+        if cursor['today_str'] != self.log_manager.today_str:
+            return False
+        if cursor['log_seq'] > state['log_seq'] or cursor['item_seq'] > state['item_seq']:
+            return False
+        # 游标之后只允许新增记录，记录数不匹配说明发生了删除或覆盖，需要全量同步
+        new_log_count = len(self.log_manager.db_manager.get_duration_data_since(cursor['log_seq'], exclude_today=False))
+        return cursor['log_count'] + new_log_count == state['log_count']
 
     def _build_duration_payload(self) -> Dict[str, List[Any]]:
         duration_cache = self.log_manager.duration_datadict
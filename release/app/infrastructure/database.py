@@ -252,6 +252,113 @@ class DatabaseManager:
             logger.error(f"获取物品数据时发生错误: {e}")
             return {}
     
+    def get_data_version(self) -> str:
+        """
+        获取日志数据的版本号
+        由log_files与items两张表的自增序列以及log_files的记录数组成，
+        任何一次写入或删除都会使版本号发生变化
+
+        Returns:
+            str: 数据版本号，查询失败时返回空字符串
+        """
+        state = self.get_sync_state()
+        if state is None:
+            return ''
+        return f"{state['log_seq']}.{state['item_seq']}.{state['log_count']}"
+
+    def get_sync_state(self) -> Optional[Dict[str, int]]:
+        """
+        获取增量同步状态
+        log_files与items均使用AUTOINCREMENT主键，序号单调递增且不会复用，
+        因此可以直接作为增量同步的游标
+
+        Returns:
+            Optional[Dict[str, int]]: 包含 log_seq, item_seq, log_count 的字典，查询失败时返回None
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT name, seq FROM sqlite_sequence
+                    WHERE name IN ('log_files', 'items')
+                ''')
+                sequences = {row[0]: row[1] for row in cursor.fetchall()}
+                cursor.execute('SELECT COUNT(*) FROM log_files')
+                log_count = cursor.fetchone()[0]
+                return {
+                    'log_seq': sequences.get('log_files', 0),
+                    'item_seq': sequences.get('items', 0),
+                    'log_count': log_count
+                }
+        except Exception as e:
+            logger.error(f"获取同步状态时发生错误: {e}")
+            return None
+
+    def get_duration_data_since(self, log_seq: int, exclude_today: bool = True) -> Dict[str, int]:
+        """
+        获取指定序号之后写入的持续时间数据
+
+        Args:
+            log_seq: 起始序号（不包含）
+            exclude_today: 是否排除今天的数据
+
+        Returns:
+            Dict[str, int]: 日期到持续时间的映射字典
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+
+                query = 'SELECT date_str, duration FROM log_files WHERE id > ?'
+                params = [log_seq]
+
+                if exclude_today:
+                    query += ' AND date_str != ?'
+                    params.append(date.today().strftime('%Y%m%d'))
+
+                cursor.execute(query + ' ORDER BY id', params)
+                return {row[0]: row[1] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"获取增量持续时间数据时发生错误: {e}")
+            return {}
+
+    def get_item_data_since(self, item_seq: int, exclude_today: bool = True) -> Dict[str, List]:
+        """
+        获取指定序号之后写入的物品数据，按主键范围查询
+
+        Args:
+            item_seq: 起始序号（不包含）
+            exclude_today: 是否排除今天的数据
+
+        Returns:
+            Dict[str, List]: 统一格式的物品数据字典
+        """
+        result = {'物品名称': [], '时间': [], '日期': [], '归属配置组': []}
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+
+                query = '''
+                    SELECT name, timestamp, date_str, config_group
+                    FROM items WHERE id > ?
+                '''
+                params = [item_seq]
+
+                if exclude_today:
+                    query += ' AND date_str != ?'
+                    params.append(date.today().strftime('%Y%m%d'))
+
+                cursor.execute(query + ' ORDER BY id', params)
+                for name, timestamp, date_str, config_group in cursor.fetchall():
+                    result['物品名称'].append(name)
+                    result['时间'].append(timestamp)
+                    result['日期'].append(date_str)
+                    result['归属配置组'].append(config_group or '')
+                return result
+        except Exception as e:
+            logger.error(f"获取增量物品数据时发生错误: {e}")
+            return result
+
     def get_log_file_info(self, date_str: str) -> Optional[Dict]:
         """
         获取指定日期的日志文件信息
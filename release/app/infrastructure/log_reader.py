@@ -0,0 +1,327 @@
+"""
+日志解析模块
+BetterGI日志的逐条解析状态与今天日志的增量读取
+"""
+import re
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from app.domain.entities import ItemInfo, LogAnalysisResult
+from app.infrastructure.utils import parse_timestamp_to_seconds
+
+logger = logging.getLogger('BetterGI初始化')
+
+# 需要过滤的物品列表
+FORBIDDEN_ITEMS = ['调查', '直接拾取']
+
+# 预编译正则表达式
+FIRST_LINE_PATTERN = re.compile(r'^\[([^]]+)\] \[([^]]+)\] ([^\n]+)\n?([^\n[]*)\n')  # 匹配日志第一行
+LOG_PATTERN = re.compile(r'\n\[([^]]+)\] \[([^]]+)\] ([^\n]+)\n?([^\n[]*)\n')  # 匹配日志行
+TASK_BEGIN_PATTERN = re.compile(r'^配置组 "([^"]*)" 加载完成，共(\d+)个脚本，开始执行$')  # 匹配配置组开始
+
+
+class LogParseState:
+    """
+    日志解析状态
+    逐条接收日志匹配结果并累计物品、配置组与活动时间段，
+    可以分多次输入，从而支持对持续写入的日志进行增量解析
+    """
+
+    def __init__(self, date_str: str):
+        """
+        初始化解析状态
+
+        Args:
+            date_str: 日志对应的日期字符串
+        """
+        self.date_str = date_str
+        self.item_count: Dict[str, int] = {}
+        self.items: List[ItemInfo] = []
+        self.seen_keys = set()  # 避免物品的重复记录
+        self.closed_duration = 0  # 已结束的活动时间段总时长
+        self.current_start: Optional[float] = None
+        self.last_time: Optional[float] = None
+        self.current_task: Optional[str] = None  # 当前运行的配置组
+
+    def feed(self, match: tuple):
+        """
+        处理一条日志匹配结果
+
+        Args:
+            match: LOG_PATTERN 或 FIRST_LINE_PATTERN 的匹配分组
+        """
+        timestamp = match[0]  # 时间戳
+        details = match[3].strip()  # 日志内容文本
+
+        # 过滤禁用的关键词
+        if any(keyword in details for keyword in FORBIDDEN_ITEMS):
+            return
+
+        # 匹配配置组开始
+        task_matches = TASK_BEGIN_PATTERN.match(details)
+        if task_matches:
+            self.current_task = task_matches.group(1)
+        # 匹配配置组结束
+        if self.current_task and f'配置组 "{self.current_task}" 执行结束' in details:
+            self.current_task = None
+
+        # 转换时间戳
+        try:
+            current_time = parse_timestamp_to_seconds(timestamp)
+        except Exception as e:
+            logger.error(f"解析时间戳{timestamp}时候发生错误:{e}")
+            logger.error(f'涉及的完整匹配字符串：{match}')
+            return
+
+        # 提取拾取内容
+        if '交互或拾取' in details:
+            item_name = details.split('：')[1].strip('"')
+            self.item_count[item_name] = self.item_count.get(item_name, 0) + 1
+
+            # 检查是否存在匹配的行
+            cache_key = f'{item_name}{timestamp}{self.date_str}{self.current_task}'
+            if cache_key not in self.seen_keys:
+                self.items.append(ItemInfo(
+                    name=item_name,
+                    timestamp=timestamp,
+                    date=self.date_str,
+                    config_group=str(self.current_task) if self.current_task else None
+                ))
+                self.seen_keys.add(cache_key)
+
+        # 处理时间段
+        if self.last_time is None:
+            # 第一个事件
+            self.current_start = current_time
+        elif current_time - self.last_time > 300:
+            # 间隔过大（超过5分钟），结束当前段
+            if self.current_start is not None:
+                self.closed_duration += int(self.last_time - self.current_start)
+            self.current_start = current_time
+
+        self.last_time = current_time
+
+    def copy(self) -> 'LogParseState':
+        """
+        复制解析状态，用于在不影响当前状态的情况下解析尚未写完的日志
+
+        Returns:
+            LogParseState: 状态副本
+        """
+        state = LogParseState.__new__(LogParseState)
+        state.__dict__.update(self.__dict__)
+        state.item_count = dict(self.item_count)
+        state.items = list(self.items)
+        state.seen_keys = set(self.seen_keys)
+        return state
+
+    def to_result(self) -> LogAnalysisResult:
+        """
+        生成解析结果，最后一个活动时间段计入总时长
+
+        Returns:
+            LogAnalysisResult: 日志分析结果
+        """
+        duration = self.closed_duration
+        if self.current_start is not None and self.last_time is not None:
+            duration += int(self.last_time - self.current_start)
+
+        return LogAnalysisResult(
+            item_count=dict(self.item_count),
+            duration=duration,
+            items=list(self.items)
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        序列化为可以写入JSON的字典
+
+        Returns:
+            Dict[str, Any]: 解析状态字典
+        """
+        return {
+            'date_str': self.date_str,
+            'item_count': self.item_count,
+            'items': [[item.name, item.timestamp, item.date, item.config_group] for item in self.items],
+            'seen_keys': list(self.seen_keys),
+            'closed_duration': self.closed_duration,
+            'current_start': self.current_start,
+            'last_time': self.last_time,
+            'current_task': self.current_task
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LogParseState':
+        """
+        从字典恢复解析状态
+
+        Args:
+            data: to_dict 生成的字典
+
+        Returns:
+            LogParseState: 解析状态
+        """
+        state = cls(data['date_str'])
+        state.item_count = dict(data['item_count'])
+        state.items = [
+            ItemInfo(name=name, timestamp=timestamp, date=date_str, config_group=config_group)
+            for name, timestamp, date_str, config_group in data['items']
+        ]
+        state.seen_keys = set(data['seen_keys'])
+        state.closed_duration = data['closed_duration']
+        state.current_start = data['current_start']
+        state.last_time = data['last_time']
+        state.current_task = data['current_task']
+        return state
+
+
+def feed_log_text(state: LogParseState, text: str, at_file_start: bool) -> bool:
+    """
+    将一段日志文本输入解析状态
+
+    Args:
+        state: 解析状态
+        text: 已统一换行符的日志文本
+        at_file_start: 文本是否从文件开头开始（需要单独匹配第一行）
+
+    Returns:
+        bool: 最后一个匹配是否恰好结束于文本末尾（即消耗了末尾的换行符）
+    """
+    if at_file_start:
+        first_line_match = FIRST_LINE_PATTERN.match(text)
+        if first_line_match:
+            state.feed(first_line_match.groups())
+
+    last_end = -1
+    for match in LOG_PATTERN.finditer(text):
+        state.feed(match.groups())
+        last_end = match.end()
+    return last_end == len(text)
+
+
+def decode_log_bytes(data: bytes) -> str:
+    """
+    解码日志字节并统一换行符，与文本模式读取文件的结果一致
+
+    Args:
+        data: 日志文件的原始字节
+
+    Returns:
+        str: 日志文本
+    """
+    return data.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+
+
+class IncrementalLogReader:
+    """
+    今天日志的增量读取器
+    只解析上次读取之后追加的内容，解析结果与一次性解析整个文件一致。
+
+    日志条目只会在下一条日志开始（即出现 "\\n[" ）后才被提交到解析状态中，
+    文件末尾尚未写完的条目每次读取时临时解析，不影响已提交的状态。
+    """
+
+    # 用于校验文件是否被替换的文件头长度
+    HEAD_SIZE = 256
+
+    def __init__(self, file_path: str, date_str: str):
+        """
+        初始化增量读取器
+
+        Args:
+            file_path: 日志文件路径
+            date_str: 日期字符串
+        """
+        self.file_path = file_path
+        self.date_str = date_str
+        self.reset()
+
+    def reset(self):
+        """丢弃已提交的解析状态，下次读取时从文件开头重新解析"""
+        self.state = LogParseState(self.date_str)
+        self.offset = 0  # 已提交内容的字节偏移
+        self.newline_consumed = False  # 最后一个已提交的匹配是否消耗了偏移前的换行符
+        self.head_digest = ''
+
+    def read(self) -> Optional[LogAnalysisResult]:
+        """
+        读取并解析日志文件新增的内容
+
+        Returns:
+            Optional[LogAnalysisResult]: 整个文件的解析结果，若发生错误则返回None
+        """
+        try:
+            with open(self.file_path, 'rb') as file:
+                head = file.read(self.HEAD_SIZE)
+                file_size = file.seek(0, 2)
+                if file_size < self.offset or self._digest(head) != self.head_digest:
+                    # 文件被截断或替换，重新解析
+                    self.reset()
+                file.seek(self.offset)
+                data = file.read()
+        except FileNotFoundError:
+            logger.error(f"文件未找到: {self.file_path}")
+            return None
+        except Exception as e:
+            logger.error(f"读取文件 {self.file_path} 时发生未知错误: {e}")
+            return None
+
+        cut = data.rfind(b'\n[')
+        if cut >= 0:
+            # 提交最后一条日志开始之前的完整内容
+            committed, data = data[:cut + 1], data[cut + 1:]
+            self.newline_consumed = feed_log_text(self.state, self._prepare_text(committed), self.offset == 0)
+            self.offset += len(committed)
+            self.head_digest = self._digest(head)
+
+        # 临时解析尚未写完的末尾内容
+        state = self.state.copy()
+        feed_log_text(state, self._prepare_text(data), self.offset == 0)
+        return state.to_result()
+
+    def _prepare_text(self, data: bytes) -> str:
+        text = decode_log_bytes(data)
+        if self.offset and not self.newline_consumed:
+            # 偏移前的换行符尚未被匹配消耗，补回以便匹配偏移处的日志行
+            text = '\n' + text
+        return text
+
+    def _digest(self, head: bytes) -> str:
+        if not self.offset:
+            return ''
+        return hashlib.sha1(head[:min(self.offset, self.HEAD_SIZE)]).hexdigest()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        序列化读取进度与解析状态
+
+        Returns:
+            Dict[str, Any]: 读取器状态字典
+        """
+        return {
+            'file_path': self.file_path,
+            'date_str': self.date_str,
+            'offset': self.offset,
+            'newline_consumed': self.newline_consumed,
+            'head_digest': self.head_digest,
+            'state': self.state.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'IncrementalLogReader':
+        """
+        从字典恢复读取器，文件是否仍然有效会在下次读取时校验
+
+        Args:
+            data: to_dict 生成的字典
+
+        Returns:
+            IncrementalLogReader: 读取器
+        """
+        reader = cls(data['file_path'], data['date_str'])
+        reader.offset = data['offset']
+        reader.newline_consumed = data['newline_consumed']
+        reader.head_digest = data['head_digest']
+        reader.state = LogParseState.from_dict(data['state'])
+        return reader
@@ -3,23 +3,85 @@
 数据读取、解析逻辑（对应"db数据解释/读取"）
 """
 import os
-import re
+import json
+import hashlib
 import logging
+import time
 from typing import List, Dict, Optional, Tuple
 from datetime import date
 from app.domain.entities import LogEntry, ItemInfo, DurationInfo, LogAnalysisResult, ConfigGroup
-from app.infrastructure.utils import parse_timestamp_to_seconds
 from app.infrastructure.database import DatabaseManager
+from app.infrastructure.log_reader import FORBIDDEN_ITEMS, LogParseState, IncrementalLogReader, feed_log_text
+from app.infrastructure.snapshot import read_snapshot, write_snapshot
 
 logger = logging.getLogger('BetterGI初始化')
 
-# 需要过滤的物品列表
-FORBIDDEN_ITEMS = ['调查', '直接拾取']
+# 快照文件名，与数据库文件位于同一目录
+SNAPSHOT_FILE_NAME = 'CanLiangSnapshot.json'
+HISTORY_SNAPSHOT_FILE_NAME = 'CanLiangSnapshot.history.json'
 
-# 预编译正则表达式
-FIRST_LINE_PATTERN = re.compile(r'^\[([^]]+)\] \[([^]]+)\] ([^\n]+)\n?([^\n[]*)\n')  # 匹配日志第一行
-LOG_PATTERN = re.compile(r'\n\[([^]]+)\] \[([^]]+)\] ([^\n]+)\n?([^\n[]*)\n')  # 匹配日志行
-TASK_BEGIN_PATTERN = re.compile(r'^配置组 "([^"]*)" 加载完成，共(\d+)个脚本，开始执行$')  # 匹配配置组开始
+# 今天解析进度快照的最小写入间隔（秒）
+SNAPSHOT_MIN_INTERVAL = 60
+
+
+def build_item_columns(items: List[ItemInfo]) -> Dict[str, List]:
+    """
+    将物品列表转换为统一格式的列式数据，按时间倒序排列（最新的物品在前面）
+
+    Args:
+        items: 物品信息列表（按日志顺序）
+
+    Returns:
+        Dict[str, List]: 统一格式的物品数据
+    """
+    ordered = list(reversed(items))
+    return {
+        '物品名称': [item.name for item in ordered],
+        '时间': [item.timestamp for item in ordered],
+        '日期': [item.date for item in ordered],
+        '归属配置组': [item.config_group or '' for item in ordered]
+    }
+
+
+class HistoricalData:
+    """
+    历史数据（不包括今天的数据），入库后不会再变化。
+    物品数据可以以Python列表或JSON片段（不含方括号的数组内容）两种形式持有，
+    按需相互转换并缓存，从快照恢复时无需解析全部历史物品即可直接拼接响应。
+    """
+
+    def __init__(self, version: str, duration: Dict[str, int],
+                 item: Optional[Dict[str, List]] = None, item_json: Optional[Dict[str, str]] = None):
+        """
+        初始化历史数据
+
+        Args:
+            version: 历史数据版本号
+            duration: {日期: 持续时间} 字典
+            item: 统一格式的物品数据
+            item_json: 统一格式物品数据每一列的JSON片段
+        """
+        self.version = version
+        self.duration = duration
+        self._item = item
+        self._item_json = item_json
+
+    @property
+    def item(self) -> Dict[str, List]:
+        """统一格式的物品数据（调用方不应修改）"""
+        if self._item is None:
+            self._item = {key: json.loads(f'[{fragment}]') for key, fragment in self._item_json.items()}
+        return self._item
+
+    @property
+    def item_json(self) -> Dict[str, str]:
+        """统一格式物品数据每一列的JSON片段"""
+        if self._item_json is None:
+            self._item_json = {
+                key: json.dumps(values, ensure_ascii=False, separators=(',', ':'))[1:-1]
+                for key, values in self._item.items()
+            }
+        return self._item_json
 
 
 class LogDataManager:
@@ -36,7 +98,6 @@ class LogDataManager:
             log_dir: 日志目录路径
         """
         self.log_dir = log_dir
-        self.item_cached_list = []  # 用于替代原有的筛选功能，避免物品的重复记录
         self.item_datadict = {
             '物品名称': [], '时间': [], '日期': [], '归属配置组': []
         }
@@ -44,6 +105,12 @@ class LogDataManager:
             '日期': [], '持续时间': []
         }
         self.log_list = None
+        self.today_item_count = 0
+        self._historical_cache: Optional[HistoricalData] = None
+        self._today_reader: Optional[IncrementalLogReader] = None
+        self._last_snapshot_time = 0.0
+        self._last_snapshot_key = None
+        self._last_history_snapshot_version = None
         
         # 初始化数据库管理器
         db_path = os.path.join(log_dir, 'CanLiangData.db')
@@ -51,6 +118,9 @@ class LogDataManager:
         
         # 今天的日期字符串，用于排除今天的数据存储
         self.today_str = date.today().strftime('%Y%m%d')
+
+        # 从快照恢复上次运行的计算结果
+        self.load_snapshot()
     
     def parse_log(self, log_content: str, date_str: str) -> LogAnalysisResult:
         """
@@ -64,87 +134,9 @@ class LogDataManager:
         Returns:
             LogAnalysisResult: 包含解析结果的分析结果对象
         """
-        matches = LOG_PATTERN.findall(log_content)
-        first_line_match = FIRST_LINE_PATTERN.match(log_content)
-        if first_line_match:
-            matches = [first_line_match.groups()] + matches
-
-        item_count = {}
-        items = []
-
-        # 使用时间段列表管理所有活动时间段
-        time_segments = []  # 存储所有时间段 [(start, end), ...]
-        current_start = None
-        last_time = None
-        current_task = None  # 当前运行的配置组
-        
-        for match in matches:
-            timestamp = match[0]  # 时间戳
-            # level = match[1]  # 日志级别
-            # log_type = match[2]  # 类名
-            details = match[3].strip()  # 日志内容文本
-
-            # 过滤禁用的关键词
-            if any(keyword in details for keyword in FORBIDDEN_ITEMS):
-                continue
-
-            # 匹配配置组开始
-            task_matches = TASK_BEGIN_PATTERN.match(details)
-            if task_matches:
-                current_task = task_matches.group(1)
-            # 匹配配置组结束
-            if current_task and f'配置组 "{current_task}" 执行结束' in details:
-                current_task = None
-
-            # 转换时间戳
-            try:
-                current_time = parse_timestamp_to_seconds(timestamp)
-            except Exception as e:
-                logger.error(f"解析时间戳{timestamp}时候发生错误:{e}")
-                logger.error(f'涉及的完整匹配字符串：{match}')
-                continue
-                
-            # 提取拾取内容
-            if '交互或拾取' in details:
-                item_name = details.split('：')[1].strip('"')
-                item_count[item_name] = item_count.get(item_name, 0) + 1
-
-                # 检查是否存在匹配的行
-                cache_key = f'{item_name}{timestamp}{date_str}{current_task}'
-                if cache_key not in self.item_cached_list:
-                    item_info = ItemInfo(
-                        name=item_name,
-                        timestamp=timestamp,
-                        date=date_str,
-                        config_group=str(current_task) if current_task else None
-                    )
-                    items.append(item_info)
-                    self.item_cached_list.append(cache_key)
-
-            # 处理时间段
-            if last_time is None:
-                # 第一个事件
-                current_start = current_time
-            elif current_time - last_time > 300:
-                # 间隔过大（超过5分钟），结束当前段
-                if current_start is not None:
-                    time_segments.append((current_start, last_time))
-                current_start = current_time
-            
-            last_time = current_time
-
-        # 处理最后一段
-        if current_start is not None and last_time is not None:
-            time_segments.append((current_start, last_time))
-
-        # 计算总持续时间
-        duration = sum(int(end - start) for start, end in time_segments)
-
-        return LogAnalysisResult(
-            item_count=item_count,
-            duration=duration,
-            items=items
-        )
+        state = LogParseState(date_str)
+        feed_log_text(state, log_content, at_file_start=True)
+        return state.to_result()
 
     def read_log_file(self, file_path: str, date_str: str) -> Optional[LogAnalysisResult]:
         """
@@ -168,12 +160,9 @@ class LogDataManager:
             logger.error(f"读取文件 {file_path} 时发生未知错误: {e}")
             return None
 
-    def _get_historical_data(self) -> tuple[Dict[str, float], Dict[str, Dict[str, List]]]:
+    def _ingest_new_log_files(self):
         """
-        获取历史数据（不包括今天的数据）
-        
-        Returns:
-            tuple: (duration_data, item_data) 历史持续时间数据和物品数据
+        将数据库中尚未存储的历史日志文件（不包括今天）解析并写入数据库
         """
         # 获取所有以'better-genshin-impact'开头的日志文件，并提取日期部分
         log_files = [f.replace('better-genshin-impact', '').replace('.log', '')
@@ -215,28 +204,57 @@ class LogDataManager:
                 ]
                 self.db_manager.insert_log_file_data(file_date, result.duration, item_list)
 
-        # 从数据库加载所有历史数据（排除今天）
+    def get_historical_snapshot(self) -> HistoricalData:
+        """
+        获取历史数据（不包括今天的数据）
+        历史数据入库后不会再变化，因此只在数据库版本号变化时才重新从数据库加载
+
+        Returns:
+            HistoricalData: 历史数据
+        """
+        self._ingest_new_log_files()
+
+        version = f'{self.db_manager.get_data_version()}|{self.today_str}'
+        cache = self._historical_cache
+        if cache is not None and cache.version == version:
+            return cache
+
+        # 从数据库加载所有历史数据（排除今天），按写入顺序返回
         duration_data = self.db_manager.get_duration_data(exclude_today=True)
-        item_data = self.db_manager.get_item_data(exclude_today=True)
-        
-        return duration_data, item_data
+        item_data = self.db_manager.get_item_data_since(0, exclude_today=True)
+
+        self._historical_cache = HistoricalData(version, duration_data, item=item_data)
+        return self._historical_cache
+
+    def get_historical_data(self) -> tuple[str, Dict[str, int], Dict[str, List]]:
+        """
+        获取历史数据（不包括今天的数据）
+
+        Returns:
+            tuple: (version, duration_data, item_data) 历史数据版本号、
+                   {日期: 持续时间} 字典和统一格式的物品数据（调用方不应修改）
+        """
+        historical = self.get_historical_snapshot()
+        return historical.version, historical.duration, historical.item
 
     def _get_today_data(self) -> tuple[float, List]:
         """
-        获取今天的数据
+        获取今天的数据，只增量解析今天日志上次读取之后追加的内容
         
         Returns:
             tuple: (duration, items) 今天的持续时间和物品列表，如果没有数据则返回(0, [])
         """
-        # 清空缓存，因为需要重新读取今天的数据
-        self.item_cached_list = []
-        
         today_file_path = os.path.join(self.log_dir, f"better-genshin-impact{self.today_str}.log")
         
         if not os.path.exists(today_file_path):
             return 0, []
-            
-        today_result = self.read_log_file(today_file_path, self.today_str)
+
+        reader = self._today_reader
+        if reader is None or reader.file_path != today_file_path or reader.date_str != self.today_str:
+            reader = IncrementalLogReader(today_file_path, self.today_str)
+            self._today_reader = reader
+
+        today_result = reader.read()
         if not today_result:
             return 0, []
 
@@ -252,6 +270,127 @@ class LogDataManager:
         else:
             return 0, []
 
+    def get_available_dates(self) -> List[str]:
+        """
+        获取有数据的日期列表（降序），不需要合并物品数据
+
+        Returns:
+            List[str]: 日期字符串列表
+        """
+        self.today_str = date.today().strftime('%Y%m%d')
+        dates = set(self.get_historical_snapshot().duration)
+
+        today_duration, today_items = self._get_today_data()
+        if today_duration > 0 and today_items:
+            dates.add(self.today_str)
+
+        self.log_list = sorted(dates, reverse=True)
+        return self.log_list
+
+    def load_snapshot(self) -> bool:
+        """
+        从快照文件恢复历史数据与今天日志的解析进度。
+        历史数据只有在数据库版本号与日期都匹配时才会被采用；
+        今天日志的解析进度在下次读取时会校验文件大小与文件头，文件被替换时自动重新解析。
+
+        Returns:
+            bool: 是否恢复了任何数据
+        """
+        restored = False
+        history = read_snapshot(os.path.join(self.log_dir, HISTORY_SNAPSHOT_FILE_NAME))
+        if history:
+            try:
+                version = f'{self.db_manager.get_data_version()}|{self.today_str}'
+                if history['version'] == version:
+                    self._historical_cache = HistoricalData(
+                        version, history['duration'], item_json=history['item_json']
+                    )
+                    self._last_history_snapshot_version = version
+                    restored = True
+            except Exception as e:
+                logger.error(f"恢复历史数据快照时发生错误: {e}")
+
+        snapshot = read_snapshot(os.path.join(self.log_dir, SNAPSHOT_FILE_NAME))
+        if snapshot and snapshot.get('today_reader'):
+            try:
+                reader = IncrementalLogReader.from_dict(snapshot['today_reader'])
+                expected_path = os.path.join(self.log_dir, f"better-genshin-impact{self.today_str}.log")
+                if reader.date_str == self.today_str and os.path.normpath(reader.file_path) == os.path.normpath(expected_path):
+                    self._today_reader = reader
+                    restored = True
+            except Exception as e:
+                logger.error(f"恢复今天日志解析进度时发生错误: {e}")
+
+        if restored:
+            logger.info("已从快照恢复日志数据")
+        return restored
+
+    def save_snapshot(self, force: bool = False) -> bool:
+        """
+        将历史数据与今天日志的解析进度写入快照文件。
+        历史数据只在版本号变化时写入；今天的解析进度在变化后最多每 SNAPSHOT_MIN_INTERVAL 秒写入一次。
+
+        Args:
+            force: 是否忽略写入间隔（程序退出时使用）
+
+        Returns:
+            bool: 是否写入了快照
+        """
+        saved = False
+        historical = self._historical_cache
+        if historical is not None and historical.version != self._last_history_snapshot_version:
+            if write_snapshot(os.path.join(self.log_dir, HISTORY_SNAPSHOT_FILE_NAME), {
+                'version': historical.version,
+                'duration': historical.duration,
+                'item_json': historical.item_json
+            }):
+                self._last_history_snapshot_version = historical.version
+                saved = True
+
+        reader = self._today_reader
+        snapshot_key = (reader.file_path, reader.offset) if reader else None
+        now = time.monotonic()
+        if snapshot_key != self._last_snapshot_key and (force or now - self._last_snapshot_time >= SNAPSHOT_MIN_INTERVAL):
+            if write_snapshot(os.path.join(self.log_dir, SNAPSHOT_FILE_NAME), {
+                'today_str': self.today_str,
+                'today_reader': reader.to_dict() if reader else None
+            }):
+                self._last_snapshot_key = snapshot_key
+                self._last_snapshot_time = now
+                saved = True
+        return saved
+
+    def get_data_version(self) -> str:
+        """
+        计算当前日志数据的版本号，用于HTTP条件请求（ETag）。
+        只读取数据库版本号与文件元信息，不会触发日志解析。
+        版本号由以下部分组成：
+        - 数据库中历史数据的版本号
+        - 当前日期（跨天后今天的数据会转为历史数据）
+        - 日志目录中的日志文件列表（新增或删除日志文件）
+        - 今天日志文件的大小与修改时间（即今天日志的读取偏移）
+
+        Returns:
+            str: 数据版本号的摘要字符串
+        """
+        today_str = date.today().strftime('%Y%m%d')
+        parts = [self.db_manager.get_data_version(), today_str]
+
+        try:
+            parts.extend(sorted(f for f in os.listdir(self.log_dir) if f.startswith('better-genshin-impact')))
+        except OSError:
+            pass
+
+        today_file_path = os.path.join(self.log_dir, f"better-genshin-impact{today_str}.log")
+        try:
+            today_stat = os.stat(today_file_path)
+            parts.extend([today_stat.st_size, today_stat.st_mtime_ns])
+        except OSError:
+            parts.extend([0, 0])
+
+        version_str = '|'.join(str(part) for part in parts)
+        return hashlib.sha1(version_str.encode('utf-8')).hexdigest()[:20]
+
     def get_log_list(self) -> List[str]:
         """
         获取日志文件列表，并过滤掉不包含交互物品的日志文件。
@@ -261,42 +400,31 @@ class LogDataManager:
         Returns:
             List[str]: 过滤后的日志文件名列表
         """
+        # 跨天运行时更新今天的日期，保证今天的数据不会被当作历史数据存储
+        self.today_str = date.today().strftime('%Y%m%d')
+
         # 获取历史数据
-        duration_data, item_data = self._get_historical_data()
+        _, duration_data, item_data = self.get_historical_data()
         
         # 数据库返回的已经是字典格式，直接使用
         date_duration_dict = duration_data.copy()
         
-        # 构建物品数据的统一格式
-        unified_item_data = {
-            '物品名称': [],
-            '时间': [],
-            '日期': [],
-            '归属配置组': []
-        }
-        
-        # 将按日期分组的物品数据合并为统一格式
-        for date_str, items in item_data.items():
-            for i in range(len(items['物品名称'])):
-                unified_item_data['物品名称'].append(items['物品名称'][i])
-                unified_item_data['时间'].append(items['时间'][i])
-                unified_item_data['日期'].append(date_str)
-                unified_item_data['归属配置组'].append(items['归属配置组'][i])
-        
         # 获取今天的数据
         today_duration, today_items = self._get_today_data()
         
+        # 记录已返回的今天物品数量，供增量同步游标使用
+        self.today_item_count = len(today_items) if today_duration > 0 and today_items else 0
+
         # 如果今天有数据，添加到结果中
-        if today_duration > 0 and today_items:
+        if self.today_item_count:
             # 将今天的数据添加到字典中
             date_duration_dict[self.today_str] = today_duration
-            
-            # 添加今天的物品数据（插入到最前面）
-            for item in today_items:
-                unified_item_data['物品名称'].insert(0, item.name)
-                unified_item_data['时间'].insert(0, item.timestamp)
-                unified_item_data['日期'].insert(0, item.date)
-                unified_item_data['归属配置组'].insert(0, item.config_group or '')
+
+            # 添加今天的物品数据（按时间倒序放在最前面）
+            today_item_data = build_item_columns(today_items)
+            unified_item_data = {key: today_item_data[key] + item_data[key] for key in item_data}
+        else:
+            unified_item_data = {key: list(values) for key, values in item_data.items()}
 
         # 按日期降序排列（最新的日期在前面）
         sorted_dates = sorted(date_duration_dict.keys(), reverse=True)
@@ -312,6 +440,42 @@ class LogDataManager:
         
         return filtered_logs
 
+    def get_sync_state(self) -> Dict[str, int]:
+        """
+        写入尚未入库的历史日志，并返回当前的增量同步状态
+
+        Returns:
+            Dict[str, int]: 包含 log_seq, item_seq, log_count 的字典
+        """
+        self.today_str = date.today().strftime('%Y%m%d')
+        self._ingest_new_log_files()
+        return self.db_manager.get_sync_state()
+
+    def get_changes_since(self, log_seq: int, item_seq: int) -> tuple[Dict[str, int], Dict[str, List]]:
+        """
+        获取指定同步序号之后新增的历史数据（不包括今天）
+
+        Args:
+            log_seq: 客户端已同步的log_files序号
+            item_seq: 客户端已同步的items序号
+
+        Returns:
+            tuple: (duration_data, item_data) 新增的持续时间与物品数据，物品数据为统一格式
+        """
+        duration_data = self.db_manager.get_duration_data_since(log_seq, exclude_today=True)
+        item_data = self.db_manager.get_item_data_since(item_seq, exclude_today=True)
+        return duration_data, item_data
+
+    def get_today_data(self) -> tuple[float, List]:
+        """
+        获取今天的数据（每次调用都会重新读取今天的日志）
+
+        Returns:
+            tuple: (duration, items) 今天的持续时间和物品列表，如果没有数据则返回(0, [])
+        """
+        self.today_str = date.today().strftime('%Y%m%d')
+        return self._get_today_data()
+
     def get_duration_data(self) -> Dict:
         """
         获取持续时间数据，返回标准格式
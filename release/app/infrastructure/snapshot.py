@@ -0,0 +1,64 @@
+"""
+快照文件模块
+负责计算结果快照的原子写入与读取，用于重启后的快速恢复
+"""
+import os
+import json
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('BetterGI初始化')
+
+# 快照格式版本号，格式不兼容时递增，旧快照会被忽略
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def write_snapshot(path: str, data: Dict[str, Any]) -> bool:
+    """
+    原子写入快照文件：先写入临时文件再替换，避免程序中断时留下损坏的快照
+
+    Args:
+        path: 快照文件路径
+        data: 快照内容
+
+    Returns:
+        bool: 操作是否成功
+    """
+    temp_path = f'{path}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'format': SNAPSHOT_FORMAT_VERSION, 'data': data}, file,
+                      ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, path)
+        return True
+    except Exception as e:
+        logger.error(f"写入快照文件 {path} 时发生错误: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+
+
+def read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """
+    读取快照文件
+
+    Args:
+        path: 快照文件路径
+
+    Returns:
+        Optional[Dict[str, Any]]: 快照内容，文件不存在、损坏或格式版本不匹配时返回None
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            snapshot = json.load(file)
+        if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT_VERSION:
+            logger.info(f"快照文件 {path} 格式版本不匹配，已忽略")
+            return None
+        return snapshot.get('data')
+    except Exception as e:
+        logger.error(f"读取快照文件 {path} 时发生错误: {e}")
+        return None
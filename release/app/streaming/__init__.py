@@ -1,5 +1,12 @@
 from app.streaming.streamer import StreamController
 from app.streaming.window_finder import WindowFinder
 from app.streaming.capture import FrameCapture, apply_yuanshen_privacy_masks
+from app.streaming.broadcaster import FrameBroadcaster
+from app.streaming.registry import StreamRegistry
+from app.streaming.masks import PrivacyMaskEngine
+from app.streaming.backends import Win32CaptureBackend, ReplayCaptureBackend
+from app.streaming.mosaic import MosaicCaptureBackend
 
-__all__ = ['StreamController', 'WindowFinder', 'FrameCapture', 'apply_yuanshen_privacy_masks']
+__all__ = ['StreamController', 'WindowFinder', 'FrameCapture', 'apply_yuanshen_privacy_masks', 'FrameBroadcaster',
+           'StreamRegistry', 'PrivacyMaskEngine', 'Win32CaptureBackend', 'ReplayCaptureBackend',
+           'MosaicCaptureBackend']
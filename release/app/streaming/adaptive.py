@@ -0,0 +1,70 @@
+from dataclasses import replace
+from typing import Tuple
+
+from app.streaming.profiles import StreamProfile
+
+
+class AdaptiveQualityController:
+    """自适应画质控制：客户端写入耗时持续超过帧预算时逐级降低分辨率与质量，恢复后逐级回升。"""
+
+    # 各降级档位：(缩放比例, JPEG质量降低量)
+    LEVELS: Tuple[Tuple[float, int], ...] = (
+        (1.0, 0),
+        (1.0, 15),
+        (0.75, 15),
+        (0.5, 25),
+        (0.35, 35),
+    )
+    MIN_QUALITY = 30
+
+    def __init__(self, base: StreamProfile, frame_budget: float, degrade_after: int = 3, recover_after: int = 30):
+        """
+        Args:
+            base: 客户端请求的画质配置
+            frame_budget: 单帧的写入预算（秒）
+            degrade_after: 连续多少帧超出预算后降级
+            recover_after: 连续多少帧在预算内后升级
+        """
+        self.base = base
+        self.frame_budget = frame_budget
+        self.degrade_after = degrade_after
+        self.recover_after = recover_after
+        self.level = 0
+        self._slow_frames = 0
+        self._fast_frames = 0
+
+    @property
+    def profile(self) -> StreamProfile:
+        scale, quality_drop = self.LEVELS[self.level]
+        if not self.level:
+            return self.base
+        return replace(
+            self.base,
+            scale=self.base.scale * scale,
+            quality=max(min(self.MIN_QUALITY, self.base.quality), self.base.quality - quality_drop)
+        )
+
+    def record(self, write_time: float) -> StreamProfile:
+        """
+        记录一帧的写入耗时并返回之后应使用的画质配置
+
+        Args:
+            write_time: 本帧写入客户端的耗时（秒）
+
+        Returns:
+            StreamProfile: 调整后的画质配置
+        """
+        if write_time > self.frame_budget:
+            self._slow_frames += 1
+            self._fast_frames = 0
+        else:
+            self._fast_frames += 1
+            self._slow_frames = 0
+
+        if self._slow_frames >= self.degrade_after and self.level < len(self.LEVELS) - 1:
+            self.level += 1
+            self._slow_frames = 0
+        elif self._fast_frames >= self.recover_after and self.level > 0:
+            self.level -= 1
+            self._fast_frames = 0
+        return self.profile
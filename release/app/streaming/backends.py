@@ -0,0 +1,253 @@
+import logging
+import os
+import threading
+from typing import List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from app.streaming.buffer_pool import FrameBufferPool
+from app.streaming.capture import FrameCapture
+from app.streaming.roi import CropBox, box_to_pixels
+from app.streaming.window_finder import WindowFinder, get_window_finder
+
+logger = logging.getLogger(__name__)
+
+DESKTOP_APP = '桌面.exe'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class CaptureBackend(Protocol):
+    """捕获后端：负责查找目标窗口与捕获画面，推流控制器只通过该接口访问平台相关的功能。"""
+
+    def find(self, target_app: str) -> int:
+        ...
+
+    def is_valid(self, hwnd: int) -> bool:
+        ...
+
+    def window_size(self, hwnd: int) -> Tuple[int, int]:
+        ...
+
+    def capture(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        """捕获一帧，指定归一化裁剪框 region 时只捕获该区域。"""
+        ...
+
+    def snapshot(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        """使用独立的资源捕获一帧，可以在推流进行中从其他线程调用。"""
+        ...
+
+    def release(self):
+        ...
+
+    def list_programs(self) -> List[str]:
+        ...
+
+
+class Win32CaptureBackend:
+    """基于 Win32 窗口枚举与 GDI 截图的捕获后端。"""
+
+    def __init__(self, finder: WindowFinder | None = None, capture: FrameCapture | None = None,
+                 pool: FrameBufferPool | None = None):
+        self.pool = pool or FrameBufferPool()
+        self.finder = finder or get_window_finder()
+        self.frame_capture = capture or FrameCapture(self.pool)
+
+    def find(self, target_app: str) -> int:
+        if target_app == DESKTOP_APP:
+            import win32gui
+            return win32gui.GetDesktopWindow()
+        return self.finder.find(target_app)
+
+    def is_valid(self, hwnd: int) -> bool:
+        import win32gui
+
+        if hwnd and hwnd == win32gui.GetDesktopWindow():
+            return True
+        return bool(hwnd and win32gui.IsWindow(hwnd) and win32gui.IsWindowVisible(hwnd))
+
+    def window_size(self, hwnd: int) -> Tuple[int, int]:
+        return self.frame_capture.window_size(hwnd)
+
+    def capture(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        return self.frame_capture.capture(hwnd, region)
+
+    def snapshot(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        capture = FrameCapture(self.pool)
+        try:
+            return capture.capture(hwnd, region)
+        finally:
+            capture.release()
+
+    def release(self):
+        # 在生产者线程中释放GDI资源，与创建时处于同一线程
+        self.frame_capture.release()
+
+    def list_programs(self) -> List[str]:
+        return self.finder.list_programs()
+
+
+class ReplayCaptureBackend:
+    """回放捕获后端：从图片目录、视频文件或合成画面产生固定分辨率的帧，不依赖 Win32。
+
+    用于在 Linux 上端到端运行和压测推流流程（变化检测、缩放、遮罩、编码与分发）。
+    motion 为每帧水平平移的像素数，设为0时画面静止。任何目标应用都视为已找到窗口。
+    """
+
+    def __init__(self, source: str = '', width: int = 1920, height: int = 1080, motion: float = 4.0,
+                 programs: Sequence[str] = ('yuanshen.exe',), pool: FrameBufferPool | None = None):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.motion = motion
+        self.programs = list(programs)
+        self.pool = pool
+        self.frame_count = 0
+        self._lock = threading.Lock()
+        self._images: Optional[List[np.ndarray]] = None
+        self._video = None
+        self._base: Optional[np.ndarray] = None
+
+    def find(self, target_app: str) -> int:
+        return 1
+
+    def is_valid(self, hwnd: int) -> bool:
+        return bool(hwnd)
+
+    def window_size(self, hwnd: int) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def capture(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        with self._lock:
+            base = self._next_source_frame()
+            if base is None:
+                return None
+            if region is not None:
+                return self._shift_region(base, region)
+            dst = self.pool.acquire(base.shape, base.dtype) if self.pool is not None else np.empty_like(base)
+            return self.shift_into(base, dst)
+
+    def _shift_region(self, base: np.ndarray, region: CropBox) -> np.ndarray:
+        """只拷贝平移后画面中裁剪框内的像素，开销与区域面积成正比。"""
+        x1, y1, x2, y2 = box_to_pixels(region, self.width, self.height)
+        offset = int(self.frame_count * self.motion) % self.width
+        self.frame_count += 1
+        shape = (y2 - y1, x2 - x1) + base.shape[2:]
+        dst = self.pool.acquire(shape, base.dtype) if self.pool is not None else np.empty(shape, base.dtype)
+        columns = (np.arange(x1, x2) + offset) % self.width
+        return np.take(base[y1:y2], columns, axis=1, out=dst)
+
+    def shift_into(self, base: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        """按当前帧序号平移画面并写入 dst，模拟画面运动，不产生中间数组。"""
+        offset = int(self.frame_count * self.motion) % self.width
+        self.frame_count += 1
+        dst[:, :self.width - offset] = base[:, offset:]
+        dst[:, self.width - offset:] = base[:, :offset]
+        return dst
+
+    def snapshot(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        return self.capture(hwnd, region)
+
+    def release(self):
+        with self._lock:
+            if self._video is not None:
+                self._video.release()
+                self._video = None
+
+    def list_programs(self) -> List[str]:
+        return list(self.programs)
+
+    def _fit(self, image: np.ndarray) -> np.ndarray:
+        import cv2
+
+        if image.shape[:2] != (self.height, self.width):
+            image = cv2.resize(image, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        return np.ascontiguousarray(image)
+
+    def _next_source_frame(self) -> Optional[np.ndarray]:
+        if not self.source:
+            if self._base is None:
+                self._base = self._synthetic_frame()
+            return self._base
+        if os.path.isdir(self.source):
+            if self._images is None:
+                self._images = self._load_images()
+            if not self._images:
+                return None
+            return self._images[self.frame_count % len(self._images)]
+        return self._read_video_frame()
+
+    def _synthetic_frame(self) -> np.ndarray:
+        """生成带渐变与网格的合成画面，内容足够复杂，编码耗时接近真实画面。"""
+        x = np.linspace(0, 255, self.width, dtype=np.float32)
+        y = np.linspace(0, 255, self.height, dtype=np.float32)[:, None]
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        frame[..., 0] = x
+        frame[..., 1] = y
+        frame[..., 2] = (x + y) / 2
+        frame[::64, :] = 255
+        frame[:, ::64] = 255
+        return frame
+
+    def _load_images(self) -> List[np.ndarray]:
+        import cv2
+
+        images = []
+        for name in sorted(os.listdir(self.source)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(self.source, name), cv2.IMREAD_COLOR)
+            if image is not None:
+                images.append(self._fit(image))
+        if not images:
+            logger.warning(f"回放目录 {self.source} 中没有可读取的图片")
+        return images
+
+    def _read_video_frame(self) -> Optional[np.ndarray]:
+        import cv2
+
+        if self._video is None:
+            self._video = cv2.VideoCapture(self.source)
+            if not self._video.isOpened():
+                logger.error(f"打开回放视频 {self.source} 时发生错误")
+                self._video = None
+                return None
+        ret, frame = self._video.read()
+        if not ret:
+            # 播放到结尾后从头循环
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._video.read()
+            if not ret:
+                return None
+        return self._fit(frame)
+
+
+def parse_frame_size(value: str) -> tuple:
+    """解析 1920x1080 格式的分辨率。"""
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def create_capture_backend(name: str = 'win32', source: str = '', size: str = '1920x1080',
+                           motion: float = 4.0) -> Optional[CaptureBackend]:
+    """
+    根据配置创建捕获后端
+
+    Args:
+        name: 后端名称，win32 或 replay
+        source: 回放来源，图片目录或视频文件路径，为空时使用合成画面
+        size: 回放分辨率，如 1920x1080
+        motion: 回放画面每帧平移的像素数
+
+    Returns:
+        Optional[CaptureBackend]: win32 时返回None，由推流控制器使用默认的 Win32 后端
+
+    Raises:
+        ValueError: 后端名称或分辨率无效时抛出
+    """
+    name = (name or 'win32').strip().lower()
+    if name == 'win32':
+        return None
+    if name == 'replay':
+        width, height = parse_frame_size(size)
+        return ReplayCaptureBackend(source, width, height, motion)
+    raise ValueError(f'未知的捕获后端 {name}，可选值: win32, replay')
@@ -0,0 +1,424 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+from app.streaming.change_detector import FrameChangeDetector
+from app.streaming.pacing import FramePacer, FrameStats
+
+logger = logging.getLogger(__name__)
+
+
+def build_multipart_chunk(frame_bytes: bytes, content_type: str = 'image/jpeg') -> bytes:
+    """把编码后的图像封装为 multipart/x-mixed-replace 的一个分段。"""
+    return (b'--frame\r\n'
+            b'Content-Type: ' + content_type.encode('ascii') + b'\r\n\r\n' + frame_bytes + b'\r\n')
+
+
+def parse_multipart_chunk(chunk: bytes) -> bytes:
+    """从 multipart 分段中取出编码后的图像数据，是 build_multipart_chunk 的逆操作。"""
+    header_end = chunk.index(b'\r\n\r\n') + 4
+    return chunk[header_end:-2]
+
+
+class StreamClient:
+    """单个客户端的推流状态。
+
+    每个客户端只持有所在频道最新一帧的位置（单槽信箱），写入缓慢时直接跳到最新帧，
+    过期帧被丢弃而不是排队，因此慢客户端不会拖慢生产者，也不会累积延迟。
+    """
+
+    def __init__(self, client_id: int, fps: float, channel: Hashable):
+        self.client_id = client_id
+        self.fps = fps
+        self.channel = channel
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.write_time = 0.0  # 写入耗时的指数移动平均（秒）
+        self.send_lag = 0.0  # 从帧发布到写入完成的耗时的指数移动平均（秒）
+        self.last_sequence = -1
+        self.due_at = 0.0  # 按客户端帧率下一次应取帧的时间（time.monotonic）
+        self.pending = False  # 槽中是否有到期后发布、尚未取走的帧
+
+    def record_publish(self, now: float) -> int:
+        """记录所在频道发布了新帧，返回因此被丢弃的帧数。
+
+        只有到期后发布的帧才需要发送：客户端为保持较低帧率而跳过的帧不算丢帧，
+        到期的帧在被取走之前又被新帧替换时才计为丢弃。
+        """
+        if now < self.due_at:
+            return 0
+        dropped = 1 if self.pending else 0
+        self.frames_dropped += dropped
+        self.pending = True
+        return dropped
+
+    def record_frame(self, sequence: int):
+        """记录发送的帧。"""
+        self.last_sequence = sequence
+        self.pending = False
+        self.frames_sent += 1
+
+    def record_write(self, write_time: float, send_lag: float = 0.0):
+        if self.frames_sent <= 1:
+            self.write_time, self.send_lag = write_time, send_lag
+        else:
+            self.write_time = self.write_time * 0.8 + write_time * 0.2
+            self.send_lag = self.send_lag * 0.8 + send_lag * 0.2
+
+    def to_dict(self) -> Dict[str, Any]:
+        channel = self.channel.to_dict() if hasattr(self.channel, 'to_dict') else self.channel
+        return {
+            'id': self.client_id,
+            'fps': self.fps,
+            'channel': channel,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'write_time_ms': round(self.write_time * 1000, 2),
+            'send_lag_ms': round(self.send_lag * 1000, 2),
+        }
+
+
+class FrameBroadcaster:
+    """帧广播器：单个生产者线程负责捕获与编码，所有客户端共享同一份分段数据。
+
+    生产者在第一个客户端订阅时启动，最后一个客户端断开后停止。
+    生产帧率取所有客户端请求帧率中的最大值，请求较低帧率的客户端会跳过多余的帧。
+    客户端按频道（如画质配置）订阅，每帧只捕获一次，并为每个有客户端的频道各编码一次。
+    配置了变化检测时，画面未变化的帧不再编码和发送，只按保活间隔重新编码发送一次。
+
+    encode_workers 大于0时以流水线方式运行：生产者线程只负责捕获，连续多帧交给编码线程池并行处理
+    （OpenCV 在缩放和编码时会释放GIL），发布线程按帧顺序发布结果，各阶段之间通过有界队列衔接，
+    吞吐量取决于最慢的阶段而不是各阶段耗时之和。
+    """
+
+    def __init__(self, produce_frame: Callable[[], Any], render_chunk: Callable[[Any, Hashable], Optional[bytes]],
+                 name: str = '', fps: float = 30, on_start: Callable[[], None] | None = None,
+                 on_stop: Callable[[], None] | None = None, change_detector: FrameChangeDetector | None = None,
+                 keepalive_interval: float = 1.0, encode_workers: int = 0,
+                 release_frame: Callable[[Any], None] | None = None,
+                 on_publish: Callable[[Dict[Hashable, bytes]], None] | None = None):
+        self._produce_frame = produce_frame
+        self._render_chunk = render_chunk
+        self._on_start = on_start
+        self._on_stop = on_stop
+        self.name = name
+        self.default_fps = fps
+        self.pacer = FramePacer(fps)
+        self.stats = FrameStats()
+        self.change_detector = change_detector
+        self.keepalive_interval = keepalive_interval
+        self.encode_workers = encode_workers
+        self._release_frame = release_frame  # 帧处理完毕后回调，用于归还缓冲区
+        self._on_publish = on_publish  # 每帧发布后回调，参数为实际发布的各频道分段数据
+        self._last_publish = 0.0
+        self._requested_fps = Counter()  # 各客户端请求的帧率
+        self._channels = Counter()  # 各频道的客户端数量
+        self._clients: Dict[int, StreamClient] = {}
+        self._client_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._latest: Dict[Hashable, Tuple[int, bytes, float]] = {}  # 频道 -> (帧序号, 分段数据, 发布时间)
+        self._sequence = 0
+        self._subscribers = 0
+        self._generation = 0  # 每次启动生产者递增，用于让过期的生产者线程退出
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    @property
+    def subscriber_count(self) -> int:
+        return self._subscribers
+
+    @property
+    def target_fps(self) -> float:
+        return self.pacer.fps
+
+    @property
+    def channels(self) -> list:
+        with self._condition:
+            return list(self._channels)
+
+    def clients(self) -> list:
+        with self._condition:
+            return [client.to_dict() for client in self._clients.values()]
+
+    def subscribe(self, fps: float | None = None, channel: Hashable = None,
+                  channel_controller: Any = None) -> Iterator[bytes]:
+        """订阅帧流，返回逐帧产出 multipart 分段的生成器。
+
+        订阅在生成器开始迭代时才生效，未被迭代的生成器不会占用观看人数。
+
+        Args:
+            fps: 客户端请求的帧率，为空时使用默认帧率
+            channel: 订阅的频道，相同频道的客户端共享编码结果
+            channel_controller: 可选的频道控制器，其 record(写入耗时) 返回之后应订阅的频道，
+                用于根据客户端的写入速度自适应调整画质
+        """
+        fps = fps or self.default_fps
+        min_interval = 1 / fps
+        with self._condition:
+            self._subscribers += 1
+            self._requested_fps[fps] += 1
+            self._channels[channel] += 1
+            if not self._running:
+                self._start_locked()
+            self._update_target_fps_locked()
+            generation = self._generation
+            client = StreamClient(next(self._client_ids), fps, channel)
+            self._clients[client.client_id] = client
+        logger.info(f"客户端加入推流 - 目标应用: {self.name}，当前观看人数: {self._subscribers}")
+        last_sequence = -1
+        next_due = 0.0
+        try:
+            while True:
+                with self._condition:
+                    # 客户端请求的帧率低于生产帧率时，等到该客户端的下一帧时间再取帧
+                    remaining = next_due - time.monotonic()
+                    while remaining > 0 and self._is_current(generation):
+                        self._condition.wait(timeout=remaining)
+                        remaining = next_due - time.monotonic()
+                    self._condition.wait_for(
+                        lambda: self._has_new_frame(channel, last_sequence) or not self._is_current(generation),
+                        timeout=1.0
+                    )
+                    if not self._is_current(generation):
+                        break
+                    if not self._has_new_frame(channel, last_sequence):
+                        continue
+                    last_sequence, chunk, published_at = self._latest[channel]
+                    client.record_frame(last_sequence)
+                    # 留出少量余量，避免与生产帧率相同时因调度抖动而漏帧
+                    next_due = time.monotonic() + min_interval * 0.9
+                    client.due_at = next_due
+                # 生成器恢复执行前服务器会把分段写入套接字，两次迭代之间的耗时即为写入耗时
+                write_started = time.perf_counter()
+                yield chunk
+                write_time = time.perf_counter() - write_started
+                client.record_write(write_time, time.monotonic() - published_at)
+                self.stats.record_sent_bytes(len(chunk))
+                if channel_controller is not None:
+                    new_channel = channel_controller.record(write_time)
+                    if new_channel != channel:
+                        self._switch_channel(generation, client, channel, new_channel)
+                        channel = new_channel
+        except GeneratorExit:
+            logger.info(f"检测到客户端断开连接 - 目标应用: {self.name}")
+        finally:
+            self._unsubscribe(generation, fps, channel)
+            with self._condition:
+                self._clients.pop(client.client_id, None)
+
+    def _switch_channel(self, generation: int, client: StreamClient, old: Hashable, new: Hashable):
+        with self._condition:
+            if self._generation != generation:
+                return
+            self._release_channel_locked(old)
+            self._channels[new] += 1
+            client.channel = new
+            client.pending = False
+        logger.debug(f"客户端 {client.client_id} 切换画质 - 目标应用: {self.name}，新配置: {new}")
+
+    def _has_new_frame(self, channel: Hashable, last_sequence: int) -> bool:
+        # 新加入的客户端立即收到该频道最近一帧，之后只在有新帧时唤醒
+        latest = self._latest.get(channel)
+        return latest is not None and latest[0] != last_sequence
+
+    def _is_current(self, generation: int) -> bool:
+        return self._running and self._generation == generation
+
+    def _unsubscribe(self, generation: int, fps: float, channel: Hashable):
+        with self._condition:
+            if self._generation != generation:
+                return
+            self._subscribers = max(0, self._subscribers - 1)
+            if fps in self._requested_fps:
+                self._requested_fps[fps] -= 1
+                if self._requested_fps[fps] <= 0:
+                    del self._requested_fps[fps]
+            self._release_channel_locked(channel)
+            if self._subscribers <= 0 and self._running:
+                self._stop_locked()
+                logger.info(f"最后一个客户端已断开，停止推流 - 目标应用: {self.name}")
+            else:
+                self._update_target_fps_locked()
+
+    def _release_channel_locked(self, channel: Hashable):
+        if channel not in self._channels:
+            return
+        self._channels[channel] -= 1
+        if self._channels[channel] <= 0:
+            del self._channels[channel]
+            self._latest.pop(channel, None)
+
+    def _update_target_fps_locked(self):
+        self.pacer.fps = max(self._requested_fps, default=self.default_fps)
+
+    def _start_locked(self):
+        self._generation += 1
+        self._running = True
+        self._latest = {}
+        self._thread = threading.Thread(
+            target=self._run, args=(self._generation, self._thread),
+            name=f'stream-producer-{self.name}', daemon=True
+        )
+        self._thread.start()
+
+    def _stop_locked(self):
+        # 递增代数，已停止的客户端之后退出时不会再减少新一轮推流的计数
+        self._generation += 1
+        self._running = False
+        self._subscribers = 0
+        self._requested_fps.clear()
+        self._channels.clear()
+        self._condition.notify_all()
+
+    def stop(self):
+        """停止生产者并结束所有客户端的帧流。"""
+        with self._condition:
+            if self._running:
+                self._stop_locked()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.snapshot()
+        stats['target_fps'] = self.target_fps
+        return stats
+
+    def latest_chunks(self) -> Dict[Hashable, Tuple[int, bytes]]:
+        """返回各频道最近一帧的 (帧序号, 分段数据)，未运行时为空。"""
+        with self._condition:
+            if not self._running:
+                return {}
+            return {channel: (sequence, chunk) for channel, (sequence, chunk, _) in self._latest.items()}
+
+    def publish(self, chunks: Dict[Hashable, Optional[bytes]]):
+        """发布一帧在各频道的分段数据。"""
+        published = {}
+        now = time.monotonic()
+        with self._condition:
+            self._sequence += 1
+            for channel, chunk in chunks.items():
+                if chunk and channel in self._channels:
+                    self._latest[channel] = (self._sequence, chunk, now)
+                    published[channel] = chunk
+            dropped = sum(client.record_publish(now) for client in self._clients.values()
+                          if client.channel in published)
+            self.stats.record_dropped(dropped)
+            self._condition.notify_all()
+        if published and self._on_publish is not None:
+            try:
+                self._on_publish(published)
+            except Exception as e:
+                logger.error(f"处理已发布的视频帧时发生错误: {e}")
+
+    def publish_all(self, chunk: bytes):
+        """向所有频道发布同一份分段数据，用于与画质无关的占位画面。"""
+        with self._condition:
+            channels = list(self._channels)
+        self.publish({channel: chunk for channel in channels})
+
+    def _should_publish(self, frame: Any) -> bool:
+        """画面变化、到达保活间隔或有频道尚无画面时才编码并发布。"""
+        now = time.monotonic()
+        changed = self.change_detector is None or self.change_detector.has_changed(frame)
+        if not changed and now - self._last_publish < self.keepalive_interval:
+            with self._condition:
+                if all(channel in self._latest for channel in self._channels):
+                    return False
+        self._last_publish = now
+        return True
+
+    def _render_channels(self, frame: Any) -> Dict[Hashable, Optional[bytes]]:
+        chunks = {}
+        try:
+            for channel in self.channels:
+                try:
+                    started = time.perf_counter()
+                    chunks[channel] = self._render_chunk(frame, channel)
+                    if chunks[channel]:
+                        self.stats.record_encode(time.perf_counter() - started, len(chunks[channel]))
+                except Exception as e:
+                    logger.error(f"编码视频帧时发生错误: {e}")
+        finally:
+            self._done_with_frame(frame)
+        return chunks
+
+    def _done_with_frame(self, frame: Any):
+        if self._release_frame is not None:
+            self._release_frame(frame)
+
+    def _run(self, generation: int, previous: Optional[threading.Thread]):
+        if previous is not None:
+            # 等待上一轮的生产者退出，避免两个线程同时捕获同一目标
+            previous.join(timeout=5)
+        logger.info(f"开始推流 - 目标应用: {self.name}")
+        executor = None
+        pending = None
+        publisher = None
+        if self.encode_workers > 0:
+            executor = ThreadPoolExecutor(max_workers=self.encode_workers,
+                                          thread_name_prefix=f'stream-encoder-{self.name}')
+            # 编码中的帧数上限，队列满时生产者阻塞，形成背压
+            pending = queue.Queue(maxsize=self.encode_workers + 1)
+            publisher = threading.Thread(target=self._publish_results, args=(pending, generation),
+                                         name=f'stream-publisher-{self.name}', daemon=True)
+            publisher.start()
+        try:
+            if self._on_start:
+                self._on_start()
+            self.stats.reset()
+            self.pacer.reset()
+            if self.change_detector is not None:
+                self.change_detector.reset()
+            while self._is_current(generation):
+                try:
+                    started = time.perf_counter()
+                    frame = self._produce_frame()
+                    if frame is not None:
+                        self.stats.record_capture(time.perf_counter() - started)
+                    if frame is not None and not self._is_current(generation):
+                        self._done_with_frame(frame)
+                    elif frame is not None:
+                        if not self._should_publish(frame):
+                            self._done_with_frame(frame)
+                            self.stats.record_unchanged()
+                        elif executor is None:
+                            self.publish(self._render_channels(frame))
+                            self.stats.record(time.perf_counter() - started)
+                        else:
+                            pending.put((executor.submit(self._render_channels, frame), started))
+                    self.stats.record_skipped(self.pacer.wait())
+                except Exception as e:
+                    logger.error(f"生成视频帧时发生错误: {e}")
+                    time.sleep(0.1)
+        finally:
+            if executor is not None:
+                # 等待已提交的帧处理完毕，再释放捕获资源
+                pending.put(None)
+                publisher.join()
+                executor.shutdown(wait=True)
+            if self._on_stop:
+                self._on_stop()
+            logger.info(f"推流已停止 - 目标应用: {self.name}")
+
+    def _publish_results(self, pending: queue.Queue, generation: int):
+        """按提交顺序等待编码结果并发布，收到 None 时退出。"""
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            future, started = item
+            try:
+                chunks = future.result()
+            except Exception as e:
+                logger.error(f"编码视频帧时发生错误: {e}")
+                continue
+            if self._is_current(generation):
+                self.publish(chunks)
+                self.stats.record(time.perf_counter() - started)
@@ -0,0 +1,68 @@
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+class FrameBufferPool:
+    """帧缓冲池：按形状复用大块画面缓冲区，稳定推流时不再产生大块内存分配。
+
+    只回收由本池分配的缓冲区，其他数组传入 release 时会被忽略。
+    """
+
+    def __init__(self, max_per_shape: int = 8, max_shapes: int = 8):
+        """
+        Args:
+            max_per_shape: 每种形状最多保留的空闲缓冲区数量
+            max_shapes: 最多保留空闲缓冲区的形状数量，超出时丢弃最久未使用的形状
+        """
+        self.max_per_shape = max_per_shape
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._free: 'OrderedDict[Tuple[Tuple[int, ...], str], List[np.ndarray]]' = OrderedDict()
+        self._owned: Dict[int, weakref.ref] = {}  # 本池分配的缓冲区，使用弱引用避免 id 被复用后误判
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self._free.move_to_end(key)
+                self.reused += 1
+                return free.pop()
+            buffer = np.empty(shape, dtype=dtype)
+            self._owned[id(buffer)] = weakref.ref(buffer, lambda _, key=id(buffer): self._owned.pop(key, None))
+            self.allocated += 1
+            return buffer
+
+    def release(self, buffer: Any):
+        if not isinstance(buffer, np.ndarray):
+            return
+        key = (buffer.shape, buffer.dtype.str)
+        with self._lock:
+            owner = self._owned.get(id(buffer))
+            if owner is None or owner() is not buffer:
+                return
+            free = self._free.setdefault(key, [])
+            self._free.move_to_end(key)
+            if len(free) < self.max_per_shape and not any(item is buffer for item in free):
+                free.append(buffer)
+
+            while len(self._free) > self.max_shapes:
+                self._free.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'allocated': self.allocated,
+                'reused': self.reused,
+                'free': sum(len(free) for free in self._free.values()),
+            }
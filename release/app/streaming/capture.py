@@ -1,135 +1,299 @@
 import logging
 import ctypes
+import threading
+from typing import Optional, Tuple
 
 import numpy as np
 
+from app.streaming.buffer_pool import FrameBufferPool
+from app.streaming.masks import get_mask_engine
+from app.streaming.roi import CropBox, box_to_pixels
+
 logger = logging.getLogger(__name__)
 
+SRCCOPY = 0x00CC0020
+DIB_RGB_COLORS = 0
+BI_RGB = 0
 
-def apply_yuanshen_privacy_masks(img: np.ndarray, width: int, height: int) -> np.ndarray:
-    import cv2
+_dpi_lock = threading.Lock()
+_dpi_awareness_enabled = False
+_gdi_functions = None
+
+
+def enable_dpi_awareness():
+    """设置进程的DPI感知，只在第一次调用时生效。"""
+    global _dpi_awareness_enabled
+    with _dpi_lock:
+        if _dpi_awareness_enabled:
+            return
+        _dpi_awareness_enabled = True
+        try:
+            ctypes.windll.shcore.SetProcessDpiAwareness(2)
+        except Exception:
+            try:
+                ctypes.windll.user32.SetProcessDPIAware()
+            except Exception:
+                pass
+
+
+def _load_gdi():
+    """加载并声明捕获所需的 user32/gdi32 函数签名，避免64位句柄被截断。"""
+    global _gdi_functions
+    if _gdi_functions is not None:
+        return _gdi_functions
+
+    from ctypes import wintypes
+
+    user32 = ctypes.WinDLL('user32', use_last_error=True)
+    gdi32 = ctypes.WinDLL('gdi32', use_last_error=True)
 
-    base_width, base_height = 3840, 2160
-    scale_x = width / base_width
-    scale_y = height / base_height
+    user32.GetDC.argtypes = [wintypes.HWND]
+    user32.GetDC.restype = wintypes.HDC
+    user32.GetWindowDC.argtypes = [wintypes.HWND]
+    user32.GetWindowDC.restype = wintypes.HDC
+    user32.ReleaseDC.argtypes = [wintypes.HWND, wintypes.HDC]
+    user32.ReleaseDC.restype = ctypes.c_int
+    gdi32.CreateCompatibleDC.argtypes = [wintypes.HDC]
+    gdi32.CreateCompatibleDC.restype = wintypes.HDC
+    gdi32.CreateCompatibleBitmap.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int]
+    gdi32.CreateCompatibleBitmap.restype = wintypes.HBITMAP
+    gdi32.SelectObject.argtypes = [wintypes.HDC, wintypes.HGDIOBJ]
+    gdi32.SelectObject.restype = wintypes.HGDIOBJ
+    gdi32.DeleteObject.argtypes = [wintypes.HGDIOBJ]
+    gdi32.DeleteObject.restype = wintypes.BOOL
+    gdi32.DeleteDC.argtypes = [wintypes.HDC]
+    gdi32.DeleteDC.restype = wintypes.BOOL
+    gdi32.BitBlt.argtypes = [wintypes.HDC, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                             wintypes.HDC, ctypes.c_int, ctypes.c_int, wintypes.DWORD]
+    gdi32.BitBlt.restype = wintypes.BOOL
+    gdi32.GetDIBits.argtypes = [wintypes.HDC, wintypes.HBITMAP, wintypes.UINT, wintypes.UINT,
+                                ctypes.c_void_p, ctypes.c_void_p, wintypes.UINT]
+    gdi32.GetDIBits.restype = ctypes.c_int
 
-    regions = [
-        (222, 374, 583, 448),
-        (3346, 2087, 3731, 2149),
+    _gdi_functions = (user32, gdi32)
+    return _gdi_functions
+
+
+class BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [
+        ('biSize', ctypes.c_uint32),
+        ('biWidth', ctypes.c_int32),
+        ('biHeight', ctypes.c_int32),
+        ('biPlanes', ctypes.c_uint16),
+        ('biBitCount', ctypes.c_uint16),
+        ('biCompression', ctypes.c_uint32),
+        ('biSizeImage', ctypes.c_uint32),
+        ('biXPelsPerMeter', ctypes.c_int32),
+        ('biYPelsPerMeter', ctypes.c_int32),
+        ('biClrUsed', ctypes.c_uint32),
+        ('biClrImportant', ctypes.c_uint32),
     ]
 
-    for x1, y1, x2, y2 in regions:
-        rx1 = max(0, min(int(x1 * scale_x), width))
-        ry1 = max(0, min(int(y1 * scale_y), height))
-        rx2 = max(0, min(int(x2 * scale_x), width))
-        ry2 = max(0, min(int(y2 * scale_y), height))
-        if rx2 > rx1 and ry2 > ry1:
-            cv2.rectangle(img, (rx1, ry1), (rx2, ry2), (0, 0, 0), -1)
 
-    return img
+class BITMAPINFO(ctypes.Structure):
+    _fields_ = [('bmiHeader', BITMAPINFOHEADER), ('bmiColors', ctypes.c_uint32 * 3)]
+
+
+def apply_yuanshen_privacy_masks(img: np.ndarray, width: int, height: int) -> np.ndarray:
+    """使用默认遮罩定义遮挡原神画面中的隐私区域，保留以兼容旧调用方。"""
+    return get_mask_engine().apply('yuanshen.exe', img, width, height)
+
+
+class GdiCaptureSession:
+    """GDI捕获会话：跨帧复用设备上下文、位图和输出缓冲区。
+
+    只在目标窗口或捕获尺寸变化时重建GDI对象；GetDC 与 ReleaseDC 需要在同一线程调用，
+    因此会话应由单个捕获线程使用并在该线程中释放。
+    """
+
+    def __init__(self):
+        self._key = None
+        self._dc_owner = None
+        self._source_dc = None
+        self._mem_dc = None
+        self._bitmap = None
+        self._previous_bitmap = None
+        self._bitmap_info = None
+        self.buffer: np.ndarray | None = None
+        self.recreate_count = 0
+
+    def grab(self, hwnd: int, width: int, height: int, origin: tuple = (0, 0), desktop: bool = False) -> np.ndarray:
+        """
+        捕获一帧到复用的BGRA缓冲区
+
+        Args:
+            hwnd: 目标窗口句柄
+            width: 捕获宽度
+            height: 捕获高度
+            origin: 源设备上下文中的起点坐标
+            desktop: 是否捕获整个虚拟桌面
+
+        Returns:
+            np.ndarray: 形状为 (height, width, 4) 的BGRA缓冲区，下一帧会被覆盖
+        """
+        key = (hwnd, width, height, desktop)
+        if key != self._key:
+            self._recreate(hwnd, width, height, desktop)
+
+        _, gdi32 = _load_gdi()
+        if not gdi32.BitBlt(self._mem_dc, 0, 0, width, height, self._source_dc, origin[0], origin[1], SRCCOPY):
+            raise ctypes.WinError(ctypes.get_last_error())
+        lines = gdi32.GetDIBits(self._mem_dc, self._bitmap, 0, height, self.buffer.ctypes.data,
+                                ctypes.byref(self._bitmap_info), DIB_RGB_COLORS)
+        if lines != height:
+            raise OSError(f'GetDIBits 只读取了 {lines}/{height} 行')
+        return self.buffer
+
+    def _recreate(self, hwnd: int, width: int, height: int, desktop: bool):
+        self.release()
+        user32, gdi32 = _load_gdi()
+
+        self._dc_owner = 0 if desktop else hwnd
+        self._source_dc = user32.GetDC(0) if desktop else user32.GetWindowDC(hwnd)
+        if not self._source_dc:
+            raise ctypes.WinError(ctypes.get_last_error())
+        self._mem_dc = gdi32.CreateCompatibleDC(self._source_dc)
+        self._bitmap = gdi32.CreateCompatibleBitmap(self._source_dc, width, height)
+        if not self._mem_dc or not self._bitmap:
+            self.release()
+            raise ctypes.WinError(ctypes.get_last_error())
+        self._previous_bitmap = gdi32.SelectObject(self._mem_dc, self._bitmap)
+
+        bitmap_info = BITMAPINFO()
+        bitmap_info.bmiHeader.biSize = ctypes.sizeof(BITMAPINFOHEADER)
+        bitmap_info.bmiHeader.biWidth = width
+        bitmap_info.bmiHeader.biHeight = -height  # 负高度表示自上而下的行顺序
+        bitmap_info.bmiHeader.biPlanes = 1
+        bitmap_info.bmiHeader.biBitCount = 32
+        bitmap_info.bmiHeader.biCompression = BI_RGB
+        self._bitmap_info = bitmap_info
+        self.buffer = np.empty((height, width, 4), dtype=np.uint8)
+
+        self._key = (hwnd, width, height, desktop)
+        self.recreate_count += 1
+        logger.debug(f"重建GDI捕获资源 - 窗口句柄: {hwnd}，尺寸: {width}x{height}")
+
+    def release(self):
+        """释放所有GDI对象，下次捕获时重新创建。"""
+        if self._source_dc is None:
+            self._key = None
+            return
+        try:
+            user32, gdi32 = _load_gdi()
+            if self._mem_dc:
+                if self._previous_bitmap:
+                    gdi32.SelectObject(self._mem_dc, self._previous_bitmap)
+                gdi32.DeleteDC(self._mem_dc)
+            if self._bitmap:
+                gdi32.DeleteObject(self._bitmap)
+            user32.ReleaseDC(self._dc_owner, self._source_dc)
+        except Exception as e:
+            logger.error(f"释放GDI捕获资源时发生错误: {e}")
+        finally:
+            self._key = None
+            self._dc_owner = None
+            self._source_dc = None
+            self._mem_dc = None
+            self._bitmap = None
+            self._previous_bitmap = None
 
 
 class FrameCapture:
-    """负责桌面与窗口截图。"""
+    """负责桌面与窗口截图，GDI资源通过 GdiCaptureSession 跨帧复用。
+
+    BGRA画面由 GetDIBits 直接写入会话的预分配缓冲区，再转换到缓冲池中的BGR缓冲区，
+    使用方处理完画面后应把它归还给缓冲池。
+    """
 
-    def capture(self, hwnd: int, target_app: str = '') -> np.ndarray:
+    def __init__(self, pool: FrameBufferPool | None = None):
+        self.session = GdiCaptureSession()
+        self.pool = pool or FrameBufferPool()
+
+    def capture(self, hwnd: int, region: Optional[CropBox] = None) -> np.ndarray:
+        """捕获原始画面，隐私遮罩在缩放后由推流控制器应用。
+
+        指定归一化裁剪框 region 时只拷贝该区域的像素，之后的颜色转换与编码开销与区域面积成正比。
+        """
         try:
             import win32gui
 
             if hwnd == win32gui.GetDesktopWindow():
-                return self._capture_desktop()
-            return self._capture_normal_window(hwnd, target_app)
+                return self._capture_desktop(hwnd, region)
+            return self._capture_normal_window(hwnd, region)
         except Exception as e:
             logger.error(f"捕获窗口时发生错误: {e}")
             return np.zeros((480, 640, 3), dtype=np.uint8)
 
-    def _enable_dpi_awareness(self):
-        try:
-            ctypes.windll.shcore.SetProcessDpiAwareness(2)
-        except Exception:
-            try:
-                ctypes.windll.user32.SetProcessDPIAware()
-            except Exception:
-                pass
+    def release(self):
+        self.session.release()
+
+    def _to_bgr(self, img: np.ndarray) -> np.ndarray:
+        import cv2
+
+        height, width = img.shape[:2]
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR, dst=self.pool.acquire((height, width, 3)))
 
-    def _capture_desktop(self) -> np.ndarray:
+    def window_size(self, hwnd: int) -> Tuple[int, int]:
+        """返回窗口（桌面时为虚拟桌面）的尺寸，失败时返回 (0, 0)。"""
         try:
-            import cv2
-            import win32api
-            import win32con
             import win32gui
-            import win32ui
-
-            self._enable_dpi_awareness()
-            screen_width = win32api.GetSystemMetrics(win32con.SM_CXVIRTUALSCREEN)
-            screen_height = win32api.GetSystemMetrics(win32con.SM_CYVIRTUALSCREEN)
-            screen_left = win32api.GetSystemMetrics(win32con.SM_XVIRTUALSCREEN)
-            screen_top = win32api.GetSystemMetrics(win32con.SM_YVIRTUALSCREEN)
-
-            if screen_width == 0 or screen_height == 0:
-                screen_width = win32api.GetSystemMetrics(win32con.SM_CXSCREEN)
-                screen_height = win32api.GetSystemMetrics(win32con.SM_CYSCREEN)
-                screen_left, screen_top = 0, 0
-
-            desktop_dc = win32gui.GetDC(0)
-            img_dc = win32ui.CreateDCFromHandle(desktop_dc)
-            mem_dc = img_dc.CreateCompatibleDC()
-            screenshot = win32ui.CreateBitmap()
-            screenshot.CreateCompatibleBitmap(img_dc, screen_width, screen_height)
-            mem_dc.SelectObject(screenshot)
-            mem_dc.BitBlt((0, 0), (screen_width, screen_height), img_dc, (screen_left, screen_top), win32con.SRCCOPY)
-
-            bmpstr = screenshot.GetBitmapBits(True)
-            img = np.frombuffer(bmpstr, dtype='uint8')
-            img.shape = (screen_height, screen_width, 4)
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-
-            mem_dc.DeleteDC()
-            img_dc.DeleteDC()
-            win32gui.ReleaseDC(0, desktop_dc)
-            win32gui.DeleteObject(screenshot.GetHandle())
-            return img
+
+            enable_dpi_awareness()
+            if hwnd == win32gui.GetDesktopWindow():
+                return self._desktop_rect()[2:]
+            left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+            return right - left, bottom - top
+        except Exception as e:
+            logger.error(f"获取窗口尺寸时发生错误: {e}")
+            return 0, 0
+
+    @staticmethod
+    def _desktop_rect() -> Tuple[int, int, int, int]:
+        import win32api
+        import win32con
+
+        screen_width = win32api.GetSystemMetrics(win32con.SM_CXVIRTUALSCREEN)
+        screen_height = win32api.GetSystemMetrics(win32con.SM_CYVIRTUALSCREEN)
+        screen_left = win32api.GetSystemMetrics(win32con.SM_XVIRTUALSCREEN)
+        screen_top = win32api.GetSystemMetrics(win32con.SM_YVIRTUALSCREEN)
+
+        if screen_width == 0 or screen_height == 0:
+            screen_width = win32api.GetSystemMetrics(win32con.SM_CXSCREEN)
+            screen_height = win32api.GetSystemMetrics(win32con.SM_CYSCREEN)
+            screen_left, screen_top = 0, 0
+        return screen_left, screen_top, screen_width, screen_height
+
+    def _capture_desktop(self, hwnd: int, region: Optional[CropBox] = None) -> np.ndarray:
+        try:
+            enable_dpi_awareness()
+            screen_left, screen_top, screen_width, screen_height = self._desktop_rect()
+            x1, y1, x2, y2 = box_to_pixels(region, screen_width, screen_height) if region else (
+                0, 0, screen_width, screen_height)
+
+            img = self.session.grab(hwnd, x2 - x1, y2 - y1, origin=(screen_left + x1, screen_top + y1), desktop=True)
+            return self._to_bgr(img)
         except Exception as e:
             logger.error(f"捕获桌面时发生错误: {e}")
+            self.session.release()
             return np.zeros((720, 1280, 3), dtype=np.uint8)
 
-    def _capture_normal_window(self, hwnd: int, target_app: str) -> np.ndarray:
+    def _capture_normal_window(self, hwnd: int, region: Optional[CropBox] = None) -> np.ndarray:
         try:
-            import cv2
-            import win32con
             import win32gui
-            import win32ui
 
             if not hwnd or not win32gui.IsWindow(hwnd) or not win32gui.IsWindowVisible(hwnd):
                 return np.zeros((480, 640, 3), dtype=np.uint8)
 
-            self._enable_dpi_awareness()
+            enable_dpi_awareness()
             left, top, right, bottom = win32gui.GetWindowRect(hwnd)
             width, height = right - left, bottom - top
             if width <= 0 or height <= 0:
                 return np.zeros((480, 640, 3), dtype=np.uint8)
 
-            hwnd_dc = win32gui.GetWindowDC(hwnd)
-            mfc_dc = win32ui.CreateDCFromHandle(hwnd_dc)
-            save_dc = mfc_dc.CreateCompatibleDC()
-            save_bitmap = win32ui.CreateBitmap()
-            save_bitmap.CreateCompatibleBitmap(mfc_dc, width, height)
-            save_dc.SelectObject(save_bitmap)
-            save_dc.BitBlt((0, 0), (width, height), mfc_dc, (0, 0), win32con.SRCCOPY)
-
-            bmpstr = save_bitmap.GetBitmapBits(True)
-            img = np.frombuffer(bmpstr, dtype='uint8')
-            img.shape = (height, width, 4)
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-
-            if target_app == 'yuanshen.exe':
-                img = apply_yuanshen_privacy_masks(img, width, height)
-
-            win32gui.DeleteObject(save_bitmap.GetHandle())
-            save_dc.DeleteDC()
-            mfc_dc.DeleteDC()
-            win32gui.ReleaseDC(hwnd, hwnd_dc)
-            return img
+            x1, y1, x2, y2 = box_to_pixels(region, width, height) if region else (0, 0, width, height)
+            img = self.session.grab(hwnd, x2 - x1, y2 - y1, origin=(x1, y1))
+            return self._to_bgr(img)
         except Exception as e:
             logger.error(f"捕获普通窗口时发生错误: {e}")
+            self.session.release()
             return np.zeros((480, 640, 3), dtype=np.uint8)
@@ -0,0 +1,42 @@
+from typing import Optional
+
+import numpy as np
+
+
+class FrameChangeDetector:
+    """帧变化检测：在跨步降采样的视图上计算与参考帧的平均绝对差。
+
+    参考帧只在检测到变化时更新，因此缓慢累积的变化最终也会超过阈值。
+    """
+
+    def __init__(self, threshold: float = 1.0, stride: int = 8):
+        """
+        Args:
+            threshold: 平均绝对差（0-255）超过该值视为画面变化，小于等于0时关闭检测
+            stride: 降采样的跨步
+        """
+        self.threshold = threshold
+        self.stride = max(1, stride)
+        self._reference: Optional[np.ndarray] = None
+
+    def reset(self):
+        self._reference = None
+
+    def has_changed(self, frame: np.ndarray) -> bool:
+        import cv2
+
+        if self.threshold <= 0:
+            return True
+
+        # 复制降采样结果，避免参考帧与之后会被原地修改的画面共享内存
+        sample = frame[::self.stride, ::self.stride].copy()
+        reference = self._reference
+        if reference is None or reference.shape != sample.shape:
+            self._reference = sample
+            return True
+
+        difference = float(cv2.absdiff(sample, reference).mean())
+        if difference <= self.threshold:
+            return False
+        self._reference = sample
+        return True
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.streaming.broadcaster import parse_multipart_chunk
+
+
+class FrameRingBuffer:
+    """推流回放缓冲区：以降低后的帧率保存最近若干秒已编码的分段数据。
+
+    直接保存推流发布的 multipart 分段，不产生额外的捕获与编码；
+    超出时间窗口或内存预算的最早帧被丢弃。
+    """
+
+    def __init__(self, seconds: float = 30.0, fps: float = 5.0, max_bytes: int = 64 * 1024 * 1024,
+                 clock: Callable[[], float] = time.monotonic):
+        self.seconds = seconds
+        self.interval = 1 / fps
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._frames: deque = deque()  # (时间戳, 分段数据)
+        self._bytes = 0
+        self._last_added: Optional[float] = None
+
+    def due(self) -> bool:
+        """距上次保存已达到保存间隔时返回真，调用方据此跳过多余的帧。"""
+        # 留出少量余量，避免与推流帧率成整数倍时因调度抖动而漏帧
+        return self._last_added is None or self._clock() - self._last_added >= self.interval * 0.9
+
+    def add(self, chunk: bytes):
+        now = self._clock()
+        with self._lock:
+            self._last_added = now
+            self._frames.append((now, chunk))
+            self._bytes += len(chunk)
+            while self._frames and (now - self._frames[0][0] > self.seconds or self._bytes > self.max_bytes):
+                _, dropped = self._frames.popleft()
+                self._bytes -= len(dropped)
+
+    def frames(self, seconds: float | None = None) -> List[Tuple[float, bytes]]:
+        """返回最近 seconds 秒（为空时为全部）的帧，按时间顺序排列。"""
+        with self._lock:
+            frames = list(self._frames)
+        if seconds is not None and frames:
+            start = frames[-1][0] - seconds
+            frames = [frame for frame in frames if frame[0] >= start]
+        return frames
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+            self._last_added = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            duration = self._frames[-1][0] - self._frames[0][0] if self._frames else 0.0
+            return {
+                'frames': len(self._frames),
+                'bytes': self._bytes,
+                'duration': round(duration, 2),
+                'max_seconds': self.seconds,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def iter_replay(frames: List[Tuple[float, bytes]], speed: float = 1.0,
+                sleep: Callable[[float], None] = time.sleep) -> Iterator[bytes]:
+    """按录制时的时间间隔逐帧产出分段数据，用于 MJPEG 回放。"""
+    previous = None
+    for timestamp, chunk in frames:
+        if previous is not None:
+            sleep(max(0.0, min(timestamp - previous, 1.0)) / speed)
+        previous = timestamp
+        yield chunk
+
+
+def export_avi(frames: List[Tuple[float, bytes]], fps: float) -> bytes:
+    """
+    把回放帧导出为 MJPG 编码的 AVI 视频
+
+    画质在录制期间可能因自适应画质而变化，尺寸不同的帧会被缩放到第一帧的尺寸。
+
+    Args:
+        frames: (时间戳, 分段数据) 列表
+        fps: 视频帧率
+
+    Returns:
+        bytes: AVI 文件内容
+    """
+    import cv2
+
+    fd, path = tempfile.mkstemp(suffix='.avi')
+    os.close(fd)
+    writer = None
+    try:
+        for _, chunk in frames:
+            image = cv2.imdecode(np.frombuffer(parse_multipart_chunk(chunk), dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            if writer is None:
+                size = (image.shape[1], image.shape[0])
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+            elif (image.shape[1], image.shape[0]) != size:
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            writer.write(image)
+        if writer is None:
+            return b''
+        writer.release()
+        writer = None
+        with open(path, 'rb') as file:
+            return file.read()
+    finally:
+        if writer is not None:
+            writer.release()
+        os.remove(path)
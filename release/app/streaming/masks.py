@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 编译结果最多缓存的 (应用, 尺寸, 裁剪框) 组合数，超出时淘汰最久未使用的
+MAX_COMPILED_MASKS = 16
+
+# 默认的隐私遮罩区域，坐标基于 base_size 分辨率，格式为 [x1, y1, x2, y2]（包含右下角）
+DEFAULT_PRIVACY_MASKS: Dict[str, Dict[str, Any]] = {
+    'yuanshen.exe': {
+        'base_size': [3840, 2160],
+        'regions': [
+            [222, 374, 583, 448],  # UID区域
+            [3346, 2087, 3731, 2149],
+        ],
+    },
+}
+
+
+class PrivacyMaskEngine:
+    """隐私遮罩引擎：按目标应用加载遮罩区域，按输出尺寸编译为像素切片并缓存。
+
+    引擎在多个推流之间共享，编译结果只保留最近使用的 MAX_COMPILED_MASKS 个，
+    窗口尺寸或裁剪框不断变化时缓存不会无限增长。
+    """
+
+    def __init__(self, definitions: Dict[str, Dict[str, Any]] | None = None):
+        """
+        Args:
+            definitions: 目标应用到遮罩定义的映射，会覆盖默认定义中的同名应用
+        """
+        merged = dict(DEFAULT_PRIVACY_MASKS)
+        merged.update(definitions or {})
+        self.definitions = {app.lower(): self._validate(app, definition) for app, definition in merged.items()}
+        self._lock = threading.Lock()
+        self._compiled: OrderedDict[tuple, Tuple[Tuple[slice, slice], ...]] = OrderedDict()
+
+    @staticmethod
+    def _validate(app: str, definition: Dict[str, Any]) -> Dict[str, Any]:
+        base_width, base_height = definition.get('base_size', [3840, 2160])
+        regions = [tuple(int(value) for value in region) for region in definition.get('regions', [])]
+        if base_width <= 0 or base_height <= 0 or any(len(region) != 4 for region in regions):
+            raise ValueError(f'{app} 的隐私遮罩定义无效')
+        return {'base_size': (base_width, base_height), 'regions': regions}
+
+    def has_masks(self, target_app: str) -> bool:
+        definition = self.definitions.get(target_app.lower())
+        return bool(definition and definition['regions'])
+
+    def compile(self, target_app: str, width: int, height: int,
+                crop: Optional[Tuple[float, float, float, float]] = None) -> Tuple[Tuple[slice, slice], ...]:
+        """
+        把目标应用的遮罩区域缩放到指定尺寸并编译为 (行切片, 列切片)，结果按尺寸与裁剪框缓存
+
+        Args:
+            target_app: 目标应用名称
+            width: 画面宽度
+            height: 画面高度
+            crop: 画面在整个窗口中的归一化裁剪框 (x1, y1, x2, y2)，为空时画面为整个窗口
+
+        Returns:
+            Tuple[Tuple[slice, slice], ...]: 像素切片列表
+        """
+        key = (target_app.lower(), width, height, crop)
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                return compiled
+
+        slices: List[Tuple[slice, slice]] = []
+        definition = self.definitions.get(key[0])
+        if definition:
+            base_width, base_height = definition['base_size']
+            crop_x1, crop_y1, crop_x2, crop_y2 = crop or (0.0, 0.0, 1.0, 1.0)
+            # 遮罩坐标先换算到整个窗口，再平移到裁剪框内并缩放到画面尺寸
+            scale_x = width / (base_width * (crop_x2 - crop_x1))
+            scale_y = height / (base_height * (crop_y2 - crop_y1))
+            offset_x = crop_x1 * base_width * scale_x
+            offset_y = crop_y1 * base_height * scale_y
+            for x1, y1, x2, y2 in definition['regions']:
+                rx1 = max(0, min(int(x1 * scale_x - offset_x), width))
+                ry1 = max(0, min(int(y1 * scale_y - offset_y), height))
+                rx2 = max(0, min(int(x2 * scale_x - offset_x), width))
+                ry2 = max(0, min(int(y2 * scale_y - offset_y), height))
+                if rx2 > rx1 and ry2 > ry1:
+                    slices.append((slice(ry1, ry2 + 1), slice(rx1, rx2 + 1)))
+
+        compiled = tuple(slices)
+        with self._lock:
+            self._compiled[key] = compiled
+            while len(self._compiled) > MAX_COMPILED_MASKS:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def apply(self, target_app: str, img: np.ndarray, width: int | None = None,
+              height: int | None = None, crop: Optional[Tuple[float, float, float, float]] = None) -> np.ndarray:
+        """
+        在画面上原地应用遮罩
+
+        Args:
+            target_app: 目标应用名称
+            img: BGR画面
+            width: 计算遮罩位置使用的宽度，默认取画面宽度
+            height: 计算遮罩位置使用的高度，默认取画面高度
+            crop: 画面在整个窗口中的归一化裁剪框，为空时画面为整个窗口
+
+        Returns:
+            np.ndarray: 遮罩后的画面
+        """
+        if width is None or height is None:
+            height, width = img.shape[:2]
+        for rows, columns in self.compile(target_app, width, height, crop):
+            img[rows, columns] = 0
+        return img
+
+
+@lru_cache(maxsize=8)
+def get_mask_engine(definitions_json: str = '') -> PrivacyMaskEngine:
+    """
+    根据JSON配置获取共享的遮罩引擎，配置无效时使用默认定义
+
+    Args:
+        definitions_json: 形如 {"app.exe": {"base_size": [w, h], "regions": [[x1, y1, x2, y2]]}} 的JSON
+
+    Returns:
+        PrivacyMaskEngine: 遮罩引擎
+    """
+    if not definitions_json or not definitions_json.strip():
+        return PrivacyMaskEngine()
+    try:
+        return PrivacyMaskEngine(json.loads(definitions_json))
+    except Exception as e:
+        logger.error(f"解析隐私遮罩配置时发生错误: {e}，使用默认配置")
+        return PrivacyMaskEngine()
@@ -0,0 +1,292 @@
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.streaming.backends import CaptureBackend, parse_frame_size
+from app.streaming.buffer_pool import FrameBufferPool
+from app.streaming.masks import PrivacyMaskEngine, get_mask_engine
+from app.streaming.roi import CropBox, box_to_pixels
+
+logger = logging.getLogger(__name__)
+
+MOSAIC_LAYOUTS = ('grid', 'row', 'column')
+MAX_MOSAIC_SOURCES = 9
+# 来源窗口不存在时重新查找的间隔（秒）
+SOURCE_PROBE_INTERVAL = 1.0
+
+
+def parse_mosaic(value: str, layout: Optional[str] = None) -> Tuple[List[Tuple[str, float]], str]:
+    """
+    解析拼接推流的目标，格式为 应用[@帧率],应用[@帧率][#布局]
+
+    Args:
+        value: 逗号分隔的应用程序名称，可以用@指定该来源的捕获帧率，用#指定布局
+        layout: 布局，value 中未指定布局时使用，默认为 grid
+
+    Returns:
+        Tuple[List[Tuple[str, float]], str]: (应用名称, 捕获帧率) 列表与布局，帧率为0时跟随推流帧率
+
+    Raises:
+        ValueError: 格式无效时抛出
+    """
+    value, _, suffix = value.partition('#')
+    layout = (suffix or layout or 'grid').strip().lower()
+    if layout not in MOSAIC_LAYOUTS:
+        raise ValueError(f'未知的拼接布局 {layout}，可选值: {", ".join(MOSAIC_LAYOUTS)}')
+
+    sources = []
+    for item in value.split(','):
+        app, _, fps = item.strip().partition('@')
+        app = app.strip().lower()
+        if not app.endswith('.exe'):
+            raise ValueError(f'应用程序名称必须以.exe结尾: {app}')
+        try:
+            fps = float(fps) if fps.strip() else 0.0
+        except ValueError:
+            raise ValueError(f'来源 {app} 的帧率必须为数字')
+        if fps < 0:
+            raise ValueError(f'来源 {app} 的帧率不能为负数')
+        sources.append((app, fps))
+    if not 2 <= len(sources) <= MAX_MOSAIC_SOURCES:
+        raise ValueError(f'拼接推流需要2到{MAX_MOSAIC_SOURCES}个来源')
+    return sources, layout
+
+
+def mosaic_name(sources: Sequence[Tuple[str, float]], layout: str) -> str:
+    """返回拼接推流的规范名称，用作注册表中的目标应用名称，可由 parse_mosaic 还原。"""
+    return ','.join(f'{app}@{fps:g}' if fps else app for app, fps in sources) + f'#{layout}'
+
+
+def grid_shape(count: int, layout: str) -> Tuple[int, int]:
+    """返回布局的 (行数, 列数)。"""
+    if layout == 'row':
+        return 1, count
+    if layout == 'column':
+        return count, 1
+    columns = math.ceil(math.sqrt(count))
+    return math.ceil(count / columns), columns
+
+
+@dataclass(eq=False)
+class MosaicSource:
+    """拼接推流的一个来源及其捕获状态。"""
+    app: str
+    backend: CaptureBackend
+    fps: float = 0.0
+    hwnd: int = 0
+    last_capture: Optional[float] = None
+    next_probe: float = 0.0
+    placement: Optional[Tuple[int, int, int, int]] = None  # 画面在画布中的 (x, y, 宽, 高)
+
+
+class MosaicCaptureBackend:
+    """拼接捕获后端：把多个窗口按布局拼接到一张画布上，推流控制器只需捕获和编码一次。
+
+    画布与每个来源的缩放缓冲区都是预分配并复用的；每个来源按自己的帧率捕获，
+    未到捕获时间的来源保留画布上的上一帧。隐私遮罩按来源应用在各自的画面上。
+    """
+
+    def __init__(self, sources: Sequence[Tuple[str, CaptureBackend, float]], layout: str = 'grid',
+                 tile_size: Tuple[int, int] = (960, 540), mask_engine: PrivacyMaskEngine | None = None,
+                 pool: FrameBufferPool | None = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            sources: (应用名称, 捕获后端, 捕获帧率) 列表，帧率为0时每次捕获都更新
+            layout: 布局，grid 网格 / row 横向 / column 纵向
+            tile_size: 每个来源占用的 (宽, 高)，画面按比例缩放后居中放置
+            mask_engine: 隐私遮罩引擎
+            pool: 输出画面使用的缓冲池
+        """
+        self.sources = [MosaicSource(app, backend, fps) for app, backend, fps in sources]
+        self.layout = layout
+        self.tile_width, self.tile_height = tile_size
+        self.mask_engine = mask_engine or get_mask_engine()
+        self.pool = pool
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._source_pool = FrameBufferPool()
+        for source in self.sources:
+            if getattr(source.backend, 'pool', True) is None:
+                source.backend.pool = self._source_pool
+
+        rows, columns = grid_shape(len(self.sources), layout)
+        self.width, self.height = columns * self.tile_width, rows * self.tile_height
+        self.canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self.source_captures = 0
+
+    def _tile_origin(self, index: int) -> Tuple[int, int]:
+        _, columns = grid_shape(len(self.sources), self.layout)
+        return index % columns * self.tile_width, index // columns * self.tile_height
+
+    def _locate(self, source: MosaicSource, now: float) -> bool:
+        if source.hwnd and source.backend.is_valid(source.hwnd):
+            return True
+        if now < source.next_probe:
+            return False
+        source.next_probe = now + SOURCE_PROBE_INTERVAL
+        try:
+            source.hwnd = source.backend.find(source.app)
+        except Exception as e:
+            logger.error(f"查找拼接来源 {source.app} 的窗口时发生错误: {e}")
+            source.hwnd = 0
+        return bool(source.hwnd)
+
+    def _clear_tile(self, index: int, source: MosaicSource):
+        x, y = self._tile_origin(index)
+        self.canvas[y:y + self.tile_height, x:x + self.tile_width] = 0
+        source.placement = None
+
+    def _fit(self, index: int, frame: np.ndarray) -> Tuple[int, int, int, int]:
+        """返回来源画面按比例缩放后在画布中的 (x, y, 宽, 高)，居中放置在对应的格子内。"""
+        height, width = frame.shape[:2]
+        scale = min(self.tile_width / width, self.tile_height / height)
+        target_width, target_height = max(1, int(width * scale)), max(1, int(height * scale))
+        tile_x, tile_y = self._tile_origin(index)
+        return (tile_x + (self.tile_width - target_width) // 2, tile_y + (self.tile_height - target_height) // 2,
+                target_width, target_height)
+
+    def _paste(self, canvas: np.ndarray, placement: Tuple[int, int, int, int], app: str, frame: np.ndarray):
+        """缩放来源画面并写入画布上的指定位置，然后应用该来源的遮罩。"""
+        import cv2
+
+        x, y, target_width, target_height = placement
+        height, width = frame.shape[:2]
+        resized = frame
+        if (target_width, target_height) != (width, height):
+            dst = self._source_pool.acquire((target_height, target_width, 3), frame.dtype)
+            interpolation = cv2.INTER_AREA if target_width < width else cv2.INTER_LINEAR
+            resized = cv2.resize(frame, (target_width, target_height), dst=dst, interpolation=interpolation)
+        tile = canvas[y:y + target_height, x:x + target_width]
+        tile[:] = resized
+        self.mask_engine.apply(app, tile)
+        if resized is not frame:
+            self._source_pool.release(resized)
+
+    def _draw(self, index: int, source: MosaicSource, frame: np.ndarray):
+        placement = self._fit(index, frame)
+        if placement != source.placement:
+            # 来源尺寸变化时清除格子中残留的旧画面
+            self._clear_tile(index, source)
+            source.placement = placement
+        self._paste(self.canvas, placement, source.app, frame)
+
+    @staticmethod
+    def _release_source_frame(source: MosaicSource, frame: np.ndarray):
+        release = getattr(source.backend.pool, 'release', None)
+        if release is not None:
+            release(frame)
+
+    def _compose(self):
+        now = self._clock()
+        for index, source in enumerate(self.sources):
+            if not self._locate(source, now):
+                if source.placement is not None:
+                    self._clear_tile(index, source)
+                continue
+            if source.fps > 0 and source.last_capture is not None \
+                    and now - source.last_capture < 0.9 / source.fps:
+                continue
+            try:
+                frame = source.backend.capture(source.hwnd)
+            except Exception as e:
+                logger.error(f"捕获拼接来源 {source.app} 时发生错误: {e}")
+                frame = None
+            if frame is None:
+                continue
+            source.last_capture = now
+            self.source_captures += 1
+            try:
+                self._draw(index, source, frame)
+            finally:
+                self._release_source_frame(source, frame)
+
+    def find(self, target_app: str) -> int:
+        """查找所有来源的窗口，至少找到一个时返回1。"""
+        with self._lock:
+            for source in self.sources:
+                source.next_probe = 0.0
+            now = self._clock()
+            found = [self._locate(source, now) for source in self.sources]
+        return 1 if any(found) else 0
+
+    def is_valid(self, hwnd: int) -> bool:
+        with self._lock:
+            return any(source.hwnd and source.backend.is_valid(source.hwnd) for source in self.sources)
+
+    def window_size(self, hwnd: int) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def _copy_out(self, canvas: np.ndarray, region: Optional[CropBox]) -> np.ndarray:
+        if region is not None:
+            x1, y1, x2, y2 = box_to_pixels(region, self.width, self.height)
+            canvas = canvas[y1:y2, x1:x2]
+        dst = self.pool.acquire(canvas.shape, canvas.dtype) if self.pool is not None else np.empty_like(canvas)
+        np.copyto(dst, canvas)
+        return dst
+
+    def capture(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        with self._lock:
+            self._compose()
+            # 拷贝到独立的缓冲区，编码线程处理当前帧时画布可以继续更新
+            return self._copy_out(self.canvas, region)
+
+    def snapshot(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        """通过各来源的 snapshot 拼接到独立的画布，不使用也不修改推流中的捕获资源与状态，可以从其他线程调用。"""
+        canvas = np.zeros_like(self.canvas)
+        for index, source in enumerate(self.sources):
+            try:
+                source_hwnd = source.hwnd
+                if not source_hwnd or not source.backend.is_valid(source_hwnd):
+                    source_hwnd = source.backend.find(source.app)
+                frame = source.backend.snapshot(source_hwnd) if source_hwnd else None
+            except Exception as e:
+                logger.error(f"获取拼接来源 {source.app} 的快照时发生错误: {e}")
+                continue
+            if frame is None:
+                continue
+            try:
+                self._paste(canvas, self._fit(index, frame), source.app, frame)
+            finally:
+                self._release_source_frame(source, frame)
+        return self._copy_out(canvas, region)
+
+    def release(self):
+        with self._lock:
+            for source in self.sources:
+                try:
+                    source.backend.release()
+                except Exception as e:
+                    logger.error(f"释放拼接来源 {source.app} 的捕获资源时发生错误: {e}")
+                source.hwnd = 0
+                source.last_capture = None
+                source.placement = None
+            self.canvas[:] = 0
+
+    def list_programs(self) -> List[str]:
+        return self.sources[0].backend.list_programs()
+
+
+def create_mosaic_backend(value: str, backend_factory: Callable[[], CaptureBackend],
+                          tile_size: str = '960x540', mask_engine: PrivacyMaskEngine | None = None,
+                          layout: Optional[str] = None) -> MosaicCaptureBackend:
+    """
+    根据拼接推流的目标创建拼接捕获后端
+
+    Args:
+        value: 拼接推流的目标，见 parse_mosaic
+        backend_factory: 为每个来源创建独立捕获后端的函数
+        tile_size: 每个来源占用的尺寸，如 960x540
+        mask_engine: 隐私遮罩引擎
+        layout: value 中未指定布局时使用的布局
+
+    Raises:
+        ValueError: 目标或尺寸无效时抛出
+    """
+    sources, layout = parse_mosaic(value, layout)
+    return MosaicCaptureBackend([(app, backend_factory(), fps) for app, fps in sources], layout,
+                                parse_frame_size(tile_size), mask_engine)
@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+
+class FramePacer:
+    """基于截止时间的帧节奏控制：只睡眠剩余的帧预算，落后时跳过错过的帧位。"""
+
+    def __init__(self, fps: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self._clock = clock
+        self._sleep = sleep
+        self.fps = fps
+        self._deadline = None
+
+    @property
+    def fps(self) -> float:
+        return self._fps
+
+    @fps.setter
+    def fps(self, value: float):
+        self._fps = value
+        self.interval = 1 / value
+
+    def reset(self):
+        """以当前时间作为第一帧的开始时间。"""
+        self._deadline = self._clock()
+
+    def wait(self) -> int:
+        """等待到下一帧的截止时间，返回因落后而跳过的帧数。"""
+        now = self._clock()
+        if self._deadline is None:
+            self._deadline = now
+        self._deadline += self.interval
+
+        if now < self._deadline:
+            self._sleep(self._deadline - now)
+            return 0
+
+        # 已经落后，不再睡眠，并把截止时间对齐到当前所在的帧位，跳过错过的帧位
+        skipped = int((now - self._deadline) // self.interval)
+        self._deadline += skipped * self.interval
+        return skipped
+
+
+class FrameStats:
+    """滚动窗口内的帧率、各阶段耗时、编码大小与发送速率统计。
+
+    每帧只做几次 deque 追加与计数，百分位等统计在 snapshot 时才计算，对帧循环的开销可以忽略。
+    """
+
+    def __init__(self, window: int = 120, clock: Callable[[], float] = time.monotonic, rate_window: int = 5):
+        # rate_window 为发送速率的统计秒数（至少为2），速率按其中已结束的整秒计算
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._timestamps = deque(maxlen=window)
+        self._frame_times = deque(maxlen=window)
+        self._capture_times = deque(maxlen=window)
+        self._encode_times = deque(maxlen=window)
+        self._encoded_sizes = deque(maxlen=window)
+        self._rate_window = rate_window
+        self._sent_buckets = deque()  # [整秒时间, 该秒内发送的字节数]
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.frames_unchanged = 0
+        self.frames_dropped = 0
+
+    def reset(self):
+        with self._lock:
+            self._timestamps.clear()
+            self._frame_times.clear()
+            self._capture_times.clear()
+            self._encode_times.clear()
+            self._encoded_sizes.clear()
+            self._sent_buckets.clear()
+
+    def record(self, frame_time: float):
+        with self._lock:
+            self._timestamps.append(self._clock())
+            self._frame_times.append(frame_time)
+            self.frames_sent += 1
+
+    def record_capture(self, capture_time: float):
+        with self._lock:
+            self._capture_times.append(capture_time)
+
+    def record_encode(self, encode_time: float, size: int):
+        with self._lock:
+            self._encode_times.append(encode_time)
+            self._encoded_sizes.append(size)
+
+    def record_skipped(self, count: int):
+        if count:
+            with self._lock:
+                self.frames_skipped += count
+
+    def record_unchanged(self):
+        with self._lock:
+            self.frames_unchanged += 1
+
+    def record_dropped(self, count: int):
+        """记录客户端因写入缓慢而跳过的帧数。"""
+        if count:
+            with self._lock:
+                self.frames_dropped += count
+
+    def record_sent_bytes(self, size: int):
+        """记录发送给客户端的字节数，按整秒分桶累计。"""
+        second = int(self._clock())
+        with self._lock:
+            if self._sent_buckets and self._sent_buckets[-1][0] == second:
+                self._sent_buckets[-1][1] += size
+            else:
+                self._sent_buckets.append([second, size])
+                while self._sent_buckets[0][0] <= second - self._rate_window:
+                    self._sent_buckets.popleft()
+
+    @staticmethod
+    def _percentiles(values: list) -> Dict[str, Any]:
+        percentiles = {'p50': None, 'p95': None, 'p99': None}
+        if values:
+            results = np.percentile(np.array(values) * 1000, [50, 95, 99])
+            percentiles = {key: round(float(value), 2) for key, value in zip(percentiles, results)}
+        return percentiles
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = self._clock()
+        with self._lock:
+            timestamps = list(self._timestamps)
+            frame_times = list(self._frame_times)
+            capture_times = list(self._capture_times)
+            encode_times = list(self._encode_times)
+            encoded_sizes = list(self._encoded_sizes)
+            # 只统计已经结束的整秒，避免当前秒尚未累计完整而低估速率
+            current = int(now)
+            sent_bytes = sum(size for second, size in self._sent_buckets
+                             if current - (self._rate_window - 1) <= second < current)
+            frames_sent, frames_skipped = self.frames_sent, self.frames_skipped
+            frames_unchanged, frames_dropped = self.frames_unchanged, self.frames_dropped
+
+        achieved_fps = 0.0
+        if len(timestamps) > 1 and timestamps[-1] > timestamps[0]:
+            achieved_fps = (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+
+        return {
+            'achieved_fps': round(achieved_fps, 2),
+            'frame_time_ms': self._percentiles(frame_times),
+            'capture_time_ms': self._percentiles(capture_times),
+            'encode_time_ms': self._percentiles(encode_times),
+            'avg_jpeg_bytes': round(sum(encoded_sizes) / len(encoded_sizes)) if encoded_sizes else 0,
+            'bytes_per_second': round(sent_bytes / (self._rate_window - 1)),
+            'frames_sent': frames_sent,
+            'frames_skipped': frames_skipped,
+            'frames_unchanged': frames_unchanged,
+            'frames_dropped': frames_dropped,
+        }
@@ -0,0 +1,135 @@
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.streaming.roi import CropRegion
+
+
+@dataclass(frozen=True)
+class StreamProfile:
+    """推流画质配置：最大输出尺寸（0表示不限制）、额外缩放比例、编码格式与质量、裁剪区域，相同配置的客户端共享编码结果。
+
+    最大输出尺寸作用于裁剪后的画面。
+    """
+    max_width: int = 0
+    max_height: int = 0
+    quality: int = 80
+    scale: float = 1.0  # 在最大尺寸限制之后再缩放，供自适应画质降级使用
+    crop: Optional[CropRegion] = None  # 裁剪区域，为空时推流整个窗口
+    codec: str = 'jpeg'  # 编码格式，见 CODECS
+
+    @property
+    def mimetype(self) -> str:
+        return CODECS[self.codec][2]
+
+    def target_size(self, width: int, height: int) -> Tuple[int, int]:
+        """按比例计算不超过最大尺寸的输出尺寸，不会放大画面。"""
+        scale = 1.0
+        if self.max_width and width > self.max_width:
+            scale = min(scale, self.max_width / width)
+        if self.max_height and height > self.max_height:
+            scale = min(scale, self.max_height / height)
+        scale *= min(self.scale, 1.0)
+        if scale >= 1.0:
+            return width, height
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'max_width': self.max_width, 'max_height': self.max_height, 'quality': self.quality,
+                'scale': self.scale, 'crop': self.crop.to_dict() if self.crop else None, 'codec': self.codec}
+
+
+# 支持的编码格式：(文件扩展名, OpenCV质量参数名, MIME类型)
+CODECS: Dict[str, Tuple[str, str, str]] = {
+    'jpeg': ('.jpg', 'IMWRITE_JPEG_QUALITY', 'image/jpeg'),
+    'webp': ('.webp', 'IMWRITE_WEBP_QUALITY', 'image/webp'),
+}
+
+DEFAULT_CODEC = 'jpeg'
+
+
+# 预设画质配置
+STREAM_PRESETS: Dict[str, StreamProfile] = {
+    'original': StreamProfile(),
+    'high': StreamProfile(max_width=1920, max_height=1080, quality=85),
+    'medium': StreamProfile(max_width=1280, max_height=720, quality=75),
+    'low': StreamProfile(max_width=854, max_height=480, quality=60),
+}
+
+DEFAULT_PRESET = 'original'
+
+# 非JPEG编码格式在各预设下的质量，WebP在较低的质量下即可达到与JPEG相近的观感
+CODEC_PRESET_QUALITY: Dict[str, Dict[str, int]] = {
+    'webp': {'original': 75, 'high': 70, 'medium': 60, 'low': 50},
+}
+
+
+def _parse_int(name: str, value: Optional[str], minimum: int, maximum: int) -> Optional[int]:
+    if value is None or not value.strip():
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f'{name}必须为整数')
+    if not minimum <= number <= maximum:
+        raise ValueError(f'{name}必须在{minimum}到{maximum}之间')
+    return number
+
+
+def resolve_profile(preset: Optional[str] = None, max_width: Optional[str] = None,
+                    max_height: Optional[str] = None, quality: Optional[str] = None,
+                    codec: Optional[str] = None) -> StreamProfile:
+    """
+    根据预设名称与查询参数解析画质配置，显式参数覆盖预设中的对应字段
+
+    Args:
+        preset: 预设名称
+        max_width: 最大宽度
+        max_height: 最大高度
+        quality: 编码质量，未指定时使用预设在该编码格式下的质量
+        codec: 编码格式，jpeg 或 webp
+
+    Returns:
+        StreamProfile: 画质配置
+
+    Raises:
+        ValueError: 参数无效时抛出
+    """
+    preset = (preset or DEFAULT_PRESET).strip().lower()
+    if preset not in STREAM_PRESETS:
+        raise ValueError(f'未知的画质预设 {preset}，可选值: {", ".join(STREAM_PRESETS)}')
+    codec = (codec or DEFAULT_CODEC).strip().lower()
+    if codec not in CODECS:
+        raise ValueError(f'未知的编码格式 {codec}，可选值: {", ".join(CODECS)}')
+
+    overrides = {
+        'max_width': _parse_int('max_width', max_width, 0, 7680),
+        'max_height': _parse_int('max_height', max_height, 0, 4320),
+        'quality': _parse_int('quality', quality, 1, 100),
+        'codec': codec,
+    }
+    if overrides['quality'] is None and codec in CODEC_PRESET_QUALITY:
+        overrides['quality'] = CODEC_PRESET_QUALITY[codec][preset]
+    return replace(STREAM_PRESETS[preset], **{key: value for key, value in overrides.items() if value is not None})
+
+
+def resize_frame(frame: np.ndarray, profile: StreamProfile, pool: Any = None) -> np.ndarray:
+    """按画质配置缩小画面，无需缩放时直接返回原画面；传入缓冲池时输出写入池中的缓冲区。"""
+    import cv2
+
+    height, width = frame.shape[:2]
+    target_width, target_height = profile.target_size(width, height)
+    if (target_width, target_height) == (width, height):
+        return frame
+    dst = pool.acquire((target_height, target_width) + frame.shape[2:], frame.dtype) if pool is not None else None
+    return cv2.resize(frame, (target_width, target_height), dst=dst, interpolation=cv2.INTER_AREA)
+
+
+def encode_image(frame: np.ndarray, profile: StreamProfile) -> Optional[bytes]:
+    """按画质配置的编码格式与质量编码画面，编码失败时返回None。"""
+    import cv2
+
+    extension, quality_flag, _ = CODECS[profile.codec]
+    ret, buffer = cv2.imencode(extension, frame, [getattr(cv2, quality_flag), profile.quality])
+    return buffer.tobytes() if ret else None
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.streaming.dvr import FrameRingBuffer
+from app.streaming.streamer import StreamController
+
+logger = logging.getLogger(__name__)
+
+
+class StreamRegistry:
+    """推流控制器注册表：按目标应用管理控制器，并按连接数进行引用计数。
+
+    不同目标应用的推流互不影响；某个目标的最后一个连接释放后，其控制器被停止并移除，
+    回放缓冲区在 dvr_grace 秒内仍保留，观看者离开后依然可以回放刚才的画面。
+    """
+
+    def __init__(self, factory: Callable[..., StreamController] = StreamController, dvr_grace: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self._factory = factory
+        self.dvr_grace = dvr_grace
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._controllers: Dict[str, StreamController] = {}
+        self._refcounts: Dict[str, int] = {}
+        self._retained: Dict[str, Tuple[FrameRingBuffer, float]] = {}  # 已移除控制器的 (回放缓冲区, 过期时间)
+
+    @staticmethod
+    def _key(target_app: str) -> str:
+        return target_app.strip().lower()
+
+    def _retain(self, key: str, controller: StreamController):
+        dvr = getattr(controller, 'dvr', None)
+        if dvr is not None and self.dvr_grace > 0:
+            self._retained[key] = (dvr, self._clock() + self.dvr_grace)
+
+    def acquire(self, target_app: str, backend_factory: Callable[[], Any] | None = None,
+                **options) -> StreamController:
+        """获取目标应用的控制器并增加引用计数，不存在时使用 options 创建。
+
+        backend_factory 只在新建控制器时调用，结果作为捕获后端传给控制器，
+        已有控制器时不会创建多余的捕获后端。
+        """
+        key = self._key(target_app)
+        with self._lock:
+            controller = self._controllers.get(key)
+            if controller is None:
+                if backend_factory is not None:
+                    options['backend'] = backend_factory()
+                controller = self._factory(target_app, **options)
+                self._controllers[key] = controller
+                self._refcounts[key] = 0
+                # 新的控制器有自己的回放缓冲区，不再保留上一个控制器的
+                self._retained.pop(key, None)
+                logger.info(f"创建推流控制器 - 目标应用: {target_app}")
+            self._refcounts[key] += 1
+            return controller
+
+    def release(self, target_app: str, controller: Optional[StreamController] = None):
+        """减少引用计数，计数归零时停止并移除控制器。
+
+        传入 controller 时，只有注册表中仍是同一个控制器才会减少计数，
+        避免 stop_all 之后新建的控制器被旧连接误释放。
+        """
+        key = self._key(target_app)
+        with self._lock:
+            if key not in self._refcounts:
+                return
+            if controller is not None and self._controllers[key] is not controller:
+                return
+            self._refcounts[key] -= 1
+            if self._refcounts[key] > 0:
+                return
+            controller = self._controllers.pop(key)
+            del self._refcounts[key]
+            self._retain(key, controller)
+        controller.stop_stream()
+        logger.info(f"移除推流控制器 - 目标应用: {controller.target_app}")
+
+    def get(self, target_app: str) -> Optional[StreamController]:
+        with self._lock:
+            return self._controllers.get(self._key(target_app))
+
+    def replay_buffer(self, target_app: str) -> Optional[FrameRingBuffer]:
+        """返回目标应用的回放缓冲区，推流已结束时返回保留期内的缓冲区，没有时返回None。"""
+        key = self._key(target_app)
+        with self._lock:
+            controller = self._controllers.get(key)
+            if controller is not None:
+                return controller.dvr
+            now = self._clock()
+            for expired in [name for name, (_, expires) in self._retained.items() if expires <= now]:
+                del self._retained[expired]
+            retained = self._retained.get(key)
+            return retained[0] if retained else None
+
+    def refcount(self, target_app: str) -> int:
+        with self._lock:
+            return self._refcounts.get(self._key(target_app), 0)
+
+    def controllers(self) -> List[StreamController]:
+        with self._lock:
+            return list(self._controllers.values())
+
+    def stop(self, target_app: str) -> bool:
+        """停止目标应用的推流，连接结束后控制器随引用释放而移除。"""
+        controller = self.get(target_app)
+        if controller is None:
+            return False
+        controller.stop_stream()
+        return True
+
+    def stop_all(self) -> List[str]:
+        """停止所有推流并清空注册表，返回被停止的目标应用列表。"""
+        with self._lock:
+            controllers = list(self._controllers.values())
+            for key, controller in self._controllers.items():
+                self._retain(key, controller)
+            self._controllers.clear()
+            self._refcounts.clear()
+        for controller in controllers:
+            try:
+                controller.stop_stream()
+            except Exception as e:
+                logger.error(f"停止推流 {controller.target_app} 时发生错误: {e}")
+        return [controller.target_app for controller in controllers]
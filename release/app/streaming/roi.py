@@ -0,0 +1,118 @@
+import json
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 归一化的裁剪框 (x1, y1, x2, y2)，取值范围0到1
+CropBox = Tuple[float, float, float, float]
+
+
+@dataclass(frozen=True)
+class CropRegion:
+    """推流裁剪区域 (x, y, 宽, 高)，所有值都不大于1时视为相对窗口尺寸的比例，否则为像素坐标。"""
+    x: float
+    y: float
+    width: float
+    height: float
+
+    @property
+    def normalized(self) -> bool:
+        return max(self.x, self.y, self.width, self.height) <= 1
+
+    def to_box(self, frame_width: int, frame_height: int) -> CropBox:
+        """按窗口尺寸换算为归一化的裁剪框，超出窗口的部分被截断。"""
+        if self.normalized:
+            x1, y1, x2, y2 = self.x, self.y, self.x + self.width, self.y + self.height
+        else:
+            x1, y1 = self.x / frame_width, self.y / frame_height
+            x2, y2 = (self.x + self.width) / frame_width, (self.y + self.height) / frame_height
+        return (min(max(x1, 0.0), 1.0), min(max(y1, 0.0), 1.0), min(max(x2, 0.0), 1.0), min(max(y2, 0.0), 1.0))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'x': self.x, 'y': self.y, 'width': self.width, 'height': self.height}
+
+
+# 默认的裁剪预设，坐标为相对16:9原神窗口的比例
+DEFAULT_ROI_PRESETS: Dict[str, CropRegion] = {
+    'minimap': CropRegion(0.02, 0.02, 0.12, 0.22),  # 小地图
+    'pickup': CropRegion(0.55, 0.3, 0.25, 0.45),  # 拾取提示
+}
+
+
+def parse_crop(value: str) -> CropRegion:
+    """
+    解析 x,y,宽,高 格式的裁剪区域
+
+    Raises:
+        ValueError: 格式无效时抛出
+    """
+    try:
+        x, y, width, height = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError('crop必须为 x,y,宽,高 格式的4个数字')
+    crop = CropRegion(x, y, width, height)
+    if min(x, y) < 0 or width <= 0 or height <= 0:
+        raise ValueError('crop的起点不能为负数，宽和高必须大于0')
+    if crop.normalized and (x >= 1 or y >= 1):
+        raise ValueError('按比例指定的crop起点必须小于1')
+    return crop
+
+
+@lru_cache(maxsize=8)
+def get_roi_presets(presets_json: str = '') -> Dict[str, CropRegion]:
+    """
+    获取裁剪预设，JSON配置中的同名预设覆盖默认预设，配置无效时使用默认预设
+
+    Args:
+        presets_json: 形如 {"name": [x, y, 宽, 高]} 的JSON
+    """
+    presets = dict(DEFAULT_ROI_PRESETS)
+    if presets_json and presets_json.strip():
+        try:
+            presets.update({name.lower(): parse_crop(','.join(str(value) for value in region))
+                            for name, region in json.loads(presets_json).items()})
+        except Exception as e:
+            logger.error(f"解析裁剪预设配置时发生错误: {e}，使用默认配置")
+    return presets
+
+
+def resolve_crop(crop: Optional[str] = None, roi: Optional[str] = None,
+                 presets_json: str = '') -> Optional[CropRegion]:
+    """
+    根据查询参数解析裁剪区域，显式的crop优先于预设名称
+
+    Raises:
+        ValueError: 参数无效时抛出
+    """
+    if crop and crop.strip():
+        return parse_crop(crop)
+    if roi and roi.strip():
+        presets = get_roi_presets(presets_json)
+        name = roi.strip().lower()
+        if name not in presets:
+            raise ValueError(f'未知的裁剪预设 {name}，可选值: {", ".join(presets)}')
+        return presets[name]
+    return None
+
+
+def union_box(boxes: Iterable[Optional[CropBox]]) -> Optional[CropBox]:
+    """返回包含所有裁剪框的最小裁剪框，任一为空（整个窗口）或没有裁剪框时返回None。"""
+    boxes = list(boxes)
+    if not boxes or any(box is None for box in boxes):
+        return None
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+def box_to_pixels(box: CropBox, width: int, height: int) -> Tuple[int, int, int, int]:
+    """把归一化的裁剪框换算为像素坐标 (x1, y1, x2, y2)，保证至少包含1个像素。"""
+    x1 = min(int(box[0] * width), width - 1)
+    y1 = min(int(box[1] * height), height - 1)
+    x2 = max(min(int(np.ceil(box[2] * width)), width), x1 + 1)
+    y2 = max(min(int(np.ceil(box[3] * height)), height), y1 + 1)
+    return x1, y1, x2, y2
@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.streaming.profiles import StreamProfile
+from app.streaming.streamer import StreamController
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotService:
+    """单帧快照服务：目标应用有进行中的推流时直接返回其最近编码的一帧，不产生额外的捕获与编码。
+
+    没有进行中的推流时一次性捕获并编码，结果按 (目标应用, 画质配置) 短时缓存，
+    相同目标应用与画质配置的一次性捕获串行执行，同一时间的大量快照请求只触发一次捕获，
+    不同目标应用的捕获互不等待。
+    """
+
+    def __init__(self, lookup: Callable[[str], Optional[StreamController]],
+                 factory: Callable[..., StreamController] = StreamController, ttl: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self._lookup = lookup  # 按目标应用查找进行中推流的控制器
+        self._factory = factory
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()  # 保护缓存与捕获锁表，不在持有时进行捕获
+        self._capture_locks: Dict[Tuple[str, Optional[StreamProfile]], threading.Lock] = defaultdict(threading.Lock)
+        self._cache: Dict[Tuple[str, Optional[StreamProfile]], Tuple[float, bytes]] = {}
+        self.captures = 0
+
+    def get(self, target_app: str, profile: StreamProfile | None = None,
+            backend_factory: Callable[[], Any] | None = None, **options) -> Optional[bytes]:
+        """
+        获取目标应用的单帧快照，按画质配置的编码格式编码，未指定画质配置时为JPEG
+
+        Args:
+            target_app: 目标应用程序名称
+            profile: 画质配置，为空时使用推流中任一频道的最新帧或原始画质
+            backend_factory: 需要新建控制器时用于创建捕获后端，没有缓存命中时才会调用
+            **options: 需要新建控制器时传给控制器的参数
+
+        Returns:
+            Optional[bytes]: 图像数据，找不到目标窗口时返回None
+        """
+        controller = self._lookup(target_app)
+        if controller is not None and controller.is_streaming:
+            jpeg = controller.latest_frame(profile)
+            if jpeg:
+                return jpeg
+
+        key = (target_app.strip().lower(), profile)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            capture_lock = self._capture_locks[key]
+
+        with capture_lock:
+            # 等待期间其他请求可能已经完成了同一快照的捕获
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+
+            temporary = controller is None
+            if temporary:
+                if backend_factory is not None:
+                    options['backend'] = backend_factory()
+                controller = self._factory(target_app, **options)
+            try:
+                jpeg = controller.capture_snapshot(profile)
+            finally:
+                # 一次性创建的控制器不会再使用，立即释放其捕获资源
+                if temporary:
+                    controller.release_capture()
+            with self._lock:
+                self.captures += 1
+                if jpeg:
+                    self._cache[key] = (self._clock(), jpeg)
+        self._sweep()
+        return jpeg
+
+    def _cached(self, key: Tuple[str, Optional[StreamProfile]]) -> Optional[bytes]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and self._clock() - cached[0] < self.ttl:
+                return cached[1]
+            return None
+
+    def _sweep(self):
+        """清理过期的缓存与空闲的捕获锁，避免不同参数组合的快照长期占用内存。"""
+        with self._lock:
+            now = self._clock()
+            self._cache = {k: v for k, v in self._cache.items() if now - v[0] < self.ttl}
+            for key in [k for k, lock in self._capture_locks.items() if k not in self._cache and not lock.locked()]:
+                del self._capture_locks[key]
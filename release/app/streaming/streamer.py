@@ -1,119 +1,284 @@
 import logging
 import time
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 from flask import Response
 
+from app.streaming.adaptive import AdaptiveQualityController
+from app.streaming.backends import DESKTOP_APP, CaptureBackend, Win32CaptureBackend
+from app.streaming.buffer_pool import FrameBufferPool
+from app.streaming.broadcaster import FrameBroadcaster, build_multipart_chunk, parse_multipart_chunk
 from app.streaming.capture import FrameCapture
+from app.streaming.change_detector import FrameChangeDetector
+from app.streaming.dvr import FrameRingBuffer
+from app.streaming.masks import PrivacyMaskEngine, get_mask_engine
+from app.streaming.profiles import (STREAM_PRESETS, DEFAULT_CODEC, DEFAULT_PRESET, StreamProfile, encode_image,
+                                    resize_frame)
+from app.streaming.roi import CropBox, box_to_pixels, union_box
 from app.streaming.window_finder import WindowFinder
 
 logger = logging.getLogger(__name__)
 
+# 占位画面的发送间隔与窗口重新查找的退避时间（秒）
+PLACEHOLDER_INTERVAL = 1.0
+PROBE_INITIAL_DELAY = 0.5
+PROBE_MAX_DELAY = 8.0
+
 
 class StreamController:
-    """推流控制器：负责推流状态机，窗口查找与画面捕获通过协作者完成。"""
+    """推流控制器：负责推流状态机，窗口查找与画面捕获通过协作者完成。
+
+    同一目标应用的所有客户端共享一个 FrameBroadcaster，每帧只捕获一次，
+    每种画质配置只缩放、遮罩和编码一次。
+
+    目标窗口不存在或消失时进入占位模式：以约1帧每秒发送只编码一次的占位画面，
+    并按指数退避重新查找窗口，找到后无缝切换回实时画面。
+    """
 
     def __init__(self, target_app: str = 'yuanshen.exe', finder: WindowFinder | None = None,
-                 capture: FrameCapture | None = None):
+                 capture: FrameCapture | None = None, change_threshold: float = 1.0,
+                 keepalive_interval: float = 1.0, mask_engine: PrivacyMaskEngine | None = None,
+                 encode_workers: int = 2, dvr_seconds: float = 0, dvr_fps: float = 5.0,
+                 dvr_max_bytes: int = 64 * 1024 * 1024, backend: CaptureBackend | None = None):
         self.target_app = target_app
-        self.is_streaming = False
         self.hwnd = None
-        self.finder = finder or WindowFinder()
-        self.capture = capture or FrameCapture()
+        self.mode = 'live'  # live 实时画面 / placeholder 占位画面
+        self._placeholder_chunk: Optional[bytes] = None
+        self._probe_delay = PROBE_INITIAL_DELAY
+        self._next_probe = 0.0
+        self._last_placeholder = 0.0
+        self.buffer_pool = FrameBufferPool()
+        self._frame_regions: Dict[int, CropBox] = {}  # 只捕获了部分区域的帧 -> 其归一化裁剪框
+        # 未指定捕获后端时使用 Win32 后端，finder 与 capture 用于替换其中的窗口查找与截图
+        self.backend = backend or Win32CaptureBackend(finder, capture, self.buffer_pool)
+        if getattr(self.backend, 'pool', True) is None:
+            # 捕获后端未指定缓冲池时使用控制器的缓冲池，捕获的画面在发布后归还复用
+            self.backend.pool = self.buffer_pool
+        self.mask_engine = mask_engine or get_mask_engine()
+        # 回放缓冲区，dvr_seconds 为0时不保存
+        self.dvr = FrameRingBuffer(dvr_seconds, dvr_fps, dvr_max_bytes) if dvr_seconds > 0 else None
+        self.broadcaster = FrameBroadcaster(self._capture_frame, self._render_chunk, name=target_app,
+                                            on_start=self._locate_window, on_stop=self.release_capture,
+                                            change_detector=FrameChangeDetector(change_threshold),
+                                            keepalive_interval=keepalive_interval,
+                                            encode_workers=encode_workers, release_frame=self._release_frame,
+                                            on_publish=self._record_frame if self.dvr else None)
+
+    @property
+    def is_streaming(self) -> bool:
+        return self.broadcaster.is_running
 
     def find_window_by_process_name(self, process_name: str) -> int:
-        return self.finder.find(process_name)
+        return self.backend.find(process_name)
 
-    def capture_window(self, hwnd: int) -> np.ndarray:
-        return self.capture.capture(hwnd, self.target_app)
+    def capture_window(self, hwnd: int, region: Optional[CropBox] = None) -> np.ndarray:
+        frame = self.backend.capture(hwnd, region)
+        if frame is not None and region is not None:
+            self._frame_regions[id(frame)] = region
+        return frame
 
-    def generate_frames(self):
+    def _release_frame(self, frame: np.ndarray):
+        self._frame_regions.pop(id(frame), None)
+        self.buffer_pool.release(frame)
+
+    def _capture_region(self, hwnd: int) -> Optional[CropBox]:
+        """所有频道都只需要部分区域时，返回包含这些区域的最小裁剪框，在捕获时直接裁剪。"""
+        crops = [profile.crop for profile in self.broadcaster.channels]
+        if not crops or any(crop is None for crop in crops):
+            return None
+        width, height = 1, 1
+        if not all(crop.normalized for crop in crops):
+            width, height = self.backend.window_size(hwnd)
+            if width <= 0 or height <= 0:
+                return None
+        return union_box(crop.to_box(width, height) for crop in crops)
+
+    def _find_window(self) -> int:
         try:
+            return self.find_window_by_process_name(self.target_app)
+        except Exception as e:
+            logger.error(f"查找窗口时发生错误: {e}")
+            return 0
+
+    def _locate_window(self):
+        self.hwnd = self._find_window()
+        if self.hwnd:
+            self.mode = 'live'
+        else:
+            logger.warning(f"未找到进程 {self.target_app} 的窗口，进入占位模式")
+            self._enter_placeholder()
+
+    def _enter_placeholder(self):
+        self.mode = 'placeholder'
+        self.hwnd = None
+        self._probe_delay = PROBE_INITIAL_DELAY
+        self._next_probe = time.monotonic() + self._probe_delay
+        self._last_placeholder = 0.0
+
+    def _get_placeholder_chunk(self) -> bytes:
+        if self._placeholder_chunk is None:
             import cv2
-            import win32gui
 
-            if self.target_app == '桌面.exe':
-                self.hwnd = win32gui.GetDesktopWindow()
-            else:
-                self.hwnd = self.find_window_by_process_name(self.target_app)
+            frame = np.zeros((480, 640, 3), dtype=np.uint8)
+            text = f'Waiting for {self.target_app}' if self.target_app.isascii() else 'Waiting for window'
+            cv2.putText(frame, text, (40, 240), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2, cv2.LINE_AA)
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            self._placeholder_chunk = build_multipart_chunk(buffer.tobytes())
+        return self._placeholder_chunk
+
+    def _serve_placeholder(self) -> Optional[np.ndarray]:
+        """占位模式下按退避时间重新查找窗口，未找到时按固定间隔直接发布占位画面。"""
+        now = time.monotonic()
+        if now >= self._next_probe:
+            hwnd = self._find_window()
+            if hwnd:
+                logger.info(f"已找到进程 {self.target_app} 的窗口，切换为实时画面")
+                self.hwnd = hwnd
+                self.mode = 'live'
+                # 确保第一帧实时画面立即发布，而不是被当作未变化的画面跳过
+                self.broadcaster.change_detector.reset()
+                return self.capture_window(hwnd, self._capture_region(hwnd))
+            self._probe_delay = min(self._probe_delay * 2, PROBE_MAX_DELAY)
+            self._next_probe = now + self._probe_delay
+
+        if now - self._last_placeholder >= PLACEHOLDER_INTERVAL:
+            self._last_placeholder = now
+            self.broadcaster.publish_all(self._get_placeholder_chunk())
+        return None
 
+    def release_capture(self):
+        """释放捕获后端占用的资源，下次捕获时重新创建。"""
+        self.backend.release()
+
+    def _capture_frame(self) -> Optional[np.ndarray]:
+        if self.mode == 'placeholder':
+            return self._serve_placeholder()
+
+        if not self.backend.is_valid(self.hwnd):
+            logger.warning(f"窗口句柄 {self.hwnd} 已失效，重新查找窗口")
+            self.hwnd = self._find_window()
             if not self.hwnd:
-                logger.warning(f"未找到进程 {self.target_app} 的窗口")
-                self.is_streaming = True
-                while self.is_streaming:
-                    try:
-                        frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                        if ret:
-                            frame_bytes = buffer.tobytes()
-                            yield (b'--frame\r\n'
-                                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                        time.sleep(1 / 30)
-                    except GeneratorExit:
-                        logger.info(f"检测到客户端断开连接，停止推流 - 目标应用: {self.target_app}")
-                        self.is_streaming = False
-                        break
-                    except Exception as e:
-                        logger.error(f"生成黑屏帧时发生错误: {e}")
-                        time.sleep(0.1)
-                return
-
-            self.is_streaming = True
-            logger.info(f"开始推流 - 目标应用: {self.target_app}")
-
-            while self.is_streaming:
-                try:
-                    if self.target_app != '桌面.exe':
-                        if not win32gui.IsWindow(self.hwnd) or not win32gui.IsWindowVisible(self.hwnd):
-                            logger.warning(f"窗口句柄 {self.hwnd} 已失效，重新查找窗口")
-                            self.hwnd = self.find_window_by_process_name(self.target_app)
-                            if not self.hwnd:
-                                logger.warning(f"无法重新找到进程 {self.target_app} 的窗口，返回黑屏")
-                                frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                                self.is_streaming = False
-                            else:
-                                frame = self.capture_window(self.hwnd)
-                        else:
-                            frame = self.capture_window(self.hwnd)
-                    else:
-                        frame = self.capture_window(self.hwnd)
-
-                    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                    if ret:
-                        frame_bytes = buffer.tobytes()
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-
-                    time.sleep(1 / 30)
-                except GeneratorExit:
-                    logger.info(f"检测到客户端断开连接，停止推流 - 目标应用: {self.target_app}")
-                    self.is_streaming = False
-                    break
-                except Exception as e:
-                    logger.error(f"生成视频帧时发生错误: {e}")
-                    time.sleep(0.1)
+                logger.warning(f"无法重新找到进程 {self.target_app} 的窗口，进入占位模式")
+                self._enter_placeholder()
+                return self._serve_placeholder()
+        return self.capture_window(self.hwnd, self._capture_region(self.hwnd))
+
+    def _crop_frame(self, frame: np.ndarray, profile: StreamProfile) -> Tuple[np.ndarray, Optional[CropBox]]:
+        """从捕获的画面中切出画质配置的裁剪区域（视图，不拷贝），返回画面及其在整个窗口中的裁剪框。"""
+        region = self._frame_regions.get(id(frame))
+        if profile.crop is None:
+            return frame, region
+
+        rx1, ry1, rx2, ry2 = region or (0.0, 0.0, 1.0, 1.0)
+        height, width = frame.shape[:2]
+        box = profile.crop.to_box(round(width / (rx2 - rx1)), round(height / (ry2 - ry1)))
+        relative = tuple(min(max((value - origin) / extent, 0.0), 1.0) for value, origin, extent in zip(
+            box, (rx1, ry1, rx1, ry1), (rx2 - rx1, ry2 - ry1, rx2 - rx1, ry2 - ry1)))
+        x1, y1, x2, y2 = box_to_pixels(relative, width, height)
+        # 遮罩按实际切出的像素区域定位，捕获区域与频道不一致时也不会错位
+        actual = (rx1 + x1 / width * (rx2 - rx1), ry1 + y1 / height * (ry2 - ry1),
+                  rx1 + x2 / width * (rx2 - rx1), ry1 + y2 / height * (ry2 - ry1))
+        return frame[y1:y2, x1:x2], actual
+
+    def render_frame(self, frame: np.ndarray, profile: StreamProfile) -> np.ndarray:
+        """按画质配置裁剪和缩放画面，并在缩放后的画面上应用隐私遮罩。
+
+        缩放结果来自缓冲池，使用完毕后应通过 buffer_pool.release 归还。
+        """
+        frame, crop = self._crop_frame(frame, profile)
+        frame = resize_frame(frame, profile, self.buffer_pool)
+        return self.mask_engine.apply(self.target_app, frame, crop=crop)
+
+    def encode_frame(self, frame: np.ndarray, profile: StreamProfile) -> Optional[bytes]:
+        """按画质配置缩放、遮罩并按其编码格式编码，编码失败时返回None。"""
+        rendered = self.render_frame(frame, profile)
+        try:
+            return encode_image(rendered, profile)
+        finally:
+            if rendered is not frame:
+                self.buffer_pool.release(rendered)
+
+    def _render_chunk(self, frame: np.ndarray, profile: StreamProfile) -> Optional[bytes]:
+        image = self.encode_frame(frame, profile)
+        return build_multipart_chunk(image, profile.mimetype) if image else None
+
+    def _record_frame(self, chunks: Dict[StreamProfile, bytes]):
+        """按回放缓冲区的帧率保存已发布的帧，多个画质频道时优先保存JPEG频道中分辨率与质量最高的一个。"""
+        if not self.dvr.due():
+            return
+        profile = max(chunks, key=lambda item: (item.codec == DEFAULT_CODEC, item.target_size(3840, 2160),
+                                                item.quality))
+        self.dvr.add(chunks[profile])
+
+    def latest_frame(self, profile: StreamProfile | None = None) -> Optional[bytes]:
+        """返回进行中推流最近一帧的图像数据，指定画质配置时只取该配置的频道，否则只取未裁剪的JPEG频道，没有可用帧时返回None。"""
+        latest = self.broadcaster.latest_chunks()
+        if profile is not None:
+            latest = {profile: latest[profile]} if profile in latest else {}
+        else:
+            # 未指定画质配置时只取完整窗口的JPEG频道
+            latest = {channel: item for channel, item in latest.items()
+                      if channel.crop is None and channel.codec == DEFAULT_CODEC}
+        if not latest:
+            return None
+        _, chunk = max(latest.values(), key=lambda item: item[0])
+        return parse_multipart_chunk(chunk)
+
+    def capture_snapshot(self, profile: StreamProfile | None = None) -> Optional[bytes]:
+        """一次性捕获目标窗口并按画质配置编码，窗口不存在时返回None。
+
+        捕获后端使用独立的资源完成捕获，不影响进行中推流的捕获会话。
+        """
+        hwnd = self._find_window()
+        if not hwnd:
+            return None
+        profile = profile or STREAM_PRESETS[DEFAULT_PRESET]
+        region = None
+        if profile.crop is not None:
+            width, height = self.backend.window_size(hwnd)
+            if width > 0 and height > 0:
+                region = profile.crop.to_box(width, height)
+        frame = self.backend.snapshot(hwnd, region)
+        if frame is None:
+            return None
+        if region is not None:
+            self._frame_regions[id(frame)] = region
+        try:
+            return self.encode_frame(frame, profile)
         finally:
-            if self.is_streaming:
-                self.is_streaming = False
-                logger.info(f"推流已停止 - 目标应用: {self.target_app}")
+            self._release_frame(frame)
+
+    def generate_frames(self, fps: float | None = None, profile: StreamProfile | None = None, adaptive: bool = True):
+        fps = fps or self.broadcaster.default_fps
+        profile = profile or STREAM_PRESETS[DEFAULT_PRESET]
+        # 自适应画质：客户端写入跟不上帧率时降低分辨率与质量
+        controller = AdaptiveQualityController(profile, 1 / fps) if adaptive else None
+        return self.broadcaster.subscribe(fps, profile, controller)
 
-    def start_stream(self) -> Response:
-        return Response(self.generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    def start_stream(self, fps: float | None = None, profile: StreamProfile | None = None,
+                     adaptive: bool = True) -> Response:
+        return Response(self.generate_frames(fps, profile, adaptive),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
 
     def stop_stream(self):
-        self.is_streaming = False
+        self.broadcaster.stop()
         logger.info('视频流已停止')
 
     def get_stream_info(self) -> Dict[str, Any]:
-        import win32gui
-
         return {
             'target_app': self.target_app,
             'is_streaming': self.is_streaming,
-            'window_found': bool(self.hwnd and self.hwnd != win32gui.GetDesktopWindow()),
+            'window_found': bool(self.hwnd) and self.target_app != DESKTOP_APP,
             'hwnd': self.hwnd,
+            'mode': self.mode,
+            'viewers': self.broadcaster.subscriber_count,
+            'profiles': [profile.to_dict() for profile in self.broadcaster.channels],
+            'clients': self.broadcaster.clients(),
+            'buffer_pool': self.buffer_pool.get_stats(),
+            'dvr': self.dvr.get_stats() if self.dvr else None,
+            **self.broadcaster.get_stats(),
         }
 
     def get_available_programs(self) -> List[str]:
-        return self.finder.list_programs()
+        return self.backend.list_programs()
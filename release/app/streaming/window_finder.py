@@ -1,28 +1,116 @@
 import logging
 import os
-from typing import Callable, List
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 后台刷新窗口注册表的间隔、查找未命中时同步刷新的最小间隔与进程名缓存的有效期（秒）
+REFRESH_INTERVAL = 5.0
+MIN_REFRESH_INTERVAL = 1.0
+PROCESS_NAME_TTL = 300.0
+
+IGNORED_PROGRAMS = ('system', 'dwm.exe', 'explorer.exe')
+
+
+def _process_create_time(pid: int) -> Optional[float]:
+    try:
+        import psutil
+        return psutil.Process(pid).create_time()
+    except Exception:
+        return None
+
+
+class ProcessNameCache:
+    """进程名缓存：以 (pid, 进程创建时间) 为键，PID 被新进程复用时创建时间不同，不会返回旧进程的名称。
+
+    解析失败的结果同样会被缓存，避免对无权限访问的进程反复尝试 OpenProcess。
+    """
+
+    def __init__(self, resolver: Callable[[int], Optional[str]], ttl: float = PROCESS_NAME_TTL,
+                 create_time: Callable[[int], Optional[float]] = _process_create_time,
+                 clock: Callable[[], float] = time.monotonic):
+        self._resolver = resolver
+        self._create_time = create_time
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Tuple[Optional[float], Optional[str], float]] = {}  # pid -> (创建时间, 进程名, 过期时间)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pid: int) -> Optional[str]:
+        create_time = self._create_time(pid)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(pid)
+            if entry is not None and entry[0] == create_time and now < entry[2]:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        name = self._resolver(pid)
+        with self._lock:
+            self._entries[pid] = (create_time, name, now + self.ttl)
+        return name
+
+    def prune(self, alive_pids: Iterable[int]):
+        """移除已不存在窗口的进程，避免缓存随进程启停无限增长。"""
+        alive = set(alive_pids)
+        with self._lock:
+            self._entries = {pid: entry for pid, entry in self._entries.items() if pid in alive}
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
 
 class WindowFinder:
-    """负责视窗列举与查找，供推流和程序列表共用。"""
+    """负责视窗列举与查找，供推流和程序列表共用。
+
+    一次枚举同时建立 进程名 -> 窗口句柄 的注册表与可推流程序列表，进程名通过 ProcessNameCache 解析，
+    之后的查找与列举只读取注册表。background 为真时在首次使用后由后台线程低频刷新注册表；
+    查找未命中或缓存的句柄已失效时同步刷新一次（受最小刷新间隔限制）。
+    """
+
+    def __init__(self, refresh_interval: float = REFRESH_INTERVAL, background: bool = False,
+                 clock: Callable[[], float] = time.monotonic):
+        self.refresh_interval = refresh_interval
+        self.background = background
+        self._clock = clock
+        self.process_names = ProcessNameCache(self._resolve_process_name)
+        self._refresh_lock = threading.Lock()
+        self._windows: Dict[str, List[int]] = {}  # 进程名 -> 可见窗口句柄（按枚举顺序）
+        self._programs: List[str] = []
+        self._refreshed_at: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
 
-    def _iter_visible_windows(self, handler: Callable[[int, int], None]):
+    def _enumerate_windows(self) -> List[Tuple[int, int, str]]:
+        """枚举所有可见窗口，返回 (窗口句柄, 进程ID, 窗口标题) 列表。"""
         import win32gui
         import win32process
 
+        windows: List[Tuple[int, int, str]] = []
+
         def enum_windows_proc(hwnd, l_param):
             if not win32gui.IsWindowVisible(hwnd):
                 return True
             try:
                 _, pid = win32process.GetWindowThreadProcessId(hwnd)
-                handler(hwnd, pid)
+                windows.append((hwnd, pid, win32gui.GetWindowText(hwnd)))
             except Exception as e:
                 logger.debug(f"枚举窗口时发生错误: {e}")
             return True
 
         win32gui.EnumWindows(enum_windows_proc, None)
+        return windows
+
+    def _is_window_valid(self, hwnd: int) -> bool:
+        import win32gui
+        return bool(win32gui.IsWindow(hwnd) and win32gui.IsWindowVisible(hwnd))
 
     def _resolve_process_name(self, pid: int) -> str | None:
         import win32api
@@ -60,33 +148,78 @@ class WindowFinder:
                 except Exception:
                     pass
 
-    def find(self, process_name: str) -> int:
-        windows: List[int] = []
+    def refresh(self):
+        """重新枚举窗口并替换注册表。"""
+        with self._refresh_lock:
+            self._refresh_locked()
 
-        def handler(hwnd: int, pid: int):
-            if windows:
-                return
-            current_name = self._resolve_process_name(pid)
-            if current_name and current_name == process_name.lower():
-                windows.append(hwnd)
+    def _refresh_locked(self):
+        windows: Dict[str, List[int]] = {}
+        programs = set()
+        pids = set()
+        for hwnd, pid, title in self._enumerate_windows():
+            pids.add(pid)
+            process_name = self.process_names.get(pid)
+            if not process_name:
+                continue
+            windows.setdefault(process_name, []).append(hwnd)
+            if title.strip() and process_name not in IGNORED_PROGRAMS:
+                programs.add(process_name)
+        self.process_names.prune(pids)
+        self._windows = windows
+        self._programs = sorted(programs)
+        self._refreshed_at = self._clock()
+        logger.debug(f"扫描完成，找到 {len(self._programs)} 个可推流程序")
 
-        self._iter_visible_windows(handler)
-        return windows[0] if windows else 0
+    def _ensure_fresh(self, max_age: float) -> bool:
+        """注册表早于 max_age 秒时同步刷新，返回是否进行了刷新。"""
+        self._start_refresher()
+        with self._refresh_lock:
+            # 等待其他线程刷新完成后再次检查，同一时间的并发请求只枚举一次
+            if self._refreshed_at is not None and self._clock() - self._refreshed_at <= max_age:
+                return False
+            self._refresh_locked()
+            return True
+
+    def _lookup(self, process_name: str) -> int:
+        for hwnd in self._windows.get(process_name, ()):
+            if self._is_window_valid(hwnd):
+                return hwnd
+        return 0
+
+    def find(self, process_name: str) -> int:
+        process_name = process_name.lower()
+        refreshed = self._ensure_fresh(self.refresh_interval * 2)
+        hwnd = self._lookup(process_name)
+        if not hwnd and not refreshed and self._ensure_fresh(MIN_REFRESH_INTERVAL):
+            hwnd = self._lookup(process_name)
+        return hwnd
 
     def list_programs(self) -> List[str]:
-        import win32gui
+        self._ensure_fresh(self.refresh_interval * 2)
+        return list(self._programs)
+
+    def _start_refresher(self):
+        if not self.background or self._refresher is not None:
+            return
+        with self._refresh_lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name='window-finder', daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"刷新窗口列表时发生错误: {e}")
 
-        programs: List[str] = []
+    def stop(self):
+        """停止后台刷新线程。"""
+        self._stop_event.set()
 
-        def handler(hwnd: int, pid: int):
-            window_title = win32gui.GetWindowText(hwnd)
-            if not window_title.strip():
-                return
-            process_name = self._resolve_process_name(pid)
-            if process_name and process_name not in ['system', 'dwm.exe', 'explorer.exe']:
-                programs.append(process_name)
 
-        self._iter_visible_windows(handler)
-        unique_programs = sorted(list(set(programs)))
-        logger.debug(f"扫描完成，找到 {len(unique_programs)} 个可推流程序")
-        return unique_programs
+@lru_cache(maxsize=None)
+def get_window_finder() -> WindowFinder:
+    """返回进程内共享的窗口查找器，由程序列表与各推流控制器共用同一份注册表。"""
+    return WindowFinder(background=True)
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+推流性能基准测试
+使用合成的BGRA画面代替GDI截图，按分辨率测量捕获、颜色转换、遮罩、JPEG编码与multipart封装各阶段的耗时，
+并在不同客户端数量下测量端到端帧率、帧耗时、CPU占用与发送字节数，结果以JSON输出，可作为回归比较的基线。
+同时在相同画面上比较各编码格式（JPEG/WebP）的每帧字节数与编码耗时，可以用 --source 指定真实游戏画面的图片目录或视频。
+
+用法:
+    python benchmark_stream.py --output baseline.json
+    python benchmark_stream.py --resolutions 720p,1080p --clients 1,3 --compare baseline.json
+    python benchmark_stream.py --resolutions 1080p --clients 1 --codecs jpeg,webp --source recordings/
+"""
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import psutil
+
+from app.streaming.backends import ReplayCaptureBackend
+from app.streaming.broadcaster import build_multipart_chunk
+from app.streaming.capture import FrameCapture
+from app.streaming.profiles import CODECS, STREAM_PRESETS, encode_image, resolve_profile
+from app.streaming.roi import CropBox, box_to_pixels
+from app.streaming.streamer import StreamController
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4k': (3840, 2160),
+}
+STAGES = ('capture', 'color', 'mask', 'encode', 'framing')
+TARGET_APP = 'yuanshen.exe'
+
+
+class BgraReplayBackend(ReplayCaptureBackend):
+    """以GDI截图相同的BGRA格式产生画面，再经过 FrameCapture 的颜色转换，与真实捕获路径的开销一致。"""
+
+    def __init__(self, width: int, height: int, motion: float = 4.0):
+        super().__init__(width=width, height=height, motion=motion)
+        import cv2
+
+        self.frame_capture = FrameCapture()
+        self._bgra_base = cv2.cvtColor(self._synthetic_frame(), cv2.COLOR_BGR2BGRA)
+        self._bgra = np.empty_like(self._bgra_base)
+
+    def grab(self) -> np.ndarray:
+        """模拟 GetDIBits 把画面写入预分配的BGRA缓冲区。"""
+        return self.shift_into(self._bgra_base, self._bgra)
+
+    def capture(self, hwnd: int, region: Optional[CropBox] = None) -> Optional[np.ndarray]:
+        with self._lock:
+            bgra = self.grab()
+            if region is not None:
+                x1, y1, x2, y2 = box_to_pixels(region, self.width, self.height)
+                bgra = bgra[y1:y2, x1:x2]
+            return self.frame_capture._to_bgr(bgra)
+
+
+def create_controller(width: int, height: int) -> StreamController:
+    backend = BgraReplayBackend(width, height)
+    controller = StreamController(TARGET_APP, backend=backend)
+    # 颜色转换的输出使用控制器的缓冲池，发布后归还
+    backend.frame_capture.pool = controller.buffer_pool
+    return controller
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {'p50': None, 'p99': None}
+    p50, p99 = np.percentile(np.array(values) * 1000, [50, 99])
+    return {'p50': round(float(p50), 3), 'p99': round(float(p99), 3)}
+
+
+def measure_stages(width: int, height: int, frames: int) -> Dict[str, Dict[str, Optional[float]]]:
+    """逐帧测量各处理阶段的耗时（毫秒）。"""
+    import cv2
+
+    controller = create_controller(width, height)
+    backend = controller.backend
+    quality = STREAM_PRESETS['original'].quality
+    timings = {stage: [] for stage in STAGES}
+    for _ in range(frames):
+        started = time.perf_counter()
+        bgra = backend.grab()
+        captured = time.perf_counter()
+        frame = backend.frame_capture._to_bgr(bgra)
+        converted = time.perf_counter()
+        frame = controller.mask_engine.apply(TARGET_APP, frame)
+        masked = time.perf_counter()
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        encoded = time.perf_counter()
+        build_multipart_chunk(buffer.tobytes())
+        framed = time.perf_counter()
+        controller.buffer_pool.release(frame)
+
+        for stage, elapsed in zip(STAGES, (captured - started, converted - captured, masked - converted,
+                                           encoded - masked, framed - encoded)):
+            timings[stage].append(elapsed)
+    return {stage: percentiles(values) for stage, values in timings.items()}
+
+
+def measure_codecs(width: int, height: int, frames: int, codecs: List[str],
+                   source: str = '') -> Dict[str, Dict[str, Any]]:
+    """在同一组画面上比较各编码格式的每帧字节数与编码耗时（毫秒），质量使用各编码格式在原画预设下的质量。"""
+    backend = ReplayCaptureBackend(source, width, height)
+    profiles = {codec: resolve_profile(codec=codec) for codec in codecs}
+    sizes = {codec: [] for codec in codecs}
+    timings = {codec: [] for codec in codecs}
+    for _ in range(frames):
+        frame = backend.capture(1)
+        if frame is None:
+            break
+        for codec, profile in profiles.items():
+            started = time.perf_counter()
+            data = encode_image(frame, profile)
+            timings[codec].append(time.perf_counter() - started)
+            sizes[codec].append(len(data) if data else 0)
+    backend.release()
+
+    return {
+        codec: {
+            'quality': profiles[codec].quality,
+            'bytes_per_frame': round(sum(sizes[codec]) / len(sizes[codec])) if sizes[codec] else None,
+            'encode_ms': percentiles(timings[codec]),
+        }
+        for codec in codecs
+    }
+
+
+def measure_clients(width: int, height: int, clients: int, frames: int, fps: float) -> Dict[str, Any]:
+    """多个客户端同时观看时测量端到端性能，每个客户端接收 frames 帧后断开。"""
+    controller = create_controller(width, height)
+    received = [0] * clients
+    received_bytes = [0] * clients
+
+    def consume(index: int):
+        stream = controller.generate_frames(fps=fps, adaptive=False)
+        for chunk in stream:
+            received[index] += 1
+            received_bytes[index] += len(chunk)
+            if received[index] >= frames:
+                break
+        stream.close()
+
+    process = psutil.Process()
+    process.cpu_percent(None)
+    threads = [threading.Thread(target=consume, args=(i,), daemon=True) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=frames / fps * 10 + 30)
+    elapsed = time.perf_counter() - started
+    cpu_percent = process.cpu_percent(None)
+    stats = controller.broadcaster.get_stats()
+    controller.stop_stream()
+
+    return {
+        'clients': clients,
+        'fps': round(sum(received) / clients / elapsed, 2),
+        'producer_fps': stats['achieved_fps'],
+        'frame_time_ms': {'p50': stats['frame_time_ms']['p50'], 'p99': stats['frame_time_ms']['p99']},
+        'cpu_percent': round(cpu_percent, 1),
+        'bytes_per_second': round(sum(received_bytes) / elapsed),
+    }
+
+
+def run_benchmark(resolutions: List[str], client_counts: List[int], frames: int = 60,
+                  fps: float = 60, codecs: Optional[List[str]] = None, source: str = '') -> Dict[str, Any]:
+    """
+    运行基准测试
+
+    Args:
+        resolutions: 分辨率名称列表，见 RESOLUTIONS
+        client_counts: 并发客户端数量列表
+        frames: 每项测量的帧数
+        fps: 客户端请求的帧率
+        codecs: 参与比较的编码格式，默认为全部
+        source: 编码格式比较使用的图片目录或视频，为空时使用合成画面
+
+    Returns:
+        Dict[str, Any]: 包含运行环境与各分辨率结果的报告
+    """
+    import cv2
+
+    codecs = codecs or list(CODECS)
+    results = []
+    for name in resolutions:
+        width, height = RESOLUTIONS[name]
+        print(f"测试分辨率 {name} ({width}x{height})...", file=sys.stderr)
+        results.append({
+            'resolution': name,
+            'size': [width, height],
+            'stages_ms': measure_stages(width, height, frames),
+            'clients': [measure_clients(width, height, count, frames, fps) for count in client_counts],
+            'codecs': measure_codecs(width, height, frames, codecs, source),
+        })
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': psutil.cpu_count(),
+            'frames': frames,
+            'fps': fps,
+            'source': source or 'synthetic',
+        },
+        'results': results,
+    }
+
+
+def compare_reports(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """
+    与基线报告比较，返回超出容差的退化项
+
+    阶段与编码格式的编码耗时p50增加、每帧字节数增加或端到端帧率下降超过 tolerance 比例时视为退化，
+    只比较两份报告都包含的项。
+    """
+    regressions = []
+    baseline_results = {result['resolution']: result for result in baseline.get('results', [])}
+    for result in current.get('results', []):
+        previous = baseline_results.get(result['resolution'])
+        if previous is None:
+            continue
+        for stage, timing in result['stages_ms'].items():
+            old = previous['stages_ms'].get(stage, {}).get('p50')
+            new = timing.get('p50')
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{result['resolution']} {stage} p50: {old}ms -> {new}ms")
+        previous_clients = {item['clients']: item for item in previous['clients']}
+        for item in result['clients']:
+            old = previous_clients.get(item['clients'], {}).get('fps')
+            if old and item['fps'] < old * (1 - tolerance):
+                regressions.append(f"{result['resolution']} {item['clients']}个客户端 fps: {old} -> {item['fps']}")
+        for codec, item in result.get('codecs', {}).items():
+            previous_codec = previous.get('codecs', {}).get(codec, {})
+            for name, old, new in (('encode p50', previous_codec.get('encode_ms', {}).get('p50'),
+                                    item['encode_ms']['p50']),
+                                   ('bytes/frame', previous_codec.get('bytes_per_frame'), item['bytes_per_frame'])):
+                if old and new and new > old * (1 + tolerance):
+                    regressions.append(f"{result['resolution']} {codec} {name}: {old} -> {new}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推流性能基准测试')
+    parser.add_argument('--resolutions', default='720p,1080p,1440p,4k',
+                        help=f'逗号分隔的分辨率，可选值: {", ".join(RESOLUTIONS)}')
+    parser.add_argument('--clients', default='1,3,10', help='逗号分隔的并发客户端数量')
+    parser.add_argument('--frames', type=int, default=60, help='每项测量的帧数')
+    parser.add_argument('--fps', type=float, default=60, help='客户端请求的帧率')
+    parser.add_argument('--output', help='结果JSON的输出路径，不指定时输出到标准输出')
+    parser.add_argument('--compare', help='用于比较的基线JSON路径，存在退化时以退出码1结束')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='判定退化的容差比例')
+    parser.add_argument('--codecs', default=','.join(CODECS), help=f'逗号分隔的编码格式，可选值: {", ".join(CODECS)}')
+    parser.add_argument('--source', default='', help='编码格式比较使用的图片目录或视频文件，不指定时使用合成画面')
+    args = parser.parse_args()
+
+    resolutions = [name.strip().lower() for name in args.resolutions.split(',') if name.strip()]
+    unknown = [name for name in resolutions if name not in RESOLUTIONS]
+    if unknown:
+        parser.error(f'未知的分辨率: {", ".join(unknown)}')
+    client_counts = [int(count) for count in args.clients.split(',') if count.strip()]
+    codecs = [codec.strip().lower() for codec in args.codecs.split(',') if codec.strip()]
+    unknown = [codec for codec in codecs if codec not in CODECS]
+    if unknown:
+        parser.error(f'未知的编码格式: {", ".join(unknown)}')
+
+    report = run_benchmark(resolutions, client_counts, args.frames, args.fps, codecs, args.source)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            regressions = compare_reports(json.load(file), report, args.tolerance)
+        for line in regressions:
+            print(f"性能退化: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("未发现性能退化", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
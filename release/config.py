@@ -101,6 +101,78 @@ class Config:
     def ENABLE_CORS(self):
         return os.environ.get('ENABLE_CORS', 'false').lower() == 'true'
     
+    @property
+    def STREAM_DEFAULT_FPS(self):
+        return float(os.environ.get('STREAM_DEFAULT_FPS', '30'))
+    
+    @property
+    def STREAM_MAX_FPS(self):
+        return float(os.environ.get('STREAM_MAX_FPS', '60'))
+    
+    @property
+    def STREAM_ADAPTIVE_QUALITY(self):
+        return os.environ.get('STREAM_ADAPTIVE_QUALITY', 'true').lower() == 'true'
+    
+    @property
+    def STREAM_CHANGE_THRESHOLD(self):
+        return float(os.environ.get('STREAM_CHANGE_THRESHOLD', '1.0'))
+    
+    @property
+    def STREAM_KEEPALIVE_INTERVAL(self):
+        return float(os.environ.get('STREAM_KEEPALIVE_INTERVAL', '1.0'))
+    
+    @property
+    def STREAM_PRIVACY_MASKS(self):
+        return os.environ.get('STREAM_PRIVACY_MASKS', '')
+    
+    @property
+    def STREAM_ENCODE_WORKERS(self):
+        return int(os.environ.get('STREAM_ENCODE_WORKERS', '2'))
+    
+    @property
+    def STREAM_SNAPSHOT_TTL(self):
+        return float(os.environ.get('STREAM_SNAPSHOT_TTL', '1.0'))
+    
+    @property
+    def STREAM_DVR_SECONDS(self):
+        return float(os.environ.get('STREAM_DVR_SECONDS', '30'))
+    
+    @property
+    def STREAM_DVR_FPS(self):
+        return float(os.environ.get('STREAM_DVR_FPS', '5'))
+    
+    @property
+    def STREAM_DVR_MAX_MB(self):
+        return int(os.environ.get('STREAM_DVR_MAX_MB', '64'))
+    
+    @property
+    def STREAM_DVR_GRACE_SECONDS(self):
+        return float(os.environ.get('STREAM_DVR_GRACE_SECONDS', '60'))
+    
+    @property
+    def STREAM_CAPTURE_BACKEND(self):
+        return os.environ.get('STREAM_CAPTURE_BACKEND', 'win32')
+    
+    @property
+    def STREAM_REPLAY_SOURCE(self):
+        return os.environ.get('STREAM_REPLAY_SOURCE', '')
+    
+    @property
+    def STREAM_REPLAY_SIZE(self):
+        return os.environ.get('STREAM_REPLAY_SIZE', '1920x1080')
+    
+    @property
+    def STREAM_REPLAY_MOTION(self):
+        return float(os.environ.get('STREAM_REPLAY_MOTION', '4'))
+    
+    @property
+    def STREAM_ROI_PRESETS(self):
+        return os.environ.get('STREAM_ROI_PRESETS', '')
+    
+    @property
+    def STREAM_MOSAIC_TILE_SIZE(self):
+        return os.environ.get('STREAM_MOSAIC_TILE_SIZE', '960x540')
+    
     @staticmethod
     def init_app(app):
         """
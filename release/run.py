@@ -223,15 +223,30 @@ def cleanup_resources():
     清理资源的函数
     """
     try:
-        # 导入并清理推流控制器
-        from app.api.views import stream_controller
-        if stream_controller and stream_controller.is_streaming:
+        # 导入并停止所有推流控制器
+        from app.api.views import stream_registry
+        if stream_registry.controllers():
             logger.info("正在停止推流...")
-            stream_controller.stop_stream()
+            stream_registry.stop_all()
             logger.info("推流已停止")
     except Exception as e:
         logger.error(f"清理推流资源时发生错误: {e}")
     
+    try:
+        # 停止窗口列表的后台刷新
+        from app.streaming.window_finder import get_window_finder
+        get_window_finder().stop()
+    except Exception as e:
+        logger.error(f"停止窗口列表刷新时发生错误: {e}")
+    
+    try:
+        # 保存日志数据快照，供下次启动时快速恢复
+        from app.api.views import log_controller
+        if log_controller:
+            log_controller.save_snapshot()
+    except Exception as e:
+        logger.error(f"保存日志数据快照时发生错误: {e}")
+    
     try:
         # 清理其他可能的资源
         logger.info("清理其他资源...")
@@ -58,7 +58,7 @@ class TestAPI(unittest.TestCase):
             'duration': {'日期': ['20250101'], '持续时间': [3600]},
             'item': {'物品名称': ['测试物品'], '时间': ['12:00:00'], '日期': ['20250101'], '归属配置组': ['测试组']}
         }
-        mock_controller.get_log_data.return_value = mock_data
+        mock_controller.get_log_data_json.return_value = json.dumps(mock_data).encode('utf-8')
         
         response = self.client.get('/api/LogData')
         self.assertEqual(response.status_code, 200)
@@ -67,6 +67,29 @@ class TestAPI(unittest.TestCase):
         self.assertIn('duration', data)
         self.assertIn('item', data)
     
+    @patch('app.api.views.log_controller')
+    def test_analyse_log_not_modified(self, mock_controller):
+        """
+        测试日志分析API的ETag条件请求
+        """
+        mock_controller.get_data_version.return_value = 'v1'
+        mock_controller.get_log_data_json.return_value = json.dumps({
+            'duration': {'日期': [], '持续时间': []},
+            'item': {'物品名称': [], '时间': [], '日期': [], '归属配置组': []}
+        }).encode('utf-8')
+
+        response = self.client.get('/api/LogData')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get('ETag'), '"v1"')
+
+        response = self.client.get('/api/LogData', headers={'If-None-Match': '"v1"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(mock_controller.get_log_data_json.call_count, 1)
+
+        mock_controller.get_data_version.return_value = 'v2'
+        response = self.client.get('/api/LogData', headers={'If-None-Match': '"v1"'})
+        self.assertEqual(response.status_code, 200)
+
     def test_controller_not_initialized(self):
         """
         测试控制器未初始化的情况
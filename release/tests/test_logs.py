@@ -0,0 +1,137 @@
+"""
+日志控制器测试模块
+测试日志数据的增量同步等功能
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+from app.controllers.logs import LogController, parse_sync_cursor, encode_compact_item_payload
+
+
+def make_entry(timestamp: str, item_name: str) -> str:
+    """
+    构造一条BetterGI拾取日志
+    """
+    return f'[{timestamp}] [INF] BetterGenshinImpact.GameTask.AutoPick\n交互或拾取："{item_name}"\n\n'
+
+
+class TestLogController(unittest.TestCase):
+    """
+    日志控制器测试
+    """
+
+    def setUp(self):
+        """
+        测试前的设置
+        """
+        self.temp_dir = tempfile.mkdtemp()
+        self.today_str = date.today().strftime('%Y%m%d')
+        self.write_log('20250101', make_entry('01:00:00.000', '摩拉') + make_entry('01:00:01.000', '经验书'))
+        self.write_log(self.today_str, make_entry('02:00:00.000', '原石') + make_entry('02:00:30.000', '原石'))
+        self.controller = LogController(self.temp_dir)
+
+    def tearDown(self):
+        """
+        测试后的清理
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def write_log(self, date_str: str, content: str, mode: str = 'w'):
+        path = os.path.join(self.temp_dir, f'better-genshin-impact{date_str}.log')
+        with open(path, mode, encoding='utf-8') as file:
+            file.write(content)
+
+    def test_sync_returns_only_new_rows(self):
+        """
+        测试增量同步只返回游标之后的新数据
+        """
+        full = self.controller.get_log_data_since('')
+        self.assertTrue(full['full'])
+        self.assertEqual(len(full['item']['物品名称']), 4)
+        self.assertIsNotNone(parse_sync_cursor(full['cursor']))
+
+        self.write_log(self.today_str, make_entry('02:01:00.000', '晶核'), mode='a')
+        self.write_log('20250102', make_entry('03:00:00.000', '树脂'))
+
+        delta = self.controller.get_log_data_since(full['cursor'])
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['item']['物品名称'], ['晶核', '树脂'])
+        self.assertEqual(delta['duration']['日期'], [self.today_str, '20250102'])
+
+        unchanged = self.controller.get_log_data_since(delta['cursor'])
+        self.assertEqual(unchanged['item']['物品名称'], [])
+        self.assertEqual(unchanged['cursor'], delta['cursor'])
+
+    def test_sync_invalid_cursor_returns_full_data(self):
+        """
+        测试无效游标或数据被删除时回退为全量数据
+        """
+        self.assertTrue(self.controller.get_log_data_since('invalid')['full'])
+
+        cursor = self.controller.get_log_data_since('')['cursor']
+        self.controller.log_manager.db_manager.delete_log_data('20250101')
+        self.assertTrue(self.controller.get_log_data_since(cursor)['full'])
+
+    def test_compact_format_round_trip(self):
+        """
+        测试紧凑格式可以还原为原始物品数据
+        """
+        full = self.controller.get_log_data()
+        compact = self.controller.get_log_data('compact')
+        self.assertEqual(compact['format'], 'compact')
+        self.assertEqual(compact['duration'], full['duration'])
+
+        strings = compact['item']['strings']
+        self.assertEqual(len(strings), len(set(strings)))
+        for key in ('物品名称', '日期', '归属配置组'):
+            self.assertEqual([strings[i] for i in compact['item'][key]], full['item'][key])
+        self.assertEqual(compact['item']['时间'][0], 2 * 3600 * 1000 + 30 * 1000)
+
+    def test_log_data_json_matches_payload(self):
+        """
+        测试拼接历史数据缓存得到的JSON与完整序列化的数据一致
+        """
+        self.assertEqual(json.loads(self.controller.get_log_data_json()), self.controller.get_log_data())
+
+        self.write_log(self.today_str, make_entry('02:01:00.000', '晶核'), mode='a')
+        self.write_log('20250102', make_entry('03:00:00.000', '树脂'))
+        spliced = json.loads(self.controller.get_log_data_json())
+        self.assertEqual(spliced, self.controller.get_log_data())
+        self.assertEqual(spliced['item']['物品名称'][0], '晶核')
+
+    def test_snapshot_warm_start(self):
+        """
+        测试重启后从快照恢复历史数据与今天日志的解析进度
+        """
+        expected = self.controller.get_log_data_json()
+        self.controller.save_snapshot()
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, 'CanLiangSnapshot.json')))
+
+        restarted = LogController(self.temp_dir)
+        manager = restarted.log_manager
+        self.assertIsNotNone(manager._historical_cache)
+        self.assertGreater(manager._today_reader.offset, 0)
+        self.assertEqual(restarted.get_log_data_json(), expected)
+
+        # 今天的日志被替换后，快照中的解析进度失效，重新完整解析
+        self.write_log(self.today_str, make_entry('05:00:00.000', '树脂') + make_entry('05:00:10.000', '树脂'))
+        restarted = LogController(self.temp_dir)
+        self.assertEqual(json.loads(restarted.get_log_data_json())['item']['物品名称'][:2], ['树脂', '树脂'])
+
+    def test_encode_compact_invalid_timestamp(self):
+        """
+        测试无法解析的时间编码为-1
+        """
+        encoded = encode_compact_item_payload({
+            '物品名称': ['摩拉'], '时间': ['bad'], '日期': ['20250101'], '归属配置组': ['']
+        })
+        self.assertEqual(encoded['时间'], [-1])
+        self.assertEqual(encoded['strings'], ['摩拉', '20250101', ''])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,228 +1,215 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-性能测试脚本 - 测试StreamController优化后的性能表现
+性能测试脚本 - 测试StreamController的捕获、编码与端到端推流性能
+使用回放捕获后端产生画面，不依赖Win32，可以在任意平台运行
 """
 
 import time
 import gc
+import json
+import threading
 import psutil
 import os
-from app.api.controllers import StreamController
-
-def test_desktop_capture_performance():
-    """测试桌面捕获性能"""
-    print("=== 桌面捕获性能测试 ===")
-    
-    # 初始化StreamController
-    sc = StreamController()
-    
+from app.streaming.backends import ReplayCaptureBackend
+from app.streaming.profiles import STREAM_PRESETS
+from app.streaming.streamer import StreamController
+
+
+def create_controller(width: int = 1280, height: int = 720, motion: float = 4.0) -> StreamController:
+    """创建使用合成画面的推流控制器"""
+    return StreamController('yuanshen.exe', backend=ReplayCaptureBackend(width=width, height=height, motion=motion),
+                            encode_workers=0)
+
+
+def measure_capture_performance(test_frames: int = 20, width: int = 1920, height: int = 1080):
+    """测试捕获性能"""
+    print("=== 捕获性能测试 ===")
+
+    sc = create_controller(width, height)
+
     # 预热
     print("预热中...")
     for _ in range(5):
-        frame = sc._capture_desktop_optimized()
-    
-    # 性能测试
-    test_frames = 20  # 减少测试帧数以降低内存使用
+        sc.buffer_pool.release(sc.capture_window(1))
+
     print(f"开始捕获 {test_frames} 帧...")
-    
+
     # 记录初始内存使用
     process = psutil.Process(os.getpid())
     initial_memory = process.memory_info().rss / 1024 / 1024  # MB
-    
+
     start_time = time.time()
-    
+
     for i in range(test_frames):
-        frame = sc._capture_desktop_optimized()
+        frame = sc.capture_window(1)
         # 不存储帧数据，只测试捕获性能
+        sc.buffer_pool.release(frame)
         if (i + 1) % 5 == 0:
             print(f"已捕获 {i + 1} 帧")
-    
+
     end_time = time.time()
-    
+
     # 计算性能指标
     elapsed_time = end_time - start_time
     fps = test_frames / elapsed_time
-    
+
     # 记录最终内存使用
     final_memory = process.memory_info().rss / 1024 / 1024  # MB
     memory_increase = final_memory - initial_memory
-    
+
     print(f"\n性能测试结果:")
     print(f"总耗时: {elapsed_time:.2f} 秒")
     print(f"平均帧率: {fps:.1f} FPS")
     print(f"单帧平均耗时: {elapsed_time/test_frames*1000:.1f} ms")
-    print(f"初始内存: {initial_memory:.1f} MB")
-    print(f"最终内存: {final_memory:.1f} MB")
     print(f"内存增长: {memory_increase:.1f} MB")
-    
-    # 获取一帧用于显示尺寸信息
-    sample_frame = sc._capture_desktop_optimized()
-    if sample_frame is not None:
-        print(f"帧尺寸: {sample_frame.shape}")
-    
+    print(f"帧尺寸: {(height, width, 3)}")
+
     # 清理资源
-    sc._cleanup_resources()
+    sc.stop_stream()
     gc.collect()
-    
-    return fps, memory_increase
 
-def test_window_capture_performance():
-    """测试窗口捕获性能"""
-    print("\n=== 窗口捕获性能测试 ===")
-    
-    sc = StreamController()
-    
-    # 获取可用程序
-    programs = sc.get_available_programs()
-    if not programs:
-        print("未找到可用程序")
-        return 0, 0
-    
-    # 选择第一个程序进行测试
-    target_program = programs[0]
-    print(f"测试程序: {target_program}")
-    
-    hwnd = sc.find_window_by_process_name(target_program)
-    if hwnd == 0:
-        print("未找到窗口句柄，使用桌面捕获")
-        return test_desktop_capture_performance()
-    
-    # 预热
-    print("预热中...")
-    for _ in range(5):
-        frame = sc._capture_normal_window_optimized(hwnd)
-    
-    # 性能测试
-    test_frames = 20  # 减少测试帧数以降低内存使用
-    print(f"开始捕获 {test_frames} 帧...")
-    
-    process = psutil.Process(os.getpid())
-    initial_memory = process.memory_info().rss / 1024 / 1024
-    
-    start_time = time.time()
-    
-    for i in range(test_frames):
-        frame = sc._capture_normal_window_optimized(hwnd)
-        # 不存储帧数据，只测试捕获性能
-        if (i + 1) % 5 == 0:
-            print(f"已捕获 {i + 1} 帧")
-    
-    end_time = time.time()
-    
-    elapsed_time = end_time - start_time
-    fps = test_frames / elapsed_time
-    
-    final_memory = process.memory_info().rss / 1024 / 1024
-    memory_increase = final_memory - initial_memory
-    
-    print(f"\n窗口捕获性能测试结果:")
-    print(f"总耗时: {elapsed_time:.2f} 秒")
-    print(f"平均帧率: {fps:.1f} FPS")
-    print(f"单帧平均耗时: {elapsed_time/test_frames*1000:.1f} ms")
-    print(f"内存增长: {memory_increase:.1f} MB")
-    
-    if frames:
-        print(f"帧尺寸: {frames[0].shape}")
-    
-    sc._cleanup_resources()
-    del frames
-    gc.collect()
-    
     return fps, memory_increase
 
-def test_encoding_performance():
-    """测试编码性能"""
+
+def measure_encoding_performance(test_count: int = 20, width: int = 1920, height: int = 1080):
+    """测试缩放、遮罩与编码性能"""
     print("\n=== 编码性能测试 ===")
-    
-    sc = StreamController()
-    
-    # 捕获一帧用于编码测试
-    frame = sc._capture_desktop_optimized()
-    if frame is None:
-        print("无法捕获帧进行编码测试")
-        return
-    
+
+    sc = create_controller(width, height)
+    frame = sc.capture_window(1)
     print(f"测试帧尺寸: {frame.shape}")
-    
-    # 测试编码性能
-    test_count = 20
-    print(f"开始编码 {test_count} 次...")
-    
+
+    results = {}
+    for preset in ('original', 'medium'):
+        profile = STREAM_PRESETS[preset]
+        encoded_sizes = []
+        start_time = time.time()
+        for _ in range(test_count):
+            encoded_sizes.append(len(sc.encode_frame(frame, profile)))
+        elapsed_time = time.time() - start_time
+
+        encoding_fps = test_count / elapsed_time
+        avg_size = sum(encoded_sizes) / len(encoded_sizes)
+        results[preset] = encoding_fps
+        print(f"\n画质预设: {preset}")
+        print(f"编码帧率: {encoding_fps:.1f} FPS")
+        print(f"单次编码耗时: {elapsed_time/test_count*1000:.1f} ms")
+        print(f"平均编码大小: {avg_size/1024:.1f} KB")
+
+    sc.buffer_pool.release(frame)
+    return results
+
+
+def measure_stream_performance(test_frames: int = 30, clients: int = 2, width: int = 1280, height: int = 720):
+    """测试多个客户端同时观看时的端到端推流性能"""
+    print(f"\n=== 端到端推流性能测试（{clients} 个客户端）===")
+
+    sc = create_controller(width, height)
+    received = [0] * clients
+    received_bytes = [0] * clients
+
+    def consume(index: int):
+        stream = sc.generate_frames(fps=60, adaptive=False)
+        for chunk in stream:
+            received[index] += 1
+            received_bytes[index] += len(chunk)
+            if received[index] >= test_frames:
+                break
+        stream.close()
+
     start_time = time.time()
-    encoded_sizes = []
-    
-    for i in range(test_count):
-        if sc._gpu_available:
-            encoded_data = sc._encode_frame_gpu(frame)
-        else:
-            # 使用CPU编码
-            import cv2
-            _, encoded_data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            encoded_data = encoded_data.tobytes()
-        
-        encoded_sizes.append(len(encoded_data))
-        
-        if (i + 1) % 5 == 0:
-            print(f"已编码 {i + 1} 次")
-    
-    end_time = time.time()
-    
-    elapsed_time = end_time - start_time
-    encoding_fps = test_count / elapsed_time
-    avg_size = sum(encoded_sizes) / len(encoded_sizes)
-    
-    print(f"\n编码性能测试结果:")
-    print(f"编码方式: {'GPU' if sc._gpu_available else 'CPU'}")
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    elapsed_time = time.time() - start_time
+    sc.stop_stream()
+
+    fps = min(received) / elapsed_time
+    stats = sc.broadcaster.get_stats()
     print(f"总耗时: {elapsed_time:.2f} 秒")
-    print(f"编码帧率: {encoding_fps:.1f} FPS")
-    print(f"单次编码耗时: {elapsed_time/test_count*1000:.1f} ms")
-    print(f"平均编码大小: {avg_size/1024:.1f} KB")
-    
-    sc._cleanup_resources()
+    print(f"客户端平均帧率: {fps:.1f} FPS")
+    print(f"生产者单帧耗时 p50/p95: {stats['frame_time_ms']['p50']} / {stats['frame_time_ms']['p95']} ms")
+    print(f"每个客户端接收: {sum(received_bytes) / clients / 1024:.1f} KB")
+
+    return fps, received
+
+
+def test_capture_performance():
+    fps, _ = measure_capture_performance(test_frames=5, width=640, height=360)
+    assert fps > 0
+
+
+def test_encoding_performance():
+    results = measure_encoding_performance(test_count=3, width=640, height=360)
+    assert all(fps > 0 for fps in results.values())
+
+
+def test_stream_performance():
+    _, received = measure_stream_performance(test_frames=5, clients=2, width=640, height=360)
+    assert received == [5, 5]
+
+
+def test_benchmark_report():
+    from benchmark_stream import run_benchmark, compare_reports
+
+    report = run_benchmark(['720p'], [1, 3], frames=3)
+    result = report['results'][0]
+    assert set(result['stages_ms']) == {'capture', 'color', 'mask', 'encode', 'framing'}
+    assert [item['clients'] for item in result['clients']] == [1, 3]
+    assert set(result['codecs']) == {'jpeg', 'webp'}
+    assert all(item['bytes_per_frame'] > 0 for item in result['codecs'].values())
+    assert compare_reports(report, report) == []
+
+    slower = json.loads(json.dumps(report))
+    slower['results'][0]['clients'][0]['fps'] = result['clients'][0]['fps'] / 2
+    assert len(compare_reports(report, slower)) == 1
+
 
 def main():
     """主测试函数"""
     print("StreamController 性能测试")
     print("=" * 50)
-    
+
     try:
-        # 测试桌面捕获性能
-        desktop_fps, desktop_memory = test_desktop_capture_performance()
-        
-        # 测试窗口捕获性能
-        window_fps, window_memory = test_window_capture_performance()
-        
+        # 测试捕获性能
+        capture_fps, capture_memory = measure_capture_performance()
+
         # 测试编码性能
-        test_encoding_performance()
-        
+        encoding_results = measure_encoding_performance()
+
+        # 测试端到端推流性能
+        stream_fps, _ = measure_stream_performance()
+
         # 总结
         print("\n" + "=" * 50)
         print("性能测试总结:")
-        print(f"桌面捕获帧率: {desktop_fps:.1f} FPS")
-        print(f"窗口捕获帧率: {window_fps:.1f} FPS")
-        print(f"桌面捕获内存增长: {desktop_memory:.1f} MB")
-        print(f"窗口捕获内存增长: {window_memory:.1f} MB")
-        
+        print(f"捕获帧率: {capture_fps:.1f} FPS")
+        print(f"原画编码帧率: {encoding_results['original']:.1f} FPS")
+        print(f"端到端推流帧率: {stream_fps:.1f} FPS")
+        print(f"捕获内存增长: {capture_memory:.1f} MB")
+
         # 性能评估
-        if desktop_fps >= 25:
-            print("✅ 桌面捕获性能优秀 (≥25 FPS)")
-        elif desktop_fps >= 20:
-            print("⚠️  桌面捕获性能良好 (≥20 FPS)")
+        if stream_fps >= 25:
+            print("✅ 推流性能优秀 (≥25 FPS)")
+        elif stream_fps >= 20:
+            print("⚠️  推流性能良好 (≥20 FPS)")
         else:
-            print("❌ 桌面捕获性能需要改进 (<20 FPS)")
-        
-        if desktop_memory < 50:
+            print("❌ 推流性能需要改进 (<20 FPS)")
+
+        if capture_memory < 50:
             print("✅ 内存使用优化良好 (<50 MB)")
-        elif desktop_memory < 100:
+        elif capture_memory < 100:
             print("⚠️  内存使用可接受 (<100 MB)")
         else:
             print("❌ 内存使用过高 (≥100 MB)")
-            
+
     except Exception as e:
         print(f"测试过程中发生错误: {e}")
         import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,1009 @@
+"""
+推流组件测试模块
+测试不依赖Win32的推流组件
+"""
+import os
+import threading
+import time
+import unittest
+from dataclasses import replace
+from unittest.mock import PropertyMock, patch
+
+import numpy as np
+
+from app.streaming.adaptive import AdaptiveQualityController
+from app.streaming.backends import ReplayCaptureBackend, create_capture_backend
+from app.streaming.broadcaster import FrameBroadcaster, build_multipart_chunk, parse_multipart_chunk
+from app.streaming.buffer_pool import FrameBufferPool
+from app.streaming.capture import GdiCaptureSession
+from app.streaming.change_detector import FrameChangeDetector
+from app.streaming.dvr import FrameRingBuffer, export_avi
+from app.streaming.masks import MAX_COMPILED_MASKS, PrivacyMaskEngine, get_mask_engine
+from app.streaming.mosaic import MosaicCaptureBackend, grid_shape, mosaic_name, parse_mosaic
+from app.streaming.pacing import FramePacer, FrameStats
+from app.streaming.profiles import StreamProfile, resolve_profile, resize_frame
+from app.streaming.roi import CropRegion, parse_crop, resolve_crop, union_box
+from app.streaming.streamer import StreamController, PROBE_INITIAL_DELAY
+from app.streaming.window_finder import WindowFinder, ProcessNameCache
+
+
+class FakeClock:
+    """
+    可手动推进的时钟
+    """
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+
+
+class TestFrameBroadcaster(unittest.TestCase):
+    """
+    帧广播器测试
+    """
+
+    def setUp(self):
+        """
+        测试前的设置
+        """
+        self.produced = 0
+        self.rendered = []
+        self.lock = threading.Lock()
+        self.broadcaster = FrameBroadcaster(self.produce, self.render, name='test.exe', fps=100)
+
+    def tearDown(self):
+        """
+        测试后的清理
+        """
+        self.broadcaster.stop()
+
+    def produce(self) -> int:
+        with self.lock:
+            self.produced += 1
+            return self.produced
+
+    def render(self, frame: int, channel) -> bytes:
+        with self.lock:
+            self.rendered.append((frame, channel))
+        return build_multipart_chunk(f'{channel}:{frame}'.encode())
+
+    def test_clients_share_produced_frames(self):
+        """
+        测试多个客户端共享同一个生产者，每帧只生产一次
+        """
+        streams = [self.broadcaster.subscribe() for _ in range(3)]
+        received = [[next(stream) for _ in range(5)] for stream in streams]
+        self.assertEqual(self.broadcaster.subscriber_count, 3)
+        for chunks in received:
+            self.assertTrue(all(chunk.startswith(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n') for chunk in chunks))
+        # 三个客户端各取5帧，生产次数远小于15次独立捕获
+        self.assertLess(self.produced, 15)
+
+        for stream in streams:
+            stream.close()
+
+    def test_producer_stops_after_last_client(self):
+        """
+        测试最后一个客户端断开后生产者停止，新客户端会重新启动生产者
+        """
+        first = self.broadcaster.subscribe()
+        second = self.broadcaster.subscribe()
+        next(first)
+        next(second)
+
+        first.close()
+        self.assertTrue(self.broadcaster.is_running)
+        second.close()
+        self.assertFalse(self.broadcaster.is_running)
+
+        time.sleep(0.05)
+        produced = self.produced
+        time.sleep(0.05)
+        self.assertEqual(self.produced, produced)
+
+        third = self.broadcaster.subscribe()
+        self.assertTrue(next(third))
+        third.close()
+
+    def test_stop_ends_client_streams(self):
+        """
+        测试停止广播器会结束所有客户端的帧流
+        """
+        stream = self.broadcaster.subscribe()
+        next(stream)
+        self.broadcaster.stop()
+        self.assertEqual(list(stream), [])
+
+    def test_stale_clients_after_stop_do_not_affect_new_stream(self):
+        """
+        测试停止后旧客户端退出不会减少新一轮推流的观看人数与频道计数
+        """
+        old = [self.broadcaster.subscribe() for _ in range(2)]
+        for stream in old:
+            next(stream)
+        self.broadcaster.stop()
+        for stream in old:
+            stream.close()
+        self.assertEqual(self.broadcaster.subscriber_count, 0)
+
+        new = [self.broadcaster.subscribe() for _ in range(2)]
+        for stream in new:
+            next(stream)
+        self.assertEqual(self.broadcaster.subscriber_count, 2)
+        new[0].close()
+        self.assertTrue(self.broadcaster.is_running)
+        self.assertEqual(self.broadcaster.subscriber_count, 1)
+        self.assertEqual(self.broadcaster.channels, [None])
+        self.assertTrue(next(new[1]))
+        new[1].close()
+        self.assertFalse(self.broadcaster.is_running)
+
+    def test_producer_runs_at_highest_requested_fps(self):
+        """
+        测试生产帧率取客户端请求的最大值，客户端断开后回落
+        """
+        slow = self.broadcaster.subscribe(fps=10)
+        next(slow)
+        self.assertEqual(self.broadcaster.target_fps, 10)
+        fast = self.broadcaster.subscribe(fps=50)
+        next(fast)
+        self.assertEqual(self.broadcaster.target_fps, 50)
+        fast.close()
+        self.assertEqual(self.broadcaster.target_fps, 10)
+        slow.close()
+
+    def test_each_channel_rendered_once_per_frame(self):
+        """
+        测试每帧为每个频道只编码一次，客户端只收到自己频道的数据
+        """
+        streams = [self.broadcaster.subscribe(channel='low'), self.broadcaster.subscribe(channel='low'),
+                   self.broadcaster.subscribe(channel='high')]
+        chunks = [next(stream) for stream in streams]
+        self.assertIn(b'low:', chunks[0])
+        self.assertIn(b'high:', chunks[2])
+        self.assertEqual(sorted(self.broadcaster.channels), ['high', 'low'])
+
+        with self.lock:
+            rendered = list(self.rendered)
+        self.assertEqual(len(rendered), len(set(rendered)))
+
+        for stream in streams:
+            stream.close()
+
+    def test_slow_client_drops_stale_frames_and_switches_channel(self):
+        """
+        测试慢客户端直接跳到最新帧，并按频道控制器的结果切换频道
+        """
+        class SwitchToLow:
+            def record(self, write_time: float) -> str:
+                return 'low' if write_time > 0.05 else 'high'
+
+        stream = self.broadcaster.subscribe(channel='high', channel_controller=SwitchToLow())
+        self.assertIn(b'high:', next(stream))
+        time.sleep(0.1)  # 模拟缓慢的套接字写入
+        self.assertIn(b'low:', next(stream))
+
+        client = self.broadcaster.clients()[0]
+        self.assertEqual(client['channel'], 'low')
+        self.assertGreater(client['frames_dropped'], 0)
+        self.assertEqual(self.broadcaster.channels, ['low'])
+        stream.close()
+        self.assertEqual(self.broadcaster.clients(), [])
+
+    def test_low_fps_client_skips_without_dropping(self):
+        """
+        测试低帧率客户端为保持帧率跳过的帧不计为丢帧
+        """
+        stop = threading.Event()
+
+        def consume_fast():
+            fast = self.broadcaster.subscribe(fps=100)
+            for _ in fast:
+                if stop.is_set():
+                    break
+            fast.close()
+
+        thread = threading.Thread(target=consume_fast)
+        thread.start()
+        slow = self.broadcaster.subscribe(fps=10)
+        sequences = [int(next(slow).split(b':')[-1][:-2]) for _ in range(4)]
+        stop.set()
+        thread.join(timeout=5)
+
+        client = self.broadcaster.clients()[0]
+        self.assertEqual(client['fps'], 10)
+        self.assertGreater(sequences[-1] - sequences[0], 3 * 3)
+        self.assertEqual(client['frames_dropped'], 0)
+        slow.close()
+
+    def test_pipelined_encoding_keeps_frame_order(self):
+        """
+        测试流水线模式下多帧并行编码，且按捕获顺序发布
+        """
+        active = []
+        overlaps = []
+        lock = threading.Lock()
+
+        def render(frame: int, channel) -> bytes:
+            with lock:
+                active.append(frame)
+                overlaps.append(len(active))
+            time.sleep(0.03)
+            with lock:
+                active.remove(frame)
+            return build_multipart_chunk(str(frame).encode())
+
+        broadcaster = FrameBroadcaster(self.produce, render, fps=100, encode_workers=3)
+        stream = broadcaster.subscribe()
+        frames = [int(next(stream).split(b'\r\n\r\n')[1][:-2]) for _ in range(8)]
+        stream.close()
+
+        self.assertEqual(frames, sorted(frames))
+        self.assertGreater(max(overlaps), 1)
+
+
+class TestAdaptiveQuality(unittest.TestCase):
+    """
+    自适应画质控制测试
+    """
+
+    def test_degrade_and_recover(self):
+        """
+        测试写入持续超出预算时降级，恢复后逐级回升
+        """
+        base = StreamProfile(quality=80)
+        controller = AdaptiveQualityController(base, frame_budget=0.05, degrade_after=2, recover_after=3)
+        self.assertEqual(controller.record(0.1), base)
+        degraded = controller.record(0.1)
+        self.assertEqual(degraded, StreamProfile(quality=65))
+
+        for _ in range(2):
+            controller.record(0.1)
+        self.assertEqual(controller.profile, StreamProfile(quality=65, scale=0.75))
+
+        for _ in range(3):
+            profile = controller.record(0.01)
+        self.assertEqual(profile, StreamProfile(quality=65))
+        for _ in range(3):
+            profile = controller.record(0.01)
+        self.assertEqual(profile, base)
+
+
+class TestChangeDetection(unittest.TestCase):
+    """
+    画面变化检测测试
+    """
+
+    def test_detector_threshold(self):
+        """
+        测试微小变化被忽略，累积变化超过阈值后被检测到
+        """
+        detector = FrameChangeDetector(threshold=2.0, stride=4)
+        frame = np.zeros((64, 64, 3), dtype=np.uint8)
+        self.assertTrue(detector.has_changed(frame))
+        self.assertFalse(detector.has_changed(frame + 1))
+        self.assertFalse(detector.has_changed(frame + 2))
+        self.assertTrue(detector.has_changed(frame + 3))
+        self.assertTrue(detector.has_changed(np.zeros((32, 32, 3), dtype=np.uint8)))
+        self.assertTrue(FrameChangeDetector(threshold=0).has_changed(frame))
+
+    def test_static_frames_not_reencoded(self):
+        """
+        测试静止画面只在保活间隔到达时重新编码
+        """
+        rendered = []
+        frame = np.zeros((64, 64, 3), dtype=np.uint8)
+
+        def render(value, channel):
+            rendered.append(channel)
+            return build_multipart_chunk(b'static')
+
+        broadcaster = FrameBroadcaster(lambda: frame, render, fps=100, keepalive_interval=0.1,
+                                       change_detector=FrameChangeDetector(threshold=1.0))
+        stream = broadcaster.subscribe()
+        next(stream)
+        time.sleep(0.25)
+        stats = broadcaster.get_stats()
+        stream.close()
+
+        self.assertLessEqual(len(rendered), 4)
+        self.assertGreater(stats['frames_unchanged'], 10)
+
+
+class TestPrivacyMaskEngine(unittest.TestCase):
+    """
+    隐私遮罩引擎测试
+    """
+
+    def test_compiled_slices_are_cached_per_size(self):
+        """
+        测试遮罩按输出尺寸编译一次并缓存，缓存数量有上限
+        """
+        engine = PrivacyMaskEngine()
+        compiled = engine.compile('YuanShen.exe', 1920, 1080)
+        self.assertEqual(compiled[0], (slice(187, 225), slice(111, 292)))
+        self.assertIs(engine.compile('yuanshen.exe', 1920, 1080), compiled)
+        self.assertEqual(engine.compile('bettergi.exe', 1920, 1080), ())
+
+        # 缓存只保留最近使用的组合，最早的尺寸被淘汰后重新编译
+        for width in range(1000, 1000 + MAX_COMPILED_MASKS):
+            engine.compile('yuanshen.exe', width, 1080)
+            engine.compile('yuanshen.exe', 1920, 1080)
+        self.assertEqual(len(engine._compiled), MAX_COMPILED_MASKS)
+        self.assertIs(engine.compile('yuanshen.exe', 1920, 1080), compiled)
+        self.assertNotIn(('bettergi.exe', 1920, 1080, None), engine._compiled)
+
+    def test_configured_regions_for_other_apps(self):
+        """
+        测试通过配置为其他应用添加遮罩并覆盖默认定义
+        """
+        engine = get_mask_engine('{"bettergi.exe": {"base_size": [100, 100], "regions": [[0, 0, 49, 49]]},'
+                                 ' "yuanshen.exe": {"regions": []}}')
+        self.assertFalse(engine.has_masks('yuanshen.exe'))
+
+        img = engine.apply('bettergi.exe', np.full((200, 200, 3), 255, dtype=np.uint8))
+        self.assertEqual(int(img[:99, :99].max()), 0)
+        self.assertEqual(int(img[99:, 99:].min()), 255)
+
+        self.assertTrue(get_mask_engine('not json').has_masks('yuanshen.exe'))
+
+
+class FakeGdi:
+    """
+    记录调用的 user32/gdi32 替身，句柄用递增的整数表示
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._next_handle = 100
+
+    def __getattr__(self, name: str):
+        def call(*args):
+            self.calls.append(name)
+            if name == 'GetDIBits':
+                return args[3]
+            self._next_handle += 1
+            return self._next_handle
+        return call
+
+    def count(self, name: str) -> int:
+        return self.calls.count(name)
+
+
+class TestGdiCaptureSession(unittest.TestCase):
+    """
+    GDI捕获会话测试
+    """
+
+    def test_resources_reused_until_size_changes(self):
+        """
+        测试设备上下文与位图跨帧复用，尺寸变化时先释放旧资源再重建，释放后下一帧重新创建
+        """
+        user32, gdi32 = FakeGdi(), FakeGdi()
+        session = GdiCaptureSession()
+        with patch('app.streaming.capture._load_gdi', return_value=(user32, gdi32)):
+            first = session.grab(42, 64, 32)
+            self.assertIs(session.grab(42, 64, 32), first)
+            self.assertEqual(first.shape, (32, 64, 4))
+            self.assertEqual((session.recreate_count, user32.count('GetWindowDC'), gdi32.count('BitBlt')), (1, 1, 2))
+
+            session.grab(42, 128, 64)
+            self.assertEqual(session.recreate_count, 2)
+            self.assertEqual((user32.count('ReleaseDC'), gdi32.count('DeleteDC'), gdi32.count('DeleteObject')),
+                             (1, 1, 1))
+
+            session.grab(0, 128, 64, desktop=True)
+            self.assertEqual(user32.count('GetDC'), 1)
+
+            session.release()
+            session.release()
+            self.assertEqual(user32.count('ReleaseDC'), 3)
+            session.grab(0, 128, 64, desktop=True)
+            self.assertEqual(session.recreate_count, 4)
+
+
+class TestFrameBufferPool(unittest.TestCase):
+    """
+    帧缓冲池测试
+    """
+
+    def test_buffers_are_reused(self):
+        """
+        测试归还的缓冲区被复用，非本池分配的数组不会被回收
+        """
+        pool = FrameBufferPool(max_per_shape=2)
+        first = pool.acquire((4, 4, 3))
+        pool.release(first)
+        self.assertIs(pool.acquire((4, 4, 3)), first)
+        self.assertIsNot(pool.acquire((4, 4, 3)), first)
+
+        pool.release(np.empty((4, 4, 3), dtype=np.uint8))
+        self.assertEqual(pool.get_stats()['free'], 0)
+
+    def test_steady_state_render_does_not_allocate(self):
+        """
+        测试稳定推流时缩放与遮罩使用池中的缓冲区，不再分配新的大块内存
+        """
+        controller = StreamController('yuanshen.exe', finder=FakeFinder([]), capture=FakeCapture())
+        pool = controller.buffer_pool
+        profile = StreamProfile(max_width=80)
+        for _ in range(5):
+            frame = pool.acquire((90, 160, 3))
+            frame.fill(255)
+            self.assertTrue(controller._render_chunk(frame, profile))
+            pool.release(frame)
+        self.assertEqual(pool.get_stats()['allocated'], 2)
+
+        resized = resize_frame(np.zeros((90, 160, 3), dtype=np.uint8), profile, pool)
+        self.assertEqual(resized.shape, (45, 80, 3))
+
+
+class TestFrameRingBuffer(unittest.TestCase):
+    """
+    推流回放缓冲区测试
+    """
+
+    def test_rate_window_and_budget(self):
+        """
+        测试按保存帧率跳帧，并按时间窗口与内存上限丢弃最早的帧
+        """
+        clock = FakeClock()
+        dvr = FrameRingBuffer(seconds=2, fps=5, max_bytes=1000, clock=clock)
+        saved = 0
+        for _ in range(60):
+            if dvr.due():
+                dvr.add(b'x' * 10)
+                saved += 1
+            clock.now += 1 / 30
+        self.assertEqual(saved, 10)
+        stats = dvr.get_stats()
+        self.assertEqual(stats['frames'], 10)
+        self.assertLessEqual(stats['duration'], 2)
+        self.assertEqual(len(dvr.frames(seconds=0.5)), 3)
+
+        dvr.add(b'x' * 995)
+        self.assertEqual(dvr.get_stats()['frames'], 1)
+
+    def test_export_avi(self):
+        """
+        测试不同尺寸的帧导出为同一尺寸的AVI视频
+        """
+        import cv2
+
+        frames = []
+        for index, size in enumerate([(90, 160), (90, 160), (45, 80)]):
+            _, jpeg = cv2.imencode('.jpg', np.full(size + (3,), 255, dtype=np.uint8))
+            frames.append((index * 0.2, build_multipart_chunk(jpeg.tobytes())))
+        video = export_avi(frames, 5)
+        self.assertEqual(video[:4], b'RIFF')
+        self.assertEqual(export_avi([], 5), b'')
+
+
+class FakeFinder:
+    """
+    按顺序返回预设窗口句柄的窗口查找器
+    """
+
+    def __init__(self, results: list):
+        self.results = list(results)
+        self.calls = 0
+
+    def find(self, process_name: str) -> int:
+        self.calls += 1
+        return self.results.pop(0) if self.results else 0
+
+
+class FakeCapture:
+    """
+    返回固定画面的捕获器
+    """
+
+    def capture(self, hwnd: int, region=None) -> np.ndarray:
+        return np.full((90, 160, 3), 255, dtype=np.uint8)
+
+    def release(self):
+        pass
+
+
+class FakeWindowFinder(WindowFinder):
+    """
+    使用预设窗口列表代替Win32枚举的窗口查找器
+    """
+
+    def __init__(self, windows: list, names: dict, clock: FakeClock):
+        super().__init__(clock=clock)
+        self.windows = windows
+        self.names = names
+        self.invalid = set()
+        self.enumerations = 0
+        self.resolved = []
+        self.process_names = ProcessNameCache(self.resolve, create_time=lambda pid: 1.0, clock=clock)
+
+    def resolve(self, pid: int) -> str:
+        self.resolved.append(pid)
+        return self.names.get(pid)
+
+    def _enumerate_windows(self) -> list:
+        self.enumerations += 1
+        return list(self.windows)
+
+    def _is_window_valid(self, hwnd: int) -> bool:
+        return hwnd not in self.invalid
+
+
+class TestWindowFinder(unittest.TestCase):
+    """
+    窗口注册表与进程名缓存测试
+    """
+
+    def setUp(self):
+        """
+        测试前的设置
+        """
+        self.clock = FakeClock()
+        self.finder = FakeWindowFinder(
+            [(1, 100, 'Genshin'), (2, 200, ''), (3, 300, 'Desktop'), (4, 400, 'BetterGI')],
+            {100: 'yuanshen.exe', 200: 'yuanshen.exe', 300: 'explorer.exe', 400: 'bettergi.exe'},
+            self.clock
+        )
+
+    def test_lookups_read_registry(self):
+        """
+        测试一次枚举之后查找与列举只读取注册表，每个进程只解析一次
+        """
+        self.assertEqual(self.finder.list_programs(), ['bettergi.exe', 'yuanshen.exe'])
+        self.assertEqual(self.finder.find('YuanShen.exe'), 1)
+        self.assertEqual(self.finder.find('bettergi.exe'), 4)
+        self.assertEqual(self.finder.enumerations, 1)
+
+        self.clock.now += 60
+        self.finder.refresh()
+        self.assertEqual(sorted(self.finder.resolved), [100, 200, 300, 400])
+        self.assertEqual(self.finder.process_names.get_stats()['hits'], 4)
+
+    def test_stale_handle_and_miss_trigger_refresh(self):
+        """
+        测试缓存的句柄失效或查找未命中时同步刷新，并受最小刷新间隔限制
+        """
+        self.finder.find('yuanshen.exe')
+        self.finder.invalid.add(1)
+        self.assertEqual(self.finder.find('yuanshen.exe'), 2)
+        self.assertEqual(self.finder.enumerations, 1)
+
+        self.assertEqual(self.finder.find('notepad.exe'), 0)
+        self.assertEqual(self.finder.enumerations, 1)
+        self.clock.now += 2
+        self.finder.windows.append((5, 500, 'Notepad'))
+        self.finder.names[500] = 'notepad.exe'
+        self.assertEqual(self.finder.find('notepad.exe'), 5)
+        self.assertEqual(self.finder.enumerations, 2)
+
+    def test_process_name_cache_keyed_on_create_time(self):
+        """
+        测试PID被复用或缓存过期时重新解析进程名
+        """
+        clock = FakeClock()
+        create_times = {100: 1.0}
+        names = {100: 'yuanshen.exe'}
+        cache = ProcessNameCache(names.get, ttl=10, create_time=create_times.get, clock=clock)
+        self.assertEqual(cache.get(100), 'yuanshen.exe')
+
+        create_times[100], names[100] = 2.0, 'notepad.exe'
+        self.assertEqual(cache.get(100), 'notepad.exe')
+        names[100] = 'other.exe'
+        self.assertEqual(cache.get(100), 'notepad.exe')
+        clock.now += 11
+        self.assertEqual(cache.get(100), 'other.exe')
+        self.assertEqual(cache.get_stats(), {'entries': 1, 'hits': 1, 'misses': 3})
+
+
+class TestPlaceholderMode(unittest.TestCase):
+    """
+    占位模式测试
+    """
+
+    def test_backoff_probe_and_switch_to_live(self):
+        """
+        测试未找到窗口时进入占位模式，按指数退避重新查找，找到后切换为实时画面
+        """
+        finder = FakeFinder([0, 0, 42])
+        controller = StreamController('game.exe', finder=finder, capture=FakeCapture())
+        controller._locate_window()
+        self.assertEqual(controller.mode, 'placeholder')
+
+        # 退避时间未到时不重新查找
+        self.assertIsNone(controller._capture_frame())
+        self.assertEqual(finder.calls, 1)
+
+        controller._next_probe = 0
+        self.assertIsNone(controller._capture_frame())
+        self.assertEqual(controller._probe_delay, PROBE_INITIAL_DELAY * 2)
+
+        controller._next_probe = 0
+        frame = controller._capture_frame()
+        self.assertEqual(controller.mode, 'live')
+        self.assertEqual(controller.hwnd, 42)
+        self.assertEqual(frame.shape, (90, 160, 3))
+
+    def test_placeholder_encoded_once(self):
+        """
+        测试占位画面只编码一次
+        """
+        controller = StreamController('game.exe', finder=FakeFinder([]), capture=FakeCapture())
+        chunk = controller._get_placeholder_chunk()
+        self.assertTrue(chunk.startswith(b'--frame\r\nContent-Type: image/jpeg'))
+        self.assertIs(controller._get_placeholder_chunk(), chunk)
+
+
+class TestReplayCaptureBackend(unittest.TestCase):
+    """
+    回放捕获后端测试
+    """
+
+    def test_synthetic_frames_and_motion(self):
+        """
+        测试合成画面按配置的分辨率与平移量产生，静止画面不会被重复编码
+        """
+        backend = ReplayCaptureBackend(width=320, height=180, motion=8)
+        first, second = backend.capture(1), backend.capture(1)
+        self.assertEqual(first.shape, (180, 320, 3))
+        np.testing.assert_array_equal(second[:, :-8], first[:, 8:])
+
+        detector = FrameChangeDetector(1.0)
+        static = ReplayCaptureBackend(width=320, height=180, motion=0)
+        self.assertTrue(detector.has_changed(static.capture(1)))
+        self.assertFalse(detector.has_changed(static.capture(1)))
+
+        self.assertIsInstance(create_capture_backend('replay', size='640x360'), ReplayCaptureBackend)
+        self.assertIsNone(create_capture_backend('win32'))
+        with self.assertRaises(ValueError):
+            create_capture_backend('dxgi')
+
+    def test_image_directory_through_controller(self):
+        """
+        测试图片目录作为回放来源时，推流控制器端到端完成遮罩与编码
+        """
+        import cv2
+        import tempfile
+
+        with tempfile.TemporaryDirectory() as source:
+            for index in range(2):
+                cv2.imwrite(os.path.join(source, f'{index}.png'), np.full((90, 160, 3), 255 * index, dtype=np.uint8))
+            backend = ReplayCaptureBackend(source, width=3840, height=2160, motion=0)
+            controller = StreamController('yuanshen.exe', backend=backend, encode_workers=0)
+
+            self.assertEqual(controller.capture_window(1).max(), 0)
+            frame = controller.capture_window(1)
+            rendered = controller.render_frame(frame, StreamProfile())
+            # 原神UID区域被遮罩
+            self.assertEqual(rendered[400, 300].tolist(), [0, 0, 0])
+            self.assertEqual(rendered[1000, 1000].tolist(), [255, 255, 255])
+            self.assertTrue(controller.capture_snapshot(StreamProfile(max_width=640)).startswith(b'\xff\xd8'))
+
+
+class TestRegionOfInterest(unittest.TestCase):
+    """
+    推流区域裁剪测试
+    """
+
+    def test_parse_and_union(self):
+        """
+        测试裁剪参数与预设的解析，以及多个裁剪框的合并
+        """
+        self.assertEqual(parse_crop('0.1,0.2,0.3,0.4').to_box(100, 100), (0.1, 0.2, 0.4, 0.6000000000000001))
+        self.assertEqual(parse_crop('960,540,1920,1080').to_box(3840, 2160), (0.25, 0.25, 0.75, 0.75))
+        for invalid in ('1,2,3', 'a,b,c,d', '0.5,0.5,0,0.5', '-1,0,10,10', '1,0.5,0.5,0.5'):
+            with self.assertRaises(ValueError):
+                parse_crop(invalid)
+
+        self.assertEqual(resolve_crop(roi='MiniMap'), CropRegion(0.02, 0.02, 0.12, 0.22))
+        self.assertEqual(resolve_crop(roi='skill', presets_json='{"skill": [0.8, 0.8, 0.2, 0.2]}'),
+                         CropRegion(0.8, 0.8, 0.2, 0.2))
+        self.assertIsNone(resolve_crop())
+        with self.assertRaises(ValueError):
+            resolve_crop(roi='unknown')
+
+        self.assertEqual(union_box([(0.1, 0.5, 0.2, 0.6), (0.3, 0.1, 0.4, 0.2)]), (0.1, 0.1, 0.4, 0.6))
+        self.assertIsNone(union_box([(0.1, 0.5, 0.2, 0.6), None]))
+
+    def test_masks_follow_crop(self):
+        """
+        测试遮罩坐标随裁剪框平移与缩放
+        """
+        engine = get_mask_engine('{"bettergi.exe": {"base_size": [100, 100], "regions": [[50, 50, 59, 59]]}}')
+        img = engine.apply('bettergi.exe', np.full((100, 100, 3), 255, dtype=np.uint8), crop=(0.5, 0.5, 1.0, 1.0))
+        self.assertEqual(int(img[:19, :19].max()), 0)
+        self.assertEqual(int(img[21:, 21:].min()), 255)
+        self.assertEqual(engine.compile('bettergi.exe', 100, 100, (0.0, 0.0, 0.4, 0.4)), ())
+
+    def test_capture_union_region_and_render_channels(self):
+        """
+        测试只捕获所有频道裁剪区域的并集，各频道从中切出自己的区域并正确应用遮罩
+        """
+        backend = ReplayCaptureBackend(width=3840, height=2160, motion=0)
+        full = backend.capture(1)
+        controller = StreamController('yuanshen.exe', backend=backend, encode_workers=0)
+        minimap = replace(StreamProfile(), crop=CropRegion(0.0, 0.0, 0.25, 0.25))
+        pickup = replace(StreamProfile(max_width=480), crop=CropRegion(1920, 1080, 960, 540))
+
+        with patch.object(FrameBroadcaster, 'channels', new_callable=PropertyMock, return_value=[minimap, pickup]):
+            region = controller._capture_region(1)
+        self.assertEqual(region, (0.0, 0.0, 0.75, 0.75))
+        with patch.object(FrameBroadcaster, 'channels', new_callable=PropertyMock,
+                          return_value=[minimap, StreamProfile()]):
+            self.assertIsNone(controller._capture_region(1))
+
+        frame = controller.capture_window(1, region)
+        self.assertEqual(frame.shape, (1620, 2880, 3))
+        rendered = controller.render_frame(frame, minimap)
+        self.assertEqual(rendered.shape, (540, 960, 3))
+        # 原神UID区域位于小地图区域内，仍被遮罩
+        self.assertEqual(rendered[400, 300].tolist(), [0, 0, 0])
+        np.testing.assert_array_equal(rendered[100:300, 600:900], full[100:300, 600:900])
+
+        rendered = controller.render_frame(frame, pickup)
+        self.assertEqual(rendered.shape, (270, 480, 3))
+        controller.buffer_pool.release(rendered)
+        controller._release_frame(frame)
+        self.assertEqual(controller._frame_regions, {})
+
+        snapshot = controller.capture_snapshot(replace(StreamProfile(), crop=CropRegion(0.5, 0.5, 0.5, 0.5)))
+        import cv2
+        self.assertEqual(cv2.imdecode(np.frombuffer(snapshot, np.uint8), cv2.IMREAD_COLOR).shape, (1080, 1920, 3))
+
+
+class TestMosaicCaptureBackend(unittest.TestCase):
+    """
+    拼接捕获后端测试
+    """
+
+    def test_parse_mosaic(self):
+        """
+        测试拼接目标的解析与规范名称
+        """
+        sources, layout = parse_mosaic('YuanShen.exe, bettergi.exe@5', 'ROW')
+        self.assertEqual((sources, layout), ([('yuanshen.exe', 0.0), ('bettergi.exe', 5.0)], 'row'))
+        self.assertEqual(mosaic_name(sources, layout), 'yuanshen.exe,bettergi.exe@5#row')
+        self.assertEqual(parse_mosaic(mosaic_name(sources, layout)), (sources, layout))
+        for invalid in ('yuanshen.exe', 'yuanshen.exe,bettergi', 'a.exe,b.exe@fast', 'a.exe,b.exe#diagonal'):
+            with self.assertRaises(ValueError):
+                parse_mosaic(invalid)
+        self.assertEqual([grid_shape(count, 'grid') for count in (2, 3, 5)], [(1, 2), (2, 2), (2, 3)])
+        self.assertEqual(grid_shape(3, 'column'), (3, 1))
+
+    def test_sources_composed_at_own_rate(self):
+        """
+        测试每个来源按自己的帧率更新画布上的格子，缺失的来源留空，遮罩按来源应用
+        """
+        class MissingBackend(ReplayCaptureBackend):
+            def find(self, target_app: str) -> int:
+                return 0
+
+        clock = FakeClock()
+        first = ReplayCaptureBackend(width=320, height=180, motion=8)
+        second = ReplayCaptureBackend(width=640, height=360, motion=0)
+        mosaic = MosaicCaptureBackend(
+            [('yuanshen.exe', first, 0), ('bettergi.exe', second, 2), ('missing.exe', MissingBackend(), 0)],
+            'row', (160, 90), get_mask_engine('{"bettergi.exe": {"base_size": [100, 100], "regions": [[0, 0, 9, 9]]}}'),
+            clock=clock)
+        self.assertEqual(mosaic.find('mosaic'), 1)
+
+        frame = mosaic.capture(1)
+        self.assertEqual(frame.shape, (90, 480, 3))
+        self.assertEqual(mosaic.source_captures, 2)
+        self.assertEqual(int(frame[:, 320:].max()), 0)
+        self.assertEqual(frame[0, 160].tolist(), [0, 0, 0])
+        self.assertGreater(int(frame[45, 200:300].max()), 0)
+
+        clock.now += 0.1
+        mosaic.capture(1)
+        self.assertEqual(mosaic.source_captures, 3)
+        clock.now += 0.5
+        mosaic.capture(1)
+        self.assertEqual(mosaic.source_captures, 5)
+
+        controller = StreamController('yuanshen.exe,bettergi.exe@2,missing.exe#row', backend=mosaic,
+                                      encode_workers=0)
+        self.assertIs(mosaic.pool, controller.buffer_pool)
+        self.assertTrue(controller.capture_snapshot(StreamProfile()).startswith(b'\xff\xd8'))
+        self.assertEqual(controller.backend.window_size(1), (480, 90))
+
+    def test_snapshot_uses_source_snapshots_without_touching_stream_state(self):
+        """
+        测试拼接快照通过各来源的 snapshot 拼接到独立画布，不影响推流中的画布与捕获状态
+        """
+        class RecordingBackend(ReplayCaptureBackend):
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)
+                self.captures = 0
+                self.snapshots = 0
+
+            def capture(self, hwnd, region=None):
+                self.captures += 1
+                return super().capture(hwnd, region)
+
+            def snapshot(self, hwnd, region=None):
+                self.snapshots += 1
+                return super().capture(hwnd, region)
+
+        clock = FakeClock()
+        first, second = RecordingBackend(width=320, height=180), RecordingBackend(width=320, height=180)
+        mosaic = MosaicCaptureBackend([('yuanshen.exe', first, 0), ('bettergi.exe', second, 0)], 'row',
+                                      (160, 90), clock=clock)
+        mosaic.find('mosaic')
+        mosaic.capture(1)
+        canvas = mosaic.canvas.copy()
+        states = [(source.hwnd, source.last_capture, source.next_probe, source.placement)
+                  for source in mosaic.sources]
+
+        clock.now += 1
+        frame = mosaic.snapshot(1)
+        self.assertEqual(frame.shape, (90, 320, 3))
+        self.assertGreater(int(frame.max()), 0)
+        self.assertEqual((first.captures, first.snapshots, second.captures, second.snapshots), (1, 1, 1, 1))
+        self.assertEqual(mosaic.source_captures, 2)
+        self.assertTrue(np.array_equal(mosaic.canvas, canvas))
+        self.assertEqual([(source.hwnd, source.last_capture, source.next_probe, source.placement)
+                          for source in mosaic.sources], states)
+
+
+class TestFramePacing(unittest.TestCase):
+    """
+    帧节奏控制与统计测试
+    """
+
+    def test_pacer_sleeps_only_remaining_budget(self):
+        """
+        测试只睡眠剩余的帧预算
+        """
+        clock = FakeClock()
+        pacer = FramePacer(10, clock=clock, sleep=clock.sleep)
+        pacer.reset()
+        clock.now += 0.03  # 本帧耗时30ms
+        self.assertEqual(pacer.wait(), 0)
+        self.assertEqual(clock.sleeps, [0.07])
+
+    def test_pacer_skips_frames_when_behind(self):
+        """
+        测试落后时不睡眠并跳过错过的帧位，之后重新对齐
+        """
+        clock = FakeClock()
+        pacer = FramePacer(10, clock=clock, sleep=clock.sleep)
+        pacer.reset()
+        clock.now += 0.25  # 本帧耗时250ms，错过了第1、2个帧位
+        self.assertEqual(pacer.wait(), 1)
+        self.assertEqual(clock.sleeps, [])
+        clock.now += 0.01
+        self.assertEqual(pacer.wait(), 0)
+        self.assertEqual(clock.sleeps, [0.04])
+
+    def test_stats_snapshot(self):
+        """
+        测试帧率与单帧耗时百分位统计
+        """
+        clock = FakeClock()
+        stats = FrameStats(clock=clock)
+        for index in range(11):
+            stats.record(0.01 * (index + 1))
+            clock.now += 0.1
+        stats.record_skipped(2)
+
+        snapshot = stats.snapshot()
+        self.assertAlmostEqual(snapshot['achieved_fps'], 10.0)
+        self.assertAlmostEqual(snapshot['frame_time_ms']['p50'], 60.0)
+        self.assertEqual(snapshot['frames_sent'], 11)
+        self.assertEqual(snapshot['frames_skipped'], 2)
+
+    def test_stage_and_throughput_telemetry(self):
+        """
+        测试捕获与编码耗时、平均编码大小、发送速率与丢帧统计
+        """
+        clock = FakeClock()
+        stats = FrameStats(clock=clock, rate_window=3)
+        for index in range(4):
+            stats.record_capture(0.002)
+            stats.record_encode(0.01, 1000 * (index + 1))
+            stats.record_sent_bytes(500)
+            stats.record_sent_bytes(500)
+            clock.now += 1
+        stats.record_dropped(3)
+        stats.record_dropped(0)
+
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['capture_time_ms']['p50'], 2.0)
+        self.assertEqual(snapshot['encode_time_ms']['p99'], 10.0)
+        self.assertEqual(snapshot['avg_jpeg_bytes'], 2500)
+        self.assertEqual(snapshot['bytes_per_second'], 1000)
+        self.assertEqual(snapshot['frames_dropped'], 3)
+
+
+    def test_stream_info_counts_only_due_frames_as_dropped(self):
+        """
+        测试推流信息中的丢帧数不包含低帧率客户端有意跳过的帧
+        """
+        controller = StreamController('yuanshen.exe', backend=ReplayCaptureBackend(width=160, height=90),
+                                      encode_workers=0, change_threshold=0)
+        stop = threading.Event()
+
+        def consume_fast():
+            fast = controller.generate_frames(fps=60, adaptive=False)
+            for _ in fast:
+                if stop.is_set():
+                    break
+            fast.close()
+
+        thread = threading.Thread(target=consume_fast)
+        thread.start()
+        slow = controller.generate_frames(fps=5, adaptive=False)
+        for _ in range(3):
+            next(slow)
+        info = controller.get_stream_info()
+        stop.set()
+        thread.join(timeout=5)
+        slow.close()
+        controller.stop_stream()
+
+        clients = {client['fps']: client for client in info['clients']}
+        self.assertEqual(clients[5]['frames_sent'], 3)
+        self.assertEqual(clients[5]['frames_dropped'], 0)
+        self.assertGreater(info['frames_sent'], 3 * 5)
+        self.assertEqual(info['frames_dropped'], clients[60]['frames_dropped'])
+
+
+class TestStreamProfile(unittest.TestCase):
+    """
+    画质配置测试
+    """
+
+    def test_target_size_keeps_aspect_ratio(self):
+        """
+        测试按比例缩小且不放大画面
+        """
+        profile = StreamProfile(max_width=1280, max_height=720)
+        self.assertEqual(profile.target_size(3840, 2160), (1280, 720))
+        self.assertEqual(profile.target_size(1000, 1000), (720, 720))
+        self.assertEqual(profile.target_size(640, 480), (640, 480))
+        self.assertEqual(StreamProfile().target_size(3840, 2160), (3840, 2160))
+
+    def test_resolve_profile(self):
+        """
+        测试预设与显式参数的解析
+        """
+        self.assertEqual(resolve_profile(), StreamProfile())
+        self.assertEqual(resolve_profile('low', quality='90'), StreamProfile(854, 480, 90))
+        self.assertEqual(resolve_profile(None, max_width='640'), StreamProfile(640, 0, 80))
+        with self.assertRaises(ValueError):
+            resolve_profile('ultra')
+        with self.assertRaises(ValueError):
+            resolve_profile(quality='0')
+        with self.assertRaises(ValueError):
+            resolve_profile(max_width='wide')
+
+    def test_codecs(self):
+        """
+        测试编码格式的预设质量，以及同一帧按编码格式分别编码并标注对应的MIME类型
+        """
+        self.assertEqual(resolve_profile('medium', codec='WebP'), StreamProfile(1280, 720, 60, codec='webp'))
+        self.assertEqual(resolve_profile(codec='webp', quality='90').quality, 90)
+        with self.assertRaises(ValueError):
+            resolve_profile(codec='avif')
+
+        controller = StreamController('yuanshen.exe', backend=ReplayCaptureBackend(width=320, height=180),
+                                      encode_workers=0)
+        frame = controller.capture_window(1)
+        webp = controller._render_chunk(frame, resolve_profile(codec='webp'))
+        self.assertIn(b'Content-Type: image/webp', webp)
+        self.assertEqual(parse_multipart_chunk(webp)[8:12], b'WEBP')
+        jpeg = controller._render_chunk(frame, resolve_profile())
+        self.assertTrue(parse_multipart_chunk(jpeg).startswith(b'\xff\xd8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
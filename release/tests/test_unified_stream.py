@@ -1,203 +1,366 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
 """
-统一StreamController管理器测试脚本
-测试优化后的StreamController管理方案的功能性和性能
+推流控制器注册表测试模块
+测试按目标应用管理推流控制器的引用计数与生命周期
 """
-
-import sys
+import json
 import os
-import time
-import psutil
-import gc
+import threading
+import unittest
+from unittest.mock import patch
 
-# 添加项目路径到sys.path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from flask import Response
 
-from app.api.views import stream_manager
+from app import create_app
+from app.streaming.profiles import StreamProfile
+from app.streaming.registry import StreamRegistry
+from app.streaming.roi import CropRegion, DEFAULT_ROI_PRESETS
+from app.streaming.snapshot import SnapshotService
+from app.streaming.dvr import FrameRingBuffer
 
-def test_singleton_pattern():
-    """
-    测试单例模式是否正常工作
-    """
-    print("=" * 50)
-    print("测试1: 单例模式验证")
-    print("=" * 50)
-    
-    # 获取两个管理器实例
-    manager1 = stream_manager
-    from app.api.views import StreamControllerManager
-    manager2 = StreamControllerManager()
-    
-    # 验证是否为同一个实例
-    is_singleton = manager1 is manager2
-    print(f"单例模式验证: {'通过' if is_singleton else '失败'}")
-    print(f"manager1 id: {id(manager1)}")
-    print(f"manager2 id: {id(manager2)}")
-    
-    return is_singleton
-
-def test_controller_reuse():
-    """
-    测试控制器实例复用功能
-    """
-    print("\n" + "=" * 50)
-    print("测试2: 控制器实例复用")
-    print("=" * 50)
-    
-    # 获取同一个target_app的控制器两次
-    controller1 = stream_manager.get_controller("yuanshen.exe")
-    controller2 = stream_manager.get_controller("yuanshen.exe")
-    
-    # 验证是否为同一个实例
-    is_reused = controller1 is controller2
-    print(f"实例复用验证: {'通过' if is_reused else '失败'}")
-    print(f"controller1 id: {id(controller1)}")
-    print(f"controller2 id: {id(controller2)}")
-    print(f"target_app: {controller1.target_app}")
-    
-    # 获取不同target_app的控制器
-    controller3 = stream_manager.get_controller("bettergi.exe")
-    is_different = controller1 is not controller3
-    print(f"不同应用实例分离: {'通过' if is_different else '失败'}")
-    print(f"controller3 id: {id(controller3)}")
-    print(f"controller3 target_app: {controller3.target_app}")
-    
-    return is_reused and is_different
-
-def test_programs_list():
+
+class FakeStreamController:
     """
-    测试程序列表获取功能
+    不依赖Win32的推流控制器替身
     """
-    print("\n" + "=" * 50)
-    print("测试3: 程序列表获取")
-    print("=" * 50)
-    
-    try:
-        programs = stream_manager.get_programs_list()
-        print(f"获取到程序列表: {programs}")
-        print(f"程序数量: {len(programs)}")
-        
-        # 验证是否包含预期的程序
-        expected_programs = ['yuanshen.exe', 'bettergi.exe', '桌面.exe']
-        has_expected = all(prog in programs for prog in expected_programs)
-        print(f"包含预期程序: {'通过' if has_expected else '失败'}")
-        
-        return len(programs) > 0 and has_expected
-    except Exception as e:
-        print(f"获取程序列表失败: {e}")
-        return False
-
-def test_memory_usage():
+
+    def __init__(self, target_app: str, **options):
+        self.target_app = target_app
+        self.options = options
+        self.stopped = False
+        self.requested_fps = []
+        self.profiles = []
+        self.streaming = False
+        self.snapshots = []
+        self.dvr = None
+        self.released = 0
+
+    @property
+    def is_streaming(self) -> bool:
+        return self.streaming and not self.stopped
+
+    def start_stream(self, fps: float = None, profile=None, adaptive: bool = True) -> Response:
+        self.requested_fps.append(fps)
+        self.profiles.append(profile)
+        return Response(iter([b'frame']), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+    def stop_stream(self):
+        self.stopped = True
+
+    def latest_frame(self, profile=None) -> bytes:
+        return b'latest'
+
+    def capture_snapshot(self, profile=None) -> bytes:
+        self.snapshots.append(profile)
+        return b'captured' if self.target_app != 'missing.exe' else None
+
+    def release_capture(self):
+        self.released += 1
+
+    def get_stream_info(self) -> dict:
+        return {'target_app': self.target_app, 'is_streaming': not self.stopped}
+
+
+class TestStreamRegistry(unittest.TestCase):
     """
-    测试内存使用情况
+    推流控制器注册表测试
     """
-    print("\n" + "=" * 50)
-    print("测试4: 内存使用优化")
-    print("=" * 50)
-    
-    # 记录初始内存
-    process = psutil.Process()
-    initial_memory = process.memory_info().rss / 1024 / 1024  # MB
-    print(f"初始内存使用: {initial_memory:.2f} MB")
-    
-    # 创建多个控制器实例（应该复用）
-    controllers = []
-    for i in range(10):
-        controller = stream_manager.get_controller("yuanshen.exe")
-        controllers.append(controller)
-    
-    # 记录创建后内存
-    after_creation_memory = process.memory_info().rss / 1024 / 1024  # MB
-    print(f"创建10个控制器后内存: {after_creation_memory:.2f} MB")
-    
-    # 验证所有控制器都是同一个实例
-    all_same = all(c is controllers[0] for c in controllers)
-    print(f"所有控制器实例相同: {'通过' if all_same else '失败'}")
-    
-    # 清理
-    del controllers
-    gc.collect()
-    
-    # 记录清理后内存
-    final_memory = process.memory_info().rss / 1024 / 1024  # MB
-    print(f"清理后内存使用: {final_memory:.2f} MB")
-    
-    memory_increase = after_creation_memory - initial_memory
-    print(f"内存增长: {memory_increase:.2f} MB")
-    
-    # 内存增长应该很小（因为实例复用）
-    memory_efficient = memory_increase < 50  # 小于50MB认为是高效的
-    print(f"内存使用高效: {'通过' if memory_efficient else '失败'}")
-    
-    return all_same and memory_efficient
-
-def test_cleanup_functionality():
+
+    def setUp(self):
+        """
+        测试前的设置
+        """
+        self.registry = StreamRegistry(factory=FakeStreamController)
+
+    def test_controller_reuse_per_app(self):
+        """
+        测试同一目标应用复用控制器，不同目标应用互相独立
+        """
+        backends = []
+        first = self.registry.acquire('yuanshen.exe', backend_factory=lambda: backends.append('yuanshen') or 'backend')
+        second = self.registry.acquire('YuanShen.exe', backend_factory=lambda: backends.append('again'))
+        other = self.registry.acquire('bettergi.exe')
+
+        self.assertIs(first, second)
+        # 捕获后端只在新建控制器时创建
+        self.assertEqual(backends, ['yuanshen'])
+        self.assertEqual(first.options['backend'], 'backend')
+        self.assertIsNot(first, other)
+        self.assertEqual(self.registry.refcount('yuanshen.exe'), 2)
+        self.assertEqual(len(self.registry.controllers()), 2)
+
+    def test_release_removes_controller_after_last_reference(self):
+        """
+        测试最后一个引用释放后控制器被停止并移除，其他目标不受影响
+        """
+        controller = self.registry.acquire('yuanshen.exe')
+        self.registry.acquire('yuanshen.exe')
+        other = self.registry.acquire('bettergi.exe')
+
+        self.registry.release('yuanshen.exe')
+        self.assertIs(self.registry.get('yuanshen.exe'), controller)
+        self.assertFalse(controller.stopped)
+
+        self.registry.release('yuanshen.exe')
+        self.assertIsNone(self.registry.get('yuanshen.exe'))
+        self.assertTrue(controller.stopped)
+        self.assertFalse(other.stopped)
+
+    def test_stale_release_after_stop_all(self):
+        """
+        测试 stop_all 之后旧连接的释放不会影响新建的控制器
+        """
+        old = self.registry.acquire('yuanshen.exe')
+        self.assertEqual(self.registry.stop_all(), ['yuanshen.exe'])
+        self.assertTrue(old.stopped)
+
+        new = self.registry.acquire('yuanshen.exe')
+        self.registry.release('yuanshen.exe', old)
+        self.assertIs(self.registry.get('yuanshen.exe'), new)
+        self.assertEqual(self.registry.refcount('yuanshen.exe'), 1)
+
+    def test_replay_buffer_retained_after_last_release(self):
+        """
+        测试最后一个引用释放后回放缓冲区在保留期内仍可获取，过期或新建控制器后不再保留
+        """
+        now = [0.0]
+        registry = StreamRegistry(factory=FakeStreamController, dvr_grace=30, clock=lambda: now[0])
+        controller = registry.acquire('yuanshen.exe')
+        controller.dvr = FrameRingBuffer(seconds=30, fps=5)
+        self.assertIs(registry.replay_buffer('yuanshen.exe'), controller.dvr)
+
+        registry.release('yuanshen.exe')
+        self.assertIsNone(registry.get('yuanshen.exe'))
+        now[0] = 29
+        self.assertIs(registry.replay_buffer('YuanShen.exe'), controller.dvr)
+        now[0] = 30
+        self.assertIsNone(registry.replay_buffer('yuanshen.exe'))
+
+        registry.acquire('yuanshen.exe').dvr = controller.dvr
+        registry.release('yuanshen.exe')
+        new = registry.acquire('yuanshen.exe')
+        self.assertIsNone(registry.replay_buffer('yuanshen.exe'))
+        registry.release('yuanshen.exe', new)
+
+        registry.dvr_grace = 0
+        registry.acquire('yuanshen.exe').dvr = controller.dvr
+        registry.release('yuanshen.exe')
+        self.assertIsNone(registry.replay_buffer('yuanshen.exe'))
+
+
+class TestSnapshotService(unittest.TestCase):
     """
-    测试清理功能
+    单帧快照服务测试
     """
-    print("\n" + "=" * 50)
-    print("测试5: 清理功能")
-    print("=" * 50)
-    
-    # 创建几个控制器
-    controller1 = stream_manager.get_controller("yuanshen.exe")
-    controller2 = stream_manager.get_controller("bettergi.exe")
-    
-    print(f"创建前控制器数量: {len(stream_manager._controllers)}")
-    
-    # 停止特定控制器
-    stream_manager.stop_controller("yuanshen.exe")
-    print(f"停止yuanshen.exe后控制器数量: {len(stream_manager._controllers)}")
-    
-    # 清理所有控制器
-    stream_manager.cleanup_all()
-    print(f"清理所有后控制器数量: {len(stream_manager._controllers)}")
-    
-    cleanup_success = len(stream_manager._controllers) == 0
-    print(f"清理功能: {'通过' if cleanup_success else '失败'}")
-    
-    return cleanup_success
-
-def main():
+
+    def test_capture_of_one_app_does_not_block_others(self):
+        """
+        测试某个目标应用的一次性捕获进行中时，其他目标应用的缓存命中与捕获不需要等待
+        """
+        started, finish = threading.Event(), threading.Event()
+
+        class SlowController(FakeStreamController):
+            def capture_snapshot(self, profile=None) -> bytes:
+                if self.target_app == 'slow.exe':
+                    started.set()
+                    finish.wait(5)
+                return super().capture_snapshot(profile)
+
+        service = SnapshotService(lambda target_app: None, factory=SlowController, ttl=60)
+        self.assertEqual(service.get('cached.exe'), b'captured')
+
+        results = []
+        slow = threading.Thread(target=lambda: results.append(service.get('slow.exe')))
+        waiting = threading.Thread(target=lambda: results.append(service.get('slow.exe')))
+        slow.start()
+        self.assertTrue(started.wait(5))
+        waiting.start()
+        try:
+            self.assertEqual(service.get('cached.exe'), b'captured')
+            self.assertEqual(service.get('other.exe'), b'captured')
+            self.assertEqual(service.captures, 2)
+        finally:
+            finish.set()
+            slow.join(5)
+            waiting.join(5)
+        # 同一目标应用的并发请求只触发一次捕获
+        self.assertEqual(results, [b'captured', b'captured'])
+        self.assertEqual(service.captures, 3)
+
+
+class TestStreamAPI(unittest.TestCase):
     """
-    主测试函数
+    推流API测试
     """
-    print("开始测试统一StreamController管理器...")
-    print(f"测试时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    # 执行所有测试
-    test_results = []
-    
-    test_results.append(("单例模式", test_singleton_pattern()))
-    test_results.append(("控制器复用", test_controller_reuse()))
-    test_results.append(("程序列表", test_programs_list()))
-    test_results.append(("内存优化", test_memory_usage()))
-    test_results.append(("清理功能", test_cleanup_functionality()))
-    
-    # 输出测试结果汇总
-    print("\n" + "=" * 50)
-    print("测试结果汇总")
-    print("=" * 50)
-    
-    passed_tests = 0
-    total_tests = len(test_results)
-    
-    for test_name, result in test_results:
-        status = "通过" if result else "失败"
-        print(f"{test_name}: {status}")
-        if result:
-            passed_tests += 1
-    
-    print(f"\n总体结果: {passed_tests}/{total_tests} 测试通过")
-    
-    if passed_tests == total_tests:
-        print("✅ 所有测试通过！StreamController管理器优化成功！")
-    else:
-        print("❌ 部分测试失败，需要进一步优化")
-    
-    return passed_tests == total_tests
-
-if __name__ == "__main__":
-    success = main()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+
+    def setUp(self):
+        """
+        测试前的设置
+        """
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+        self.created = []
+        self.registry = StreamRegistry(factory=self.create_controller)
+        patcher = patch('app.api.views.stream_registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.snapshot_service = SnapshotService(self.registry.get, factory=self.create_controller, ttl=60)
+        patcher = patch('app.api.views.snapshot_service', self.snapshot_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_controller(self, target_app: str, **options) -> FakeStreamController:
+        controller = FakeStreamController(target_app, **options)
+        self.created.append(controller)
+        return controller
+
+    def test_concurrent_streams_and_per_app_endpoints(self):
+        """
+        测试不同目标应用同时推流，信息与停止接口按目标应用生效
+        """
+        first = self.client.get('/api/stream?app=yuanshen.exe')
+        second = self.client.get('/api/stream?app=bettergi.exe')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+
+        data = json.loads(self.client.get('/api/stream/info').data)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(json.loads(self.client.get('/api/stream/info?app=bettergi.exe').data)['target_app'],
+                         'bettergi.exe')
+        self.assertEqual(self.client.get('/api/stream/info?app=desktop.exe').status_code, 404)
+
+        response = self.client.post('/api/stream/stop', json={'app': 'yuanshen.exe'})
+        self.assertEqual(json.loads(response.data)['stopped'], ['yuanshen.exe'])
+        self.assertFalse(self.registry.get('bettergi.exe').stopped)
+
+        # 连接关闭后释放引用
+        first.close()
+        second.close()
+        self.assertEqual(self.registry.controllers(), [])
+
+    def test_fps_parameter(self):
+        """
+        测试帧率参数的默认值、上限与校验
+        """
+        self.app.config['STREAM_MAX_FPS'] = 60
+        self.app.config['STREAM_DEFAULT_FPS'] = 30
+        self.client.get('/api/stream?app=yuanshen.exe').close()
+        self.client.get('/api/stream?app=yuanshen.exe&fps=240').close()
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe&fps=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe&fps=0').status_code, 400)
+
+        self.assertEqual([controller.requested_fps for controller in self.created], [[30], [60]])
+
+    def test_profile_parameters(self):
+        """
+        测试画质参数传递给控制器，无效参数返回400
+        """
+        self.client.get('/api/stream?app=yuanshen.exe&preset=medium&quality=50').close()
+        self.assertEqual(self.created[0].profiles, [StreamProfile(1280, 720, 50)])
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe&preset=ultra').status_code, 400)
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe&quality=101').status_code, 400)
+
+    def test_crop_parameters(self):
+        """
+        测试裁剪参数与预设名称附加到画质配置，无效参数返回400
+        """
+        self.client.get('/api/stream?app=yuanshen.exe&preset=low&crop=0,0,0.5,0.5').close()
+        self.client.get('/api/stream?app=yuanshen.exe&roi=minimap').close()
+        self.assertEqual([controller.profiles for controller in self.created],
+                         [[StreamProfile(854, 480, 60, crop=CropRegion(0, 0, 0.5, 0.5))],
+                          [StreamProfile(crop=DEFAULT_ROI_PRESETS['minimap'])]])
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe&crop=0,0,1').status_code, 400)
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe&roi=unknown').status_code, 400)
+
+        self.client.get('/api/stream/snapshot?app=yuanshen.exe&roi=pickup')
+        self.assertEqual(self.created[-1].snapshots, [StreamProfile(crop=DEFAULT_ROI_PRESETS['pickup'])])
+
+    def test_mosaic_parameters(self):
+        """
+        测试多个应用程序按规范名称共用一路拼接推流，无效参数返回400
+        """
+        self.app.config['STREAM_CAPTURE_BACKEND'] = 'replay'
+        first = self.client.get('/api/stream?app=yuanshen.exe,BetterGI.exe&layout=row')
+        second = self.client.get('/api/stream?app=yuanshen.exe,bettergi.exe%23row')
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(self.created[0].target_app, 'yuanshen.exe,bettergi.exe#row')
+        self.assertEqual(self.created[0].options['backend'].layout, 'row')
+        self.assertEqual(self.client.get('/api/stream/info?app=yuanshen.exe,bettergi.exe&layout=row').status_code, 200)
+        first.close()
+        second.close()
+
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe,bettergi').status_code, 400)
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe,bettergi.exe&layout=diagonal').status_code, 400)
+
+    def test_snapshot_endpoint(self):
+        """
+        测试快照优先使用推流中的最新帧，没有推流时一次性捕获并短时缓存
+        """
+        for _ in range(3):
+            response = self.client.get('/api/stream/snapshot?app=yuanshen.exe&preset=low')
+            self.assertEqual(response.mimetype, 'image/jpeg')
+            self.assertEqual(response.data, b'captured')
+        self.assertEqual(self.snapshot_service.captures, 1)
+        self.assertEqual(self.created[0].snapshots, [StreamProfile(854, 480, 60)])
+        self.assertEqual(self.created[0].released, 1)
+
+        stream = self.client.get('/api/stream?app=yuanshen.exe')
+        self.registry.get('yuanshen.exe').streaming = True
+        self.assertEqual(self.client.get('/api/stream/snapshot?app=yuanshen.exe').data, b'latest')
+        self.assertEqual(self.registry.get('yuanshen.exe').released, 0)
+        stream.close()
+
+        self.assertEqual(self.client.get('/api/stream/snapshot?app=missing.exe').status_code, 404)
+        self.assertEqual(self.client.get('/api/stream/snapshot?app=yuanshen').status_code, 400)
+        self.assertEqual(self.client.get('/api/stream/snapshot?app=yuanshen.exe&quality=0').status_code, 400)
+
+        response = self.client.get('/api/stream/snapshot?app=yuanshen.exe&codec=webp')
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertEqual(self.created[-1].snapshots[-1], StreamProfile(quality=75, codec='webp'))
+        self.assertEqual(self.client.get('/api/stream?app=yuanshen.exe&codec=gif').status_code, 400)
+
+    def test_snapshot_ttl_read_once_from_config(self):
+        """
+        测试快照缓存时间在注册蓝图时从配置读取，请求过程中不再修改
+        """
+        from app.api import views
+
+        with patch.dict(os.environ, {'STREAM_SNAPSHOT_TTL': '7'}):
+            create_app()
+        self.assertEqual(views.snapshot_service.ttl, 7)
+
+    def test_replay_endpoint(self):
+        """
+        测试回放缓冲区中的画面以MJPEG回放或AVI下载
+        """
+        import cv2
+        import numpy as np
+        from app.streaming.broadcaster import build_multipart_chunk
+
+        stream = self.client.get('/api/stream?app=yuanshen.exe')
+        self.assertEqual(self.client.get('/api/stream/replay?app=yuanshen.exe').status_code, 404)
+
+        _, jpeg = cv2.imencode('.jpg', np.zeros((90, 160, 3), dtype=np.uint8))
+        dvr = FrameRingBuffer(seconds=30, fps=1000)
+        for _ in range(3):
+            dvr.add(build_multipart_chunk(jpeg.tobytes()))
+        self.registry.get('yuanshen.exe').dvr = dvr
+
+        replay = self.client.get('/api/stream/replay?app=yuanshen.exe')
+        self.assertEqual(replay.mimetype, 'multipart/x-mixed-replace')
+        self.assertEqual(replay.data.count(b'--frame'), 3)
+        video = self.client.get('/api/stream/replay?app=yuanshen.exe&format=avi&seconds=10')
+        self.assertEqual(video.mimetype, 'video/x-msvideo')
+        self.assertEqual(video.data[:4], b'RIFF')
+        self.assertEqual(self.client.get('/api/stream/replay?app=yuanshen.exe&format=gif').status_code, 400)
+        stream.close()
+
+        # 最后一个观看者离开后，回放缓冲区在保留期内仍可回放
+        self.assertIsNone(self.registry.get('yuanshen.exe'))
+        replay = self.client.get('/api/stream/replay?app=yuanshen.exe')
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.data.count(b'--frame'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()